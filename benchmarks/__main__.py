@@ -0,0 +1,159 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark the hot paths of the router log preprocessor.
+
+Run from the root of the repository:
+
+    python -m benchmarks [--lines 20000] [--save] [--tolerance 0.25]
+
+The benchmarks run on a synthetic corpus of logs from a fleet of routers. The results
+are compared with the stored baseline, and the exit status is 1 if a benchmark regressed
+more than the tolerance. The baseline is machine specific, so store a new baseline with
+--save before comparing on another machine.
+"""
+import argparse
+import logging
+import pathlib
+import sys
+import typing
+
+import benchmarks.harness as harness
+import router_log_preprocessor.domain as domain
+import router_log_preprocessor.hooks.zabbix
+import router_log_preprocessor.hooks.zabbix._mapper as mapper
+import router_log_preprocessor.log_server.handler
+import router_log_preprocessor.preprocessors.dnsmasq_dhcp as dnsmasq_dhcp
+import router_log_preprocessor.preprocessors.wlc as wlc
+import router_log_preprocessor.settings
+import router_log_preprocessor.util.logging as rlp_logging
+import router_log_preprocessor.util.rfc3164_parser as rfc3164_parser
+import router_log_preprocessor.util.synthetic as synthetic
+
+_BASELINE = pathlib.Path(__file__).parent / "baseline.json"
+# Number of datagrams in the batches of the batch handler benchmark
+_BATCH_SIZE = 64
+
+
+def _log_handler() -> router_log_preprocessor.log_server.handler.LogHandler:
+    # The hook sends to a dry run sender, so its background tasks are measured without
+    # the network
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        router_log_preprocessor.hooks.zabbix.DryRunSender(),
+        client_discovery_wait_time=0,
+        measurement_bundle_wait_time=0,
+    )
+    return router_log_preprocessor.log_server.handler.LogHandler(
+        {
+            "wlceventd": wlc.preprocess_wireless_lan_controller_event,
+            "dnsmasq-dhcp": dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event,
+        },
+        [trapper],
+        router_log_preprocessor.settings.settings().log_server_parser,
+        echo=False,
+    )
+
+
+def run(lines: int) -> typing.List[harness.Result]:
+    """Run every benchmark.
+
+    :param lines: The number of lines in the synthetic corpus.
+    :return: The results.
+    """
+    packets = synthetic.RouterFleet(routers=3, clients=300, seed=42).corpus(lines)
+    entries = [packet.decode("ascii") for packet in packets]
+    records = [rfc3164_parser.parse(entry) for entry in entries]
+    wlc_records = [record for record in records if record.process == "wlceventd"]
+    dhcp_records = [record for record in records if record.process == "dnsmasq-dhcp"]
+    messages: typing.List[typing.Tuple[domain.LogRecord, domain.Message]] = [
+        (record, wlc.preprocess_wireless_lan_controller_event(record))
+        for record in wlc_records
+    ]
+    for record in dhcp_records:
+        message = dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event(record)
+        if message is not None:
+            messages.append((record, message))
+
+    batches = [
+        [(packet, "127.0.0.1", 514) for packet in packets[index : index + _BATCH_SIZE]]
+        for index in range(0, len(packets), _BATCH_SIZE)
+    ]
+
+    # Every benchmark of the handler gets its own started hooks, so neither the
+    # measurements queued by the hooks nor the known clients carry over
+    log_handler = _log_handler()
+    batch_log_handler = _log_handler()
+    return [
+        harness.measure("parse", rfc3164_parser.parse, entries),
+        harness.measure("parse_bytes", rfc3164_parser.parse_bytes, packets),
+        harness.measure(
+            "preprocess_wlc", wlc.preprocess_wireless_lan_controller_event, wlc_records
+        ),
+        harness.measure(
+            "preprocess_dnsmasq_dhcp",
+            dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event,
+            dhcp_records,
+        ),
+        harness.measure(
+            "map_client_message",
+            lambda item: list(mapper.map_client_message(*item)),
+            messages,
+        ),
+        harness.measure_async(
+            "handler",
+            lambda packet: log_handler.handle(packet, "127.0.0.1", 514),
+            packets,
+            start=log_handler.start,
+        ),
+        harness.measure_async(
+            "handler_batch",
+            batch_log_handler.handle_batch,
+            batches,
+            lines=len(packets),
+            start=batch_log_handler.start,
+        ),
+    ]
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--baseline", type=pathlib.Path, default=_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--save", action="store_true", help="Store the results as the new baseline."
+    )
+    arguments = parser.parse_args(argv)
+
+    # Keep the application log from measuring the log writer instead
+    rlp_logging.logger.setLevel(logging.WARNING)
+
+    results = run(arguments.lines)
+    for result in results:
+        print(result)
+
+    if arguments.save:
+        harness.save_baseline(arguments.baseline, results)
+        print(f"Saved the baseline to {arguments.baseline}")
+        return 0
+
+    found = harness.regressions(
+        results, harness.load_baseline(arguments.baseline), arguments.tolerance
+    )
+    for regression in found:
+        print(f"Regression: {regression}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Measurement of throughput, latency and memory of a function over a corpus."""
+import dataclasses
+import json
+import pathlib
+import statistics
+import time
+import tracemalloc
+import typing
+
+import anyio
+import anyio.abc
+
+_Item = typing.TypeVar("_Item")
+
+# Number of items processed before measuring, e.g. to warm up caches
+_WARMUP = 1000
+# Throughput and latency are measured this many times, keeping the best round to
+# reduce the noise of other processes on the machine
+_ROUNDS = 3
+
+
+@dataclasses.dataclass
+class Result:
+    name: str
+    lines: int
+    lines_per_second: float
+    p50_microseconds: float
+    p99_microseconds: float
+    # Mean of the peak memory allocated while handling a single line. None if the
+    # Python version cannot reset the peak (before 3.9)
+    peak_bytes_per_line: typing.Optional[float]
+
+    def __str__(self) -> str:
+        peak = (
+            "n/a"
+            if self.peak_bytes_per_line is None
+            else f"{self.peak_bytes_per_line:,.0f}"
+        )
+        return (
+            f"{self.name:<24} {self.lines_per_second:>12,.0f} lines/s "
+            f"p50 {self.p50_microseconds:>8.2f} µs "
+            f"p99 {self.p99_microseconds:>8.2f} µs "
+            f"peak {peak:>8} B/line"
+        )
+
+
+def _percentile(sorted_samples: typing.Sequence[int], percentile: float) -> float:
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * percentile))
+    return sorted_samples[index] / 1000
+
+
+def measure(
+    name: str,
+    function: typing.Callable[[_Item], typing.Any],
+    corpus: typing.Sequence[_Item],
+) -> Result:
+    """Measure a function applied to every item of the corpus.
+
+    The corpus is processed in rounds measuring the throughput, rounds timing every
+    item for the latency percentiles and once tracing the memory allocations of every
+    item.
+
+    :param name: The name of the benchmark.
+    :param function: The function under test.
+    :param corpus: The items the function is applied to.
+    :return: The measurements.
+    """
+    for item in corpus[:_WARMUP]:
+        function(item)
+
+    elapsed = []
+    for _ in range(_ROUNDS):
+        started = time.perf_counter()
+        for item in corpus:
+            function(item)
+        elapsed.append(time.perf_counter() - started)
+
+    rounds = []
+    for _ in range(_ROUNDS):
+        samples = []
+        for item in corpus:
+            item_started = time.perf_counter_ns()
+            function(item)
+            samples.append(time.perf_counter_ns() - item_started)
+        rounds.append(samples)
+
+    peaks: typing.Optional[typing.List[int]] = None
+    if hasattr(tracemalloc, "reset_peak"):
+        peaks = []
+        tracemalloc.start()
+        try:
+            for item in corpus:
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+                function(item)
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            tracemalloc.stop()
+
+    return _result(name, len(corpus), elapsed, rounds, peaks)
+
+
+def measure_async(
+    name: str,
+    function: typing.Callable[[_Item], typing.Awaitable[typing.Any]],
+    corpus: typing.Sequence[_Item],
+    lines: typing.Optional[int] = None,
+    start: typing.Optional[typing.Callable[[anyio.abc.TaskGroup], None]] = None,
+) -> Result:
+    """Measure a coroutine function awaited for every item of the corpus.
+
+    :param name: The name of the benchmark.
+    :param function: The coroutine function under test.
+    :param corpus: The items the function is applied to.
+    :param lines: The number of lines in the corpus if an item holds several lines,
+        such as a batch. The latencies are then per item and the peak memory is
+        spread evenly over the lines of an item.
+    :param start: Starts the background tasks the function relies on, such as the
+        tasks of the hooks. The tasks are cancelled after the measurement.
+    :return: The measurements.
+    """
+
+    results: typing.List[Result] = []
+
+    async def main() -> None:
+        async with anyio.create_task_group() as task_group:
+            if start is not None:
+                start(task_group)
+            await _measure()
+            task_group.cancel_scope.cancel()
+
+    async def _measure() -> None:
+        for item in corpus[:_WARMUP]:
+            await function(item)
+
+        elapsed = []
+        for _ in range(_ROUNDS):
+            started = time.perf_counter()
+            for item in corpus:
+                await function(item)
+            elapsed.append(time.perf_counter() - started)
+
+        rounds = []
+        for _ in range(_ROUNDS):
+            samples = []
+            for item in corpus:
+                item_started = time.perf_counter_ns()
+                await function(item)
+                samples.append(time.perf_counter_ns() - item_started)
+            rounds.append(samples)
+
+        peaks: typing.Optional[typing.List[int]] = None
+        if hasattr(tracemalloc, "reset_peak"):
+            peaks = []
+            tracemalloc.start()
+            try:
+                for item in corpus:
+                    tracemalloc.reset_peak()
+                    current = tracemalloc.get_traced_memory()[0]
+                    await function(item)
+                    peaks.append(tracemalloc.get_traced_memory()[1] - current)
+            finally:
+                tracemalloc.stop()
+
+        result = _result(name, len(corpus), elapsed, rounds, peaks)
+        if lines is not None:
+            result.lines = lines
+            result.lines_per_second *= lines / len(corpus)
+            if result.peak_bytes_per_line is not None:
+                result.peak_bytes_per_line *= len(corpus) / lines
+        results.append(result)
+
+    anyio.run(main)
+    return results[0]
+
+
+def _result(
+    name: str,
+    lines: int,
+    elapsed: typing.List[float],
+    rounds: typing.List[typing.List[int]],
+    peaks: typing.Optional[typing.List[int]],
+) -> Result:
+    for samples in rounds:
+        samples.sort()
+    return Result(
+        name=name,
+        lines=lines,
+        lines_per_second=lines / min(elapsed),
+        p50_microseconds=min(_percentile(samples, 0.50) for samples in rounds),
+        p99_microseconds=min(_percentile(samples, 0.99) for samples in rounds),
+        peak_bytes_per_line=None if peaks is None else statistics.mean(peaks),
+    )
+
+
+def load_baseline(path: pathlib.Path) -> typing.Dict[str, Result]:
+    """Load the stored baseline results.
+
+    :param path: The path of the baseline JSON file.
+    :return: The baseline results by benchmark name. Empty if there is no baseline.
+    """
+    if not path.exists():
+        return {}
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    return {name: Result(name=name, **result) for name, result in raw.items()}
+
+
+def save_baseline(path: pathlib.Path, results: typing.Sequence[Result]) -> None:
+    """Store the results as the new baseline.
+
+    :param path: The path of the baseline JSON file.
+    :param results: The results to store.
+    """
+    raw = {}
+    for result in results:
+        fields = dataclasses.asdict(result)
+        del fields["name"]
+        raw[result.name] = fields
+    path.write_text(json.dumps(raw, indent=2) + "\n", encoding="utf-8")
+
+
+def regressions(
+    results: typing.Sequence[Result],
+    baseline: typing.Mapping[str, Result],
+    tolerance: float,
+) -> typing.List[str]:
+    """Compare the results with the baseline.
+
+    :param results: The results of this run.
+    :param baseline: The baseline results by benchmark name.
+    :param tolerance: The accepted relative deviation from the baseline, e.g. 0.25.
+    :return: A description of every regression found.
+    """
+    found = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            continue
+        if result.lines_per_second < expected.lines_per_second * (1 - tolerance):
+            found.append(
+                f"{result.name}: {result.lines_per_second:,.0f} lines/s is below the "
+                f"baseline of {expected.lines_per_second:,.0f} lines/s"
+            )
+        if result.p99_microseconds > expected.p99_microseconds * (1 + tolerance):
+            found.append(
+                f"{result.name}: p99 of {result.p99_microseconds:.2f} µs is above the "
+                f"baseline of {expected.p99_microseconds:.2f} µs"
+            )
+    return found
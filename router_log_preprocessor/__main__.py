@@ -11,12 +11,275 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import argparse
+import functools
+import pathlib
+import typing
+
 import anyio
 
+import router_log_preprocessor.log_server.replay as replay
 import router_log_preprocessor.log_server.server
+import router_log_preprocessor.log_server.workers
 import router_log_preprocessor.settings
+import router_log_preprocessor.util.fake_zabbix as fake_zabbix
+import router_log_preprocessor.util.loadgen as loadgen
+import router_log_preprocessor.util.synthetic as synthetic
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def _argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="router-log-preprocessor",
+        description="Preprocess router logs and send the results to Zabbix.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=_positive_int,
+        default=1,
+        help="Number of worker processes binding the log server port using "
+        "SO_REUSEPORT (default: %(default)s).",
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    replay_parser = commands.add_parser(
+        "replay",
+        help="Replay an echo log or echo archive through the preprocessors and hooks.",
+    )
+    replay_parser.add_argument(
+        "file",
+        type=pathlib.Path,
+        help="The echo log, echo archive directory or archive segment to replay.",
+    )
+    replay_parser.add_argument(
+        "--timing",
+        choices=[timing.value for timing in replay.ReplayTiming],
+        default=replay.ReplayTiming.FAST.value,
+        help="Replay as fast as possible or with the original pace "
+        "(default: %(default)s).",
+    )
+    replay_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Count the measurements instead of sending them to Zabbix.",
+    )
+
+    loadgen_parser = commands.add_parser(
+        "loadgen",
+        help="Send synthetic logs of a fleet of routers to the log server.",
+    )
+    loadgen_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host of the log server (default: %(default)s).",
+    )
+    loadgen_parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="UDP port of the log server (default: LOG_SERVER_PORT).",
+    )
+    loadgen_parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000.0,
+        help="Target number of datagrams per second (default: %(default)s).",
+    )
+    loadgen_parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Number of seconds to send for (default: until interrupted).",
+    )
+    loadgen_parser.add_argument(
+        "--count",
+        type=_positive_int,
+        default=None,
+        help="Number of datagrams to send (default: until interrupted).",
+    )
+    loadgen_parser.add_argument(
+        "--sockets",
+        type=_positive_int,
+        default=1,
+        help=(
+            "Number of sockets to send from, each with its own source port "
+            "(default: %(default)s)."
+        ),
+    )
+    loadgen_parser.add_argument(
+        "--routers",
+        type=_positive_int,
+        default=1,
+        help="Number of routers logging (default: %(default)s).",
+    )
+    loadgen_parser.add_argument(
+        "--clients",
+        type=_positive_int,
+        default=100,
+        help="Number of wireless clients roaming between the routers "
+        "(default: %(default)s).",
+    )
+    loadgen_parser.add_argument(
+        "--noise-process",
+        action="append",
+        dest="noise_processes",
+        default=None,
+        help="Process logging noise that is not preprocessed. Can be repeated "
+        "(default: a few common router processes).",
+    )
+    loadgen_parser.add_argument(
+        "--noise-ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of the logs coming from the noise processes "
+        "(default: %(default)s).",
+    )
+    loadgen_parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the random generator for reproducible logs.",
+    )
+
+    fake_zabbix_parser = commands.add_parser(
+        "fake-zabbix",
+        help="Run a local stand-in Zabbix server recording the received measurements.",
+    )
+    fake_zabbix_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Local interface to bind to (default: %(default)s).",
+    )
+    fake_zabbix_parser.add_argument(
+        "--port",
+        type=int,
+        default=10051,
+        help="Local port to bind to (default: %(default)s).",
+    )
+    fake_zabbix_parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before responding (default: %(default)s).",
+    )
+    fake_zabbix_parser.add_argument(
+        "--reset-probability",
+        type=float,
+        default=0.0,
+        help="Probability of resetting the connection instead of responding "
+        "(default: %(default)s).",
+    )
+    fake_zabbix_parser.add_argument(
+        "--failure-ratio",
+        type=float,
+        default=0.0,
+        help="Fraction of the measurements reported as failed (default: %(default)s).",
+    )
+    fake_zabbix_parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between the statistics reports (default: %(default)s).",
+    )
+    return parser
+
+
+def _replay(arguments: argparse.Namespace) -> None:
+    statistics = anyio.run(
+        functools.partial(
+            replay.replay,
+            arguments.file,
+            timing=replay.ReplayTiming(arguments.timing),
+            dry_run=arguments.dry_run,
+        )
+    )
+    print(
+        f"Replayed {statistics.datagrams} datagrams in {statistics.elapsed:.3f} "
+        f"seconds ({statistics.rate:.0f} datagrams/s), "
+        f"discarded {statistics.discarded}"
+    )
+    if statistics.measurements is not None:
+        print(f"Dry-run counted {statistics.measurements} measurements")
+
+
+def _loadgen(arguments: argparse.Namespace) -> None:
+    port = arguments.port
+    if port is None:
+        port = router_log_preprocessor.settings.settings().log_server_port
+    noise_processes = arguments.noise_processes
+    if noise_processes is None:
+        noise_processes = synthetic.DEFAULT_NOISE_PROCESSES
+    fleet = synthetic.RouterFleet(
+        routers=arguments.routers,
+        clients=arguments.clients,
+        noise_processes=noise_processes,
+        noise_ratio=arguments.noise_ratio,
+        seed=arguments.seed,
+    )
+    statistics = loadgen.LoadStatistics()
+    try:
+        anyio.run(
+            functools.partial(
+                loadgen.generate_load,
+                fleet,
+                arguments.host,
+                port,
+                arguments.rate,
+                duration=arguments.duration,
+                count=arguments.count,
+                statistics=statistics,
+                sockets=arguments.sockets,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    print(
+        f"Sent {statistics.sent} datagrams in {statistics.elapsed:.3f} seconds "
+        f"({statistics.rate:.0f} datagrams/s)"
+    )
+
+
+def _fake_zabbix(arguments: argparse.Namespace) -> None:
+    server = fake_zabbix.FakeZabbixServer(
+        latency=arguments.latency,
+        reset_probability=arguments.reset_probability,
+        failure_ratio=arguments.failure_ratio,
+    )
+    try:
+        anyio.run(
+            fake_zabbix.serve_and_report,
+            server,
+            arguments.host,
+            arguments.port,
+            arguments.report_interval,
+        )
+    except KeyboardInterrupt:
+        pass
+    print(repr(server.statistics))
+
 
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> None:
+    """Main entry point of the Router Log Preprocessor (RLP)
 
-def main() -> None:
-    """Main entry point of the Router Log Preprocessor (RLP)"""
+    :param argv: The command line arguments. Defaults to the arguments of the process.
+    """
+    arguments = _argument_parser().parse_args(argv)
+    if arguments.command == "replay":
+        _replay(arguments)
+        return
+    if arguments.command == "loadgen":
+        _loadgen(arguments)
+        return
+    if arguments.command == "fake-zabbix":
+        _fake_zabbix(arguments)
+        return
+    if arguments.workers > 1:
+        router_log_preprocessor.log_server.workers.run_workers(arguments.workers)
+        return
     anyio.run(router_log_preprocessor.log_server.server.start_log_server)
@@ -12,13 +12,14 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 from router_log_preprocessor.domain._dnsmasq_dhcp import DnsmasqDhcpAcknowledge
-from router_log_preprocessor.domain._message import MAC, Message
+from router_log_preprocessor.domain._message import MAC, Message, intern_mac
 from router_log_preprocessor.domain._wlc import WlcEvent, WlcEventModel
 from router_log_preprocessor.util.rfc3164_parser import LogRecord
 
 __all__ = [
     "Message",
     "MAC",
+    "intern_mac",
     "WlcEventModel",
     "WlcEvent",
     "LogRecord",
@@ -11,12 +11,22 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
-import pydantic.dataclasses
+import ipaddress
+import typing
 
 import router_log_preprocessor.domain._message as _message
 
 
-@pydantic.dataclasses.dataclass
+@_message.message_model
 class DnsmasqDhcpAcknowledge(_message.Message):
-    ip_address: pydantic.IPvAnyAddress
+    __slots__ = ("ip_address", "hostname")
+
+    ip_address: typing.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
     hostname: str
+
+    def _validate(self) -> None:
+        super()._validate()
+        if not isinstance(
+            self.ip_address, (ipaddress.IPv4Address, ipaddress.IPv6Address)
+        ):
+            self.ip_address = ipaddress.ip_address(self.ip_address)
@@ -11,26 +11,102 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import dataclasses
+import functools
 import typing
-import typing_extensions
 
-import pydantic.dataclasses
 from macaddress import EUI48
 
+_Model = typing.TypeVar("_Model", bound="Message")
+
+
+# Upper bound on the number of distinct MAC addresses kept by intern_mac
+_MAX_INTERNED_MACS = 4096
+
 
 class MAC(EUI48):
-    """Implementation of EUI48 which contains validators used by pydantic."""
+    """Implementation of EUI48 which caches its string representation."""
+
+    __slots__ = ("_string",)
+
+    _string: str
+
+    def __str__(self) -> str:
+        try:
+            return self._string
+        except AttributeError:
+            self._string = super().__str__()
+            return self._string
+
+
+@functools.lru_cache(maxsize=_MAX_INTERNED_MACS)
+def intern_mac(value: str) -> MAC:
+    """Parse a MAC address, returning the same instance for repeated addresses.
+
+    Routers log the same few hundred clients over and over, so nearly every address
+    has been parsed before. The interned instances are shared and must not be mutated.
+
+    :param value: The MAC address in one of the formats supported by EUI48.
+    :return: The interned MAC address.
+    :raises ValueError: If the value is not a valid MAC address.
+    """
+    return MAC(value)
 
 
 def validate_mac(value: typing.Union[MAC, str]) -> MAC:
     if isinstance(value, MAC):
         return value
     try:
-        return MAC(value)
+        return intern_mac(value)
     except Exception as exception:
         raise ValueError("Invalid MAC address") from exception
 
 
-@pydantic.dataclasses.dataclass
+def message_model(cls: typing.Type[_Model]) -> typing.Type[_Model]:
+    """Turn a message class into a dataclass whose constructor validates the fields.
+
+    The message class must declare its fields in `__slots__` and validate them in
+    `_validate`. The unvalidated constructor is kept for `Message.trusted`.
+
+    :param cls: The message class.
+    :return: The message dataclass.
+    """
+    cls = dataclasses.dataclass(cls)
+    trusted_init = cls.__init__
+
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        trusted_init(self, *args, **kwargs)
+        self._validate()
+
+    __init__.__doc__ = trusted_init.__doc__
+    cls._trusted_init = trusted_init  # type: ignore[attr-defined]
+    cls.__init__ = __init__  # type: ignore[assignment]
+    return cls
+
+
+@message_model
 class Message:
-    mac_address: typing_extensions.Annotated[MAC, pydantic.PlainValidator(validate_mac)]
+    __slots__ = ("mac_address",)
+
+    mac_address: MAC
+
+    @classmethod
+    def trusted(cls: typing.Type[_Model], **fields: typing.Any) -> _Model:
+        """Create the message without validating the fields.
+
+        Only use this for fields that are already well-formed, e.g. produced by a
+        preprocessor.
+
+        :param fields: The fields of the message.
+        :return: The message.
+        """
+        message = cls.__new__(cls)
+        cls._trusted_init(message, **fields)  # type: ignore[attr-defined]
+        return message
+
+    def _validate(self) -> None:
+        """Validate and convert the fields of the message.
+
+        :raises ValueError: If a field is invalid.
+        """
+        self.mac_address = validate_mac(self.mac_address)
@@ -13,9 +13,7 @@
 #  limitations under the License.
 import enum
 
-import pydantic.dataclasses
-
-from router_log_preprocessor.domain._message import Message
+from router_log_preprocessor.domain._message import Message, message_model
 
 
 class WlcEvent(enum.Enum):
@@ -41,10 +39,19 @@ class WlcEvent(enum.Enum):
         raise ValueError("Unknown event")
 
 
-@pydantic.dataclasses.dataclass
+@message_model
 class WlcEventModel(Message):
+    __slots__ = ("location", "event", "status", "rssi", "reason")
+
     location: str
     event: WlcEvent
     status: int
     rssi: int
     reason: str
+
+    def _validate(self) -> None:
+        super()._validate()
+        if not isinstance(self.event, WlcEvent):
+            self.event = WlcEvent(self.event)
+        self.status = int(self.status)
+        self.rssi = int(self.rssi)
@@ -14,6 +14,8 @@
 import abc
 import typing
 
+import anyio.abc
+
 import router_log_preprocessor.domain as domain
 
 
@@ -27,3 +29,37 @@ class Hook(abc.ABC):
         :param record: The parsed log record.
         :param message: The preprocessed log message.
         """
+
+    def accepts_unprocessed(self, process: str) -> bool:
+        """Tell whether the hook wants the records of a process that no preprocessor
+        handles. Such records are sent to the hook with a None message.
+
+        Records that no hook wants are discarded before they are parsed.
+
+        :param process: The process name of the log entry.
+        :return: True if the records should be sent to the hook. Default is True.
+        """
+        return True
+
+    def start(self, task_group: anyio.abc.TaskGroup) -> None:
+        """Start the background tasks of the hook, e.g. sending the records that
+        were handed to the hook by send.
+
+        The background tasks run until the task group is cancelled. Default is to do
+        nothing.
+
+        :param task_group: The task group the background tasks are started in.
+        """
+
+    async def flush(self) -> None:
+        """Wait until the records handed to the hook so far have been sent by its
+        background tasks.
+
+        Default is to do nothing.
+        """
+
+    async def aclose(self) -> None:
+        """Release the resources of the hook, e.g. persist its state on shutdown.
+
+        Default is to do nothing.
+        """
@@ -11,6 +11,22 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+from router_log_preprocessor.hooks.zabbix._circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+from router_log_preprocessor.hooks.zabbix._dry_run import DryRunSender
+from router_log_preprocessor.hooks.zabbix._sender_pool import SenderPool
+from router_log_preprocessor.hooks.zabbix._spool import MeasurementSpool
 from router_log_preprocessor.hooks.zabbix._trapper import ZabbixTrapper
 
-__all__ = ["ZabbixTrapper"]
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CircuitState",
+    "DryRunSender",
+    "MeasurementSpool",
+    "SenderPool",
+    "ZabbixTrapper",
+]
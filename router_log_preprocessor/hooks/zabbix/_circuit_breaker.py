@@ -0,0 +1,162 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import enum
+import random
+import typing
+
+import anyio
+import asyncio_zabbix_sender
+from asyncio_zabbix_sender._response import ZabbixResponse
+
+import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
+
+
+class CircuitState(enum.IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+_CIRCUIT_STATE = metrics.registry.gauge(
+    "rlp_zabbix_circuit_state",
+    "State of the circuit breaker of the Zabbix sender: 0 closed, 1 half-open and "
+    "2 open.",
+)
+_FAST_FAILURES = metrics.registry.counter(
+    "rlp_zabbix_fast_failures_total",
+    "Requests to Zabbix failed by the open circuit breaker without being sent.",
+)
+
+
+class CircuitOpenError(ConnectionError):
+    """The request was not sent as Zabbix is considered unreachable."""
+
+
+class CircuitBreaker:
+    """Sender failing fast while Zabbix is unreachable.
+
+    After `failure_threshold` consecutive connection errors the circuit opens, and
+    requests fail with a CircuitOpenError without being sent. Once the backoff has
+    elapsed the circuit is half-open, and a single request probes Zabbix. The circuit
+    closes if the probe succeeds, and otherwise opens again with twice the backoff, up
+    to `max_backoff`. Every backoff is jittered to spread the probes of multiple log
+    servers. Connection errors of requests sent before the circuit opened are counted,
+    but neither reopen the circuit nor increase the backoff.
+
+    Requests waiting for a slot in a SenderPool must not be sent once the circuit has
+    opened, so the circuit breaker belongs inside the pool.
+    """
+
+    def __init__(
+        self,
+        sender,
+        failure_threshold: int = 3,
+        initial_backoff: float = 5,
+        max_backoff: float = 300,
+        seed: typing.Optional[int] = None,
+    ) -> None:
+        """Create a circuit breaker around the sender.
+
+        :param sender: The sender of a single request, e.g. a ZabbixSender.
+        :param failure_threshold: The consecutive connection errors opening the
+                                  circuit.
+        :param initial_backoff: The time in seconds the circuit stays open the first
+                                time.
+        :param max_backoff: The maximum time in seconds the circuit stays open.
+        :param seed: Optional seed of the jitter.
+        """
+        self._sender = sender
+        self._failure_threshold = failure_threshold
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._random = random.Random(seed)
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._backoff = initial_backoff
+        self._opened_until = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        """The current state of the circuit."""
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """The seconds until Zabbix may be probed, 0 if the circuit is closed."""
+        if self._state is CircuitState.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_until - anyio.current_time())
+
+    async def send(
+        self, measurements: asyncio_zabbix_sender.Measurements
+    ) -> ZabbixResponse:
+        """Send the measurements unless the circuit is open.
+
+        :param measurements: The measurement collection.
+        :raises CircuitOpenError: If Zabbix is considered unreachable.
+        :return: The response from Zabbix.
+        """
+        is_probe = False
+        if self._state is not CircuitState.CLOSED:
+            if (
+                self._state is CircuitState.HALF_OPEN
+                or anyio.current_time() < self._opened_until
+            ):
+                # Wait for the backoff or the probe in flight
+                _FAST_FAILURES.inc()
+                raise CircuitOpenError(
+                    f"Circuit to Zabbix is open for another {self.retry_after:.1f} "
+                    "seconds"
+                )
+            self._set_state(CircuitState.HALF_OPEN)
+            is_probe = True
+            logging.logger.info("Probing Zabbix after backoff")
+
+        try:
+            response = await self._sender.send(measurements)
+        except ConnectionError:
+            self._failures += 1
+            if is_probe or (
+                self._state is CircuitState.CLOSED
+                and self._failures >= self._failure_threshold
+            ):
+                self._open()
+            raise
+        except BaseException:
+            if is_probe:
+                # The probe did not tell whether Zabbix is reachable
+                self._set_state(CircuitState.OPEN)
+            raise
+
+        if self._state is not CircuitState.CLOSED:
+            logging.logger.info("Zabbix is reachable again. Circuit closed")
+        self._failures = 0
+        self._backoff = self._initial_backoff
+        self._set_state(CircuitState.CLOSED)
+        return response
+
+    def _open(self) -> None:
+        # Equal jitter keeps at least half of the backoff
+        backoff = self._backoff * (0.5 + self._random.random() / 2)
+        self._opened_until = anyio.current_time() + backoff
+        self._backoff = min(self._backoff * 2, self._max_backoff)
+        self._set_state(CircuitState.OPEN)
+        logging.logger.warning(
+            "Zabbix is unreachable. Circuit opened for %.1f seconds", backoff
+        )
+
+    def _set_state(self, state: CircuitState) -> None:
+        self._state = state
+        _CIRCUIT_STATE.set(state)
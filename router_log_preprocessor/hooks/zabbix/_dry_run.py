@@ -0,0 +1,39 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import decimal
+
+import asyncio_zabbix_sender
+from asyncio_zabbix_sender._response import ZabbixResponse
+
+
+class DryRunSender:
+    """Stand-in for the Zabbix sender which counts the measurements instead of sending
+    them."""
+
+    def __init__(self) -> None:
+        self.sends = 0
+        self.measurements = 0
+
+    async def send(
+        self, measurements: asyncio_zabbix_sender.Measurements
+    ) -> ZabbixResponse:
+        """Count the measurements and report them as processed.
+
+        :param measurements: The measurements that would have been sent.
+        :return: A response as if Zabbix processed every measurement.
+        """
+        count = len(measurements)
+        self.sends += 1
+        self.measurements += count
+        return ZabbixResponse(count, 0, count, decimal.Decimal(0))
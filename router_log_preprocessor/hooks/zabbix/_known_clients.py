@@ -13,29 +13,110 @@
 #  limitations under the License.
 import collections
 import datetime
+import os
+import pathlib
+import struct
+import time
 import typing
+import uuid
 
 import router_log_preprocessor.domain as domain
+import router_log_preprocessor.util.metrics as metrics
+
+# Mapping from (process, mac address) to the date and time the client became known
+# and the identity of the worker that added it. The store is typically shared between
+# worker processes through a multiprocessing manager.
+SharedStore = typing.MutableMapping[
+    typing.Tuple[str, str], typing.Tuple[datetime.datetime, str]
+]
+
+_KNOWN_CLIENTS = metrics.registry.gauge(
+    "rlp_known_clients", "Clients discovered in Zabbix, counted once per process."
+)
+_EVICTED_CLIENTS = metrics.registry.counter(
+    "rlp_known_clients_evicted_total",
+    "Known clients forgotten by reason, i.e. not seen within the maximum age or the "
+    "least recently seen client when a process exceeds the maximum number of clients.",
+    ("reason",),
+)
+
+# Snapshot layout: the magic and version followed by every process as the length of
+# its UTF-8 encoded name, the name and the number of clients, and every client, least
+# recently seen first, as the 6 bytes of its mac address, the POSIX time it became
+# known and the POSIX time it was last seen.
+_SNAPSHOT_MAGIC = b"RLPK\x02"
+_SNAPSHOT_PROCESS = struct.Struct("<HI")
+_SNAPSHOT_CLIENT = struct.Struct("<6sdd")
+_EPOCH = datetime.datetime(1970, 1, 1)
 
 
 class KnownClients:
-    def __init__(self, client_discovery_wait_time: float) -> None:
+    def __init__(
+        self,
+        client_discovery_wait_time: float,
+        shared_store: typing.Optional[SharedStore] = None,
+        max_age: typing.Optional[float] = None,
+        max_clients: typing.Optional[int] = None,
+    ) -> None:
+        """Create a repository of known clients.
+
+        The clients of every process are kept in the order they were last seen, so
+        both the clients not seen within `max_age` and the least recently seen client
+        exceeding `max_clients` are found without scanning every client. Forgotten
+        clients are left out of the next discovery, and are discovered again if they
+        reappear.
+
+        :param client_discovery_wait_time: The time it takes Zabbix to discover a
+                                           client.
+        :param shared_store: Optional store shared with other worker processes. Clients
+                             added by another worker are considered known, so each
+                             client is only discovered once.
+        :param max_age: Optional time in seconds after which a client that has not been
+                        seen is evicted by `evict_stale`.
+        :param max_clients: Optional maximum number of known clients per process.
+        """
         self._total_wait_time = client_discovery_wait_time
+        self._shared_store = shared_store
+        self._max_age = max_age
+        self._max_clients = max_clients
+        self._identity = uuid.uuid4().hex
+        # Clients ordered from the least to the most recently seen
         self._known_clients: typing.DefaultDict[
-            str, typing.Dict[domain.MAC, datetime.datetime]
+            str, typing.OrderedDict[domain.MAC, datetime.datetime]
+        ] = collections.defaultdict(collections.OrderedDict)
+        self._last_seen: typing.DefaultDict[
+            str, typing.Dict[domain.MAC, float]
         ] = collections.defaultdict(dict)
+        self._is_changed = False
+
+    @property
+    def is_changed(self) -> bool:
+        """Whether clients became known since the last snapshot."""
+        return self._is_changed
 
     @staticmethod
     def _now() -> datetime.datetime:
         return datetime.datetime.utcnow()
 
-    def add_client(self, process: str, mac_address: domain.MAC) -> None:
+    @staticmethod
+    def _time() -> float:
+        return time.time()
+
+    def add_client(self, process: str, mac_address: domain.MAC) -> bool:
         """Add a client to the repository marking the date and time of the addition.
 
         :param process: The process of the log entry.
         :param mac_address: The mac address of the client.
+        :return: True if the client was added and False if another worker added the
+                 client first.
         """
-        self._known_clients[process][mac_address] = KnownClients._now()
+        known_at, added_by = KnownClients._now(), self._identity
+        if self._shared_store is not None:
+            known_at, added_by = self._shared_store.setdefault(
+                (process, str(mac_address)), (known_at, added_by)
+            )
+        self._remember(process, mac_address, known_at)
+        return added_by == self._identity
 
     def is_client_known(self, process: str, mac_address: domain.MAC) -> bool:
         """Verify if a client (mac address) is known for a given process.
@@ -44,7 +125,18 @@ class KnownClients:
         :param mac_address: The mac address of the client.
         :return: True if the client is already known and False otherwise.
         """
-        return mac_address in self._known_clients[process]
+        clients = self._known_clients[process]
+        if mac_address in clients:
+            clients.move_to_end(mac_address)
+            self._last_seen[process][mac_address] = KnownClients._time()
+            return True
+        if self._shared_store is None:
+            return False
+        shared = self._shared_store.get((process, str(mac_address)))
+        if shared is None:
+            return False
+        self._remember(process, mac_address, shared[0])
+        return True
 
     def remaining_wait_time(self, process: str, mac_address: domain.MAC) -> float:
         """Calculate the remaining wait time before a client is assumed to be
@@ -63,10 +155,190 @@ class KnownClients:
             return 0.0
         return remaining_wait_time
 
+    def restart_wait_time(
+        self, process: str, mac_address: domain.MAC, wait_time: float
+    ) -> None:
+        """Restart the wait time before a client is assumed to be discovered by Zabbix,
+        e.g. once a delayed discovery of the client has been sent.
+
+        :param process: The process of the log entry.
+        :param mac_address: The mac address of the client.
+        :param wait_time: The time in seconds from now until the client is assumed to
+                          be discovered.
+        """
+        clients = self._known_clients[process]
+        if mac_address not in clients:
+            # The client was forgotten in the meantime
+            return
+        known_at = KnownClients._now() - datetime.timedelta(
+            seconds=self._total_wait_time - wait_time
+        )
+        clients[mac_address] = known_at
+        if self._shared_store is not None:
+            self._shared_store[(process, str(mac_address))] = (known_at, self._identity)
+        self._is_changed = True
+
     def clients(self, process: str) -> typing.Generator[domain.MAC, None, None]:
         """Generate a list of clients known for the given process.
 
+        The clients added by other workers are included, but they are not remembered
+        by this worker until it sees them, so they neither count towards the maximum
+        number of clients nor appear as recently seen.
+
         :param process: The process of the log entry.
         """
-        for key in self._known_clients[process]:
-            yield key
+        clients = self._known_clients[process]
+        shared_clients = []
+        if self._shared_store is not None:
+            # Include the clients added by other workers
+            for known_process, mac_address in self._shared_store.keys():
+                if known_process == process:
+                    mac = domain.intern_mac(mac_address)
+                    if mac not in clients:
+                        shared_clients.append(mac)
+        yield from clients
+        yield from shared_clients
+
+    def snapshot(
+        self,
+        excluded: typing.Optional[
+            typing.Mapping[str, typing.AbstractSet[domain.MAC]]
+        ] = None,
+    ) -> bytes:
+        """Serialize the known clients, e.g. to be restored after a restart.
+
+        :param excluded: The clients to leave out of the snapshot by process, e.g.
+                         clients not yet discovered by Zabbix. The repository is
+                         still considered changed if any client is left out.
+        :return: The compact binary snapshot.
+        """
+        if excluded is None:
+            excluded = {}
+        parts = [_SNAPSHOT_MAGIC]
+        is_excluding = False
+        for process, clients in self._known_clients.items():
+            excluded_clients = excluded.get(process, frozenset())
+            included = [
+                (mac_address, known_at)
+                for mac_address, known_at in clients.items()
+                if mac_address not in excluded_clients
+            ]
+            is_excluding = is_excluding or len(included) < len(clients)
+            name = process.encode("utf-8")
+            parts.append(_SNAPSHOT_PROCESS.pack(len(name), len(included)))
+            parts.append(name)
+            last_seen = self._last_seen[process]
+            for mac_address, known_at in included:
+                parts.append(
+                    _SNAPSHOT_CLIENT.pack(
+                        bytes(mac_address),
+                        (known_at - _EPOCH).total_seconds(),
+                        last_seen[mac_address],
+                    )
+                )
+        self._is_changed = is_excluding
+        return b"".join(parts)
+
+    def restore(self, snapshot: bytes) -> int:
+        """Remember the clients of a snapshot as known since the time in the snapshot.
+
+        Restored clients are added to the shared store unless another worker already
+        added them.
+
+        :param snapshot: The binary snapshot.
+        :return: The number of restored clients.
+        :raises ValueError: If the snapshot is invalid.
+        """
+        view = memoryview(snapshot)
+        if bytes(view[: len(_SNAPSHOT_MAGIC)]) != _SNAPSHOT_MAGIC:
+            raise ValueError("Not a snapshot of known clients")
+        offset = len(_SNAPSHOT_MAGIC)
+        restored = 0
+        try:
+            while offset < len(view):
+                name_length, count = _SNAPSHOT_PROCESS.unpack_from(view, offset)
+                offset += _SNAPSHOT_PROCESS.size
+                process = bytes(view[offset : offset + name_length]).decode("utf-8")
+                offset += name_length
+                for _ in range(count):
+                    raw, seconds, last_seen = _SNAPSHOT_CLIENT.unpack_from(view, offset)
+                    offset += _SNAPSHOT_CLIENT.size
+                    mac_address = domain.intern_mac(raw.hex("-"))
+                    known_at = _EPOCH + datetime.timedelta(seconds=seconds)
+                    if self._shared_store is not None:
+                        known_at, _ = self._shared_store.setdefault(
+                            (process, str(mac_address)), (known_at, self._identity)
+                        )
+                    self._remember(process, mac_address, known_at, last_seen)
+                    restored += 1
+        except struct.error as error:
+            raise ValueError("Truncated snapshot of known clients") from error
+        self._is_changed = False
+        return restored
+
+    def evict_stale(self, limit: int) -> int:
+        """Forget up to `limit` clients that have not been seen within the maximum age.
+
+        The least recently seen clients are evicted first, so the cost is bounded by
+        the limit, and repeated calls continue where the previous call stopped.
+
+        :param limit: The maximum number of clients to evict.
+        :return: The number of evicted clients. If it equals the limit, then more
+                 clients may be stale.
+        """
+        if self._max_age is None:
+            return 0
+        threshold = KnownClients._time() - self._max_age
+        evicted = 0
+        for process, clients in self._known_clients.items():
+            last_seen = self._last_seen[process]
+            while clients and evicted < limit:
+                mac_address = next(iter(clients))
+                if last_seen[mac_address] > threshold:
+                    break
+                self._evict(process, mac_address, "age")
+                evicted += 1
+        return evicted
+
+    def _remember(
+        self,
+        process: str,
+        mac_address: domain.MAC,
+        known_at: datetime.datetime,
+        last_seen: typing.Optional[float] = None,
+    ) -> None:
+        clients = self._known_clients[process]
+        if mac_address not in clients:
+            _KNOWN_CLIENTS.inc()
+            self._is_changed = True
+        clients[mac_address] = known_at
+        clients.move_to_end(mac_address)
+        self._last_seen[process][mac_address] = (
+            KnownClients._time() if last_seen is None else last_seen
+        )
+        if self._max_clients is not None and len(clients) > self._max_clients:
+            self._evict(process, next(iter(clients)), "overflow")
+
+    def _evict(self, process: str, mac_address: domain.MAC, reason: str) -> None:
+        del self._known_clients[process][mac_address]
+        del self._last_seen[process][mac_address]
+        if self._shared_store is not None:
+            # Let the client be discovered again by any worker once it reappears
+            self._shared_store.pop((process, str(mac_address)), None)
+        _KNOWN_CLIENTS.dec()
+        _EVICTED_CLIENTS.labels(reason).inc()
+        self._is_changed = True
+
+
+def write_snapshot(path: pathlib.Path, snapshot: bytes) -> None:
+    """Write the snapshot atomically, such that a crash never leaves a partial file.
+
+    :param path: The path of the snapshot.
+    :param snapshot: The binary snapshot.
+    """
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "wb") as file:
+        file.write(snapshot)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
@@ -13,8 +13,10 @@
 #  limitations under the License.
 import dataclasses
 import enum
+import functools
 import ipaddress
 import json
+import operator
 import typing
 
 import asyncio_zabbix_sender
@@ -22,33 +24,88 @@ import asyncio_zabbix_sender
 import router_log_preprocessor.domain as domain
 import router_log_preprocessor.hooks.zabbix._known_clients as _known_clients
 
+# Converts a field value to a value accepted by Zabbix. None means no conversion
+_Converter = typing.Optional[typing.Callable[[typing.Any], typing.Any]]
+# The fields of a message type to map to measurements with their converters
+_Plan = typing.Tuple[typing.Tuple[str, _Converter], ...]
+
+# Upper bound on the number of (message type, process, client) item keys to cache
+_MAX_CACHED_ITEM_KEYS = 8192
+
+
+def _converter(annotation: typing.Any) -> _Converter:
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        return operator.attrgetter("value")
+    types = typing.get_args(annotation) or (annotation,)
+    if all(
+        isinstance(type_, type)
+        and issubclass(type_, (ipaddress.IPv4Address, ipaddress.IPv6Address))
+        for type_ in types
+    ):
+        return str
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _plan(message_type: typing.Type[domain.Message]) -> _Plan:
+    """Compile the fields to map for a message type.
+
+    :param message_type: The type of the message.
+    :return: The name and converter of each field except the mac address.
+    """
+    type_hints = typing.get_type_hints(message_type)
+    return tuple(
+        (field.name, _converter(type_hints[field.name]))
+        for field in dataclasses.fields(message_type)
+        if field.name != "mac_address"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _zabbix_process(process: str) -> str:
+    # Ensure process is formatted according to Zabbix recommendations
+    return process.lower().replace("-", "_")
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_ITEM_KEYS)
+def _item_keys(
+    message_type: typing.Type[domain.Message], process: str, mac_address: str
+) -> typing.Tuple[str, ...]:
+    """Format the item keys of a client in the same order as the plan.
+
+    :param message_type: The type of the message.
+    :param process: The process of the log entry.
+    :param mac_address: The mac address of the client.
+    :return: The item key of each field in the plan.
+    """
+    zabbix_process = _zabbix_process(process)
+    return tuple(
+        f"rlp.{zabbix_process}[{field_name},{mac_address}]"
+        for field_name, _ in _plan(message_type)
+    )
+
 
 def map_client_message(
     record: domain.LogRecord, message: domain.Message
 ) -> typing.Generator[asyncio_zabbix_sender.Measurement, None, None]:
     assert record.process is not None
 
-    # Ensure process is formatted according to Zabbix recommendations
-    process = record.process.lower().replace("-", "_")
     # Convert record datetime to timestamp in full seconds
     clock = int(record.timestamp.timestamp())
     ns = None
     if isinstance(message, domain.WlcEventModel):
         ns = message.event.value
 
-    # Generate the measurements from the model
-    model_fields = dataclasses.fields(message)
-    for field in model_fields:
-        if field.name == "mac_address":
-            continue
-        value = getattr(message, field.name)
-        if isinstance(value, enum.Enum):
-            value = value.value
-        elif isinstance(value, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
-            value = str(value)
+    # Generate the measurements from the precomputed plan of the model
+    message_type = type(message)
+    keys = _item_keys(message_type, record.process, str(message.mac_address))
+    for (field_name, convert), key in zip(_plan(message_type), keys):
+        value = getattr(message, field_name)
+        if convert is not None:
+            value = convert(value)
         yield asyncio_zabbix_sender.Measurement(
             host=record.hostname,
-            key=f"rlp.{process}[{field.name},{message.mac_address}]",
+            key=key,
             value=value,
             clock=clock,
             ns=ns,
@@ -0,0 +1,77 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import typing
+
+import anyio
+import asyncio_zabbix_sender
+from asyncio_zabbix_sender._response import ZabbixResponse
+
+import router_log_preprocessor.util.metrics as metrics
+
+_IN_FLIGHT = metrics.registry.gauge(
+    "rlp_zabbix_requests_in_flight",
+    "Requests to Zabbix currently being sent or awaiting a response.",
+)
+
+
+class SenderPool:
+    """Sender allowing a bounded number of concurrent requests to Zabbix.
+
+    Discoveries and bundles of measurements are sent concurrently up to the bound, and
+    further requests wait for a request to complete. The Zabbix protocol closes the
+    connection after every response, so every request still uses its own connection,
+    but the connection setup, e.g. the TLS handshake, of concurrent requests overlap.
+    """
+
+    def __init__(self, sender, max_in_flight: int = 4) -> None:
+        """Create a pool of concurrent requests using the sender.
+
+        :param sender: The sender of a single request, e.g. a CircuitBreaker around a
+                       ZabbixSender.
+        :param max_in_flight: The maximum number of concurrent requests.
+        """
+        self._sender = sender
+        self._max_in_flight = max_in_flight
+        self._limiter: typing.Optional[anyio.CapacityLimiter] = None
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests currently being sent."""
+        if self._limiter is None:
+            return 0
+        return self._limiter.borrowed_tokens
+
+    @property
+    def retry_after(self) -> float:
+        """The seconds until the sender may be retried, e.g. while its circuit is
+        open."""
+        return getattr(self._sender, "retry_after", 0.0)
+
+    async def send(
+        self, measurements: asyncio_zabbix_sender.Measurements
+    ) -> ZabbixResponse:
+        """Send the measurements once fewer than the maximum requests are in flight.
+
+        :param measurements: The measurement collection.
+        :return: The response from Zabbix.
+        """
+        if self._limiter is None:
+            # Created lazily as the limiter belongs to the running event loop
+            self._limiter = anyio.CapacityLimiter(self._max_in_flight)
+        async with self._limiter:
+            _IN_FLIGHT.inc()
+            try:
+                return await self._sender.send(measurements)
+            finally:
+                _IN_FLIGHT.dec()
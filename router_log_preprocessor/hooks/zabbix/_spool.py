@@ -0,0 +1,166 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import anyio.to_thread
+import asyncio_zabbix_sender
+
+import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
+
+_SPOOLED = metrics.registry.gauge(
+    "rlp_zabbix_spool_bundles",
+    "Bundles of measurements spooled to disk while waiting for Zabbix.",
+)
+_SPOOL_DROPPED = metrics.registry.counter(
+    "rlp_zabbix_spool_dropped_total",
+    "Spooled measurements dropped because the spool reached its maximum size.",
+)
+
+
+class MeasurementSpool:
+    """First in, first out queue of unsent bundles of measurements on disk.
+
+    The bundles are stored in a SQLite database in write-ahead logging mode, so they
+    survive a restart of the log server. Once the spool exceeds its maximum size the
+    oldest bundles are dropped. The database is accessed in a worker thread to keep
+    the disk off the event loop.
+    """
+
+    def __init__(self, path: pathlib.Path, max_bytes: int) -> None:
+        """Open the spool, creating it if it does not exist.
+
+        :param path: The path of the SQLite database.
+        :param max_bytes: The approximate maximum size of the spooled bundles.
+        """
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS spool "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, size INTEGER, payload TEXT)"
+        )
+        self._count, self._size = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM spool"
+        ).fetchone()
+        _SPOOLED.set(self._count)
+        if self._count > 0:
+            logging.logger.info(
+                "Spool %s contains %d unsent bundles", path, self._count
+            )
+
+    def __len__(self) -> int:
+        """The number of spooled bundles."""
+        return self._count
+
+    @property
+    def size(self) -> int:
+        """The approximate size of the spooled bundles in bytes."""
+        return self._size
+
+    async def append(self, measurements: asyncio_zabbix_sender.Measurements) -> None:
+        """Spool the bundle after every previously spooled bundle.
+
+        :param measurements: The bundle of measurements.
+        """
+        payload = json.dumps(
+            [measurement.as_dict() for measurement in measurements],
+            separators=(",", ":"),
+        )
+        await anyio.to_thread.run_sync(self._append, payload)
+
+    async def peek(
+        self,
+    ) -> typing.Optional[typing.Tuple[int, asyncio_zabbix_sender.Measurements]]:
+        """Get the oldest spooled bundle without removing it.
+
+        :return: The identifier and measurements of the bundle or None if empty.
+        """
+        if self._count == 0:
+            return None
+        row = await anyio.to_thread.run_sync(self._peek)
+        if row is None:
+            return None
+        identifier, payload = row
+        measurements = asyncio_zabbix_sender.Measurements(
+            [
+                asyncio_zabbix_sender.Measurement(**measurement)
+                for measurement in json.loads(payload)
+            ]
+        )
+        return identifier, measurements
+
+    async def remove(self, identifier: int) -> None:
+        """Remove a spooled bundle, e.g. once it has been sent.
+
+        :param identifier: The identifier of the bundle.
+        """
+        await anyio.to_thread.run_sync(self._remove, identifier)
+
+    def close(self) -> None:
+        """Close the database. Spooled bundles are kept for the next start."""
+        with self._lock:
+            self._connection.close()
+
+    def _append(self, payload: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO spool (size, payload) VALUES (?, ?)",
+                (len(payload), payload),
+            )
+            self._count += 1
+            self._size += len(payload)
+            while self._size > self._max_bytes and self._count > 1:
+                self._drop_oldest()
+            _SPOOLED.set(self._count)
+
+    def _drop_oldest(self) -> None:
+        identifier, size, payload = self._connection.execute(
+            "SELECT id, size, payload FROM spool ORDER BY id LIMIT 1"
+        ).fetchone()
+        self._connection.execute("DELETE FROM spool WHERE id = ?", (identifier,))
+        self._count -= 1
+        self._size -= size
+        dropped = len(json.loads(payload))
+        _SPOOL_DROPPED.inc(dropped)
+        logging.logger.warning(
+            "Spool is full. Dropped the oldest bundle of %d measurements", dropped
+        )
+
+    def _peek(self) -> typing.Optional[typing.Tuple[int, str]]:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT id, payload FROM spool ORDER BY id LIMIT 1"
+            ).fetchone()
+
+    def _remove(self, identifier: int) -> None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size FROM spool WHERE id = ?", (identifier,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "DELETE FROM spool WHERE id = ?", (identifier,)
+                )
+                self._count -= 1
+                self._size -= row[0]
+            _SPOOLED.set(self._count)
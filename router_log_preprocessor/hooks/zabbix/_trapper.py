@@ -11,38 +11,318 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import heapq
+import itertools
+import pathlib
+import time
 import typing
 
 import anyio
+import anyio.abc
+import anyio.to_thread
 import asyncio_zabbix_sender
 
 import router_log_preprocessor.domain as domain
 import router_log_preprocessor.hooks.abc as abc
 import router_log_preprocessor.hooks.zabbix._known_clients as known_clients
 import router_log_preprocessor.hooks.zabbix._mapper as mapper
+import router_log_preprocessor.hooks.zabbix._spool as spool
 import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
+
+# Pending measurements are parked per host, process and mac address
+_PendingKey = typing.Tuple[str, str, domain.MAC]
+# Discoveries are sent per host and process
+_DiscoveryKey = typing.Tuple[str, str]
+# The scheduler releases parked measurements and sends debounced discoveries
+_ScheduledKey = typing.Union[_PendingKey, _DiscoveryKey]
+
+_BUNDLE_SIZE = metrics.registry.histogram(
+    "rlp_zabbix_bundle_size",
+    "Measurements sent to Zabbix in a single bundle.",
+    buckets=metrics.SIZE_BUCKETS,
+)
+_SEND_SECONDS = metrics.registry.histogram(
+    "rlp_zabbix_send_seconds",
+    "Time spent sending a request to Zabbix by request type.",
+    ("request",),
+)
+_SEND_FAILURES = metrics.registry.counter(
+    "rlp_zabbix_send_failures_total",
+    "Bundles of measurements that could not be sent to Zabbix and are retried.",
+)
+_FLUSHES = metrics.registry.counter(
+    "rlp_zabbix_bundle_flushes_total",
+    "Bundles of measurements flushed by trigger, i.e. the bundle timer or the bundle "
+    "reaching its maximum size.",
+    ("trigger",),
+)
+_QUEUED_DISCOVERIES = metrics.registry.gauge(
+    "rlp_zabbix_queued_discoveries",
+    "Discoveries that could not be sent to Zabbix and are retried with the next "
+    "bundle.",
+)
+_PENDING_CLIENTS = metrics.registry.gauge(
+    "rlp_zabbix_pending_clients",
+    "Clients with measurements waiting for the Zabbix discovery.",
+)
+
+
+# Maximum number of stale known clients evicted by a single sweep, such that a sweep
+# never holds up the event loop for long
+_SWEEP_BATCH = 1000
+
+# Approximate size of the JSON surrounding the host, key and value of a measurement,
+# i.e. {"clock":1675342971,"host":"","key":"","ns":0,"value":""},
+_MEASUREMENT_OVERHEAD = 64
+
+
+def _measurement_size(measurement: asyncio_zabbix_sender.Measurement) -> int:
+    """Estimate the size of the measurement in a sender request without encoding it.
+
+    :param measurement: The measurement to estimate the size of.
+    :return: The approximate number of bytes.
+    """
+    return (
+        _MEASUREMENT_OVERHEAD
+        + len(measurement.host)
+        + len(measurement.key)
+        + len(str(measurement.value))
+    )
 
 
 class ZabbixTrapper(abc.Hook):
     def __init__(
-        self, sender, client_discovery_wait_time=50, measurement_bundle_wait_time=10
+        self,
+        sender,
+        client_discovery_wait_time=50,
+        measurement_bundle_wait_time=10,
+        known_clients_store: typing.Optional[known_clients.SharedStore] = None,
+        max_bundle_items: int = 250,
+        max_bundle_bytes: int = 1 << 20,
+        measurement_spool: typing.Optional[spool.MeasurementSpool] = None,
+        spool_drain_rate: float = 10,
+        known_clients_path: typing.Optional[pathlib.Path] = None,
+        snapshot_interval: float = 300,
+        discovery_debounce: float = 0,
+        known_clients_max_age: typing.Optional[float] = None,
+        known_clients_max_count: typing.Optional[int] = None,
+        sweep_interval: float = 60,
     ):
+        """Create the hook sending the preprocessed messages to Zabbix Trapper items.
+
+        A bundle of measurements is sent once `measurement_bundle_wait_time` has
+        elapsed or once it reaches `max_bundle_items` measurements or approximately
+        `max_bundle_bytes` bytes, whatever comes first. Larger bundles, e.g. when many
+        parked measurements are released at once, are split into several requests
+        within the same limits.
+
+        The discoveries and measurements are sent by background tasks, which must be
+        started with `start`, such that `send` never waits for Zabbix.
+
+        Discoveries that cannot be sent are queued and retried before the following
+        bundles. The measurements of their clients are held back until the discovery
+        has been sent and Zabbix has been given the discovery wait time again.
+
+        Bundles that cannot be sent are retried from memory, or from the measurement
+        spool if given. The spool is drained oldest first at `spool_drain_rate`
+        bundles per second once Zabbix is reachable again, while new bundles are
+        sent right away. Retries wait for at least the `retry_after` of the sender,
+        e.g. a CircuitBreaker, if it has one.
+
+        The known clients are restored from the snapshot at `known_clients_path` if
+        given, so clients are not discovered again after a restart. The snapshot is
+        saved at most every `snapshot_interval` seconds as clients become known, and
+        when the hook is closed.
+
+        With a `discovery_debounce` the discovery of new clients is delayed and
+        coalesced per host and process, such that a burst of new clients is
+        discovered by a single request, and their measurements are released
+        together.
+
+        Known clients not seen within `known_clients_max_age` are swept every
+        `sweep_interval` seconds in bounded batches, and the least recently seen
+        client of a process is forgotten once it exceeds `known_clients_max_count`
+        clients. Forgotten clients are left out of the following discoveries, so
+        Zabbix treats them as lost resources of the discovery rule, and they are
+        discovered again if they reappear.
+
+        :param sender: The sender of the requests to Zabbix.
+        :param client_discovery_wait_time: The time it takes Zabbix to discover a
+                                           client.
+        :param measurement_bundle_wait_time: The maximum time measurements are bundled
+                                             before being sent to Zabbix.
+        :param known_clients_store: Optional store of known clients shared between
+                                    worker processes.
+        :param max_bundle_items: The maximum number of measurements in a request.
+        :param max_bundle_bytes: The approximate maximum size of a request in bytes.
+        :param measurement_spool: Optional spool persisting the bundles that could
+                                  not be sent.
+        :param spool_drain_rate: The maximum number of spooled bundles sent per
+                                 second.
+        :param known_clients_path: Optional path of the snapshot of known clients.
+        :param snapshot_interval: The minimum time in seconds between snapshots.
+        :param discovery_debounce: The time in seconds new clients of a host and
+                                   process are collected before they are discovered.
+                                   0 discovers every new client right away.
+        :param known_clients_max_age: Optional time in seconds after which a known
+                                      client that has not been seen is forgotten.
+        :param known_clients_max_count: Optional maximum number of known clients per
+                                        process.
+        :param sweep_interval: The time in seconds between sweeps of the stale known
+                               clients.
+        """
         super().__init__()
         self._sender = sender
         self._client_discovery_wait_time = client_discovery_wait_time
-        self._known_clients = known_clients.KnownClients(client_discovery_wait_time)
+        self._discovery_debounce = discovery_debounce
+        # Clients are assumed discovered once both the debounce and the wait time
+        # has elapsed since they became known
+        self._known_clients = known_clients.KnownClients(
+            client_discovery_wait_time + discovery_debounce,
+            known_clients_store,
+            max_age=known_clients_max_age,
+            max_clients=known_clients_max_count,
+        )
+        self._sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
         self._measurement_bundle_wait_time = measurement_bundle_wait_time
-        self._is_bundling_measurements = False
+        self._max_bundle_items = max_bundle_items
+        self._max_bundle_bytes = max_bundle_bytes
+        self._task_group: typing.Optional[anyio.abc.TaskGroup] = None
+        self._bundle_idle_scope: typing.Optional[anyio.CancelScope] = None
+        self._bundle_sleep_scope: typing.Optional[anyio.CancelScope] = None
+        self._is_sending_bundle = False
         self._measurements = asyncio_zabbix_sender.Measurements()
+        self._measurements_size = 0
+        self._spool = measurement_spool
+        self._spool_drain_interval = 1 / spool_drain_rate
+        self._spool_idle_scope: typing.Optional[anyio.CancelScope] = None
+        self._queued_discoveries: typing.Dict[_DiscoveryKey, domain.LogRecord] = {}
+        # New clients of a host and process until their discovery has been sent
+        self._undiscovered: typing.Dict[_DiscoveryKey, typing.Set[domain.MAC]] = {}
+        self._scheduled_discoveries: typing.Dict[
+            _DiscoveryKey, typing.Tuple[float, domain.LogRecord]
+        ] = {}
+        self._sending_discoveries = 0
+        self._known_clients_path = known_clients_path
+        self._snapshot_interval = snapshot_interval
+        self._last_snapshot = time.monotonic()
+        if known_clients_path is not None:
+            self._restore_known_clients(known_clients_path)
+        self._pending: typing.Dict[
+            _PendingKey, typing.List[asyncio_zabbix_sender.Measurement]
+        ] = {}
+        self._pending_deadlines: typing.List[
+            typing.Tuple[float, int, _ScheduledKey]
+        ] = []
+        self._pending_sequence = itertools.count()
+        self._pending_sleep_scope: typing.Optional[anyio.CancelScope] = None
+        # Parked measurements without a deadline, as their discovery is queued
+        self._held: typing.Set[_PendingKey] = set()
+        # Parked measurements released no earlier than a restarted discovery wait
+        self._deferred_releases: typing.Dict[_PendingKey, float] = {}
+        self._progress: typing.Optional[anyio.Event] = None
+
+    @property
+    def pending_clients(self) -> int:
+        """The number of clients with measurements waiting for discovery."""
+        return len(self._pending)
+
+    def _restore_known_clients(self, path: pathlib.Path) -> None:
+        try:
+            snapshot = path.read_bytes()
+        except FileNotFoundError:
+            return
+        try:
+            restored = self._known_clients.restore(snapshot)
+        except ValueError as error:
+            logging.logger.warning(
+                "Ignoring snapshot of known clients %s: %s", path, error
+            )
+            return
+        logging.logger.info("Restored %d known clients from %s", restored, path)
+
+    async def _save_known_clients(self, force: bool = False) -> None:
+        """Save the snapshot of known clients if clients became known since the last.
+
+        The clients whose discovery is queued or scheduled are left out of the
+        snapshot, as they are not yet known by Zabbix.
+
+        :param force: True to save regardless of the snapshot interval.
+        """
+        if self._known_clients_path is None or not self._known_clients.is_changed:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_snapshot < self._snapshot_interval:
+            return
+        self._last_snapshot = now
+        excluded: typing.Dict[str, typing.Set[domain.MAC]] = {}
+        for (_, process), clients in self._undiscovered.items():
+            excluded.setdefault(process, set()).update(clients)
+        snapshot = self._known_clients.snapshot(excluded)
+        await anyio.to_thread.run_sync(
+            known_clients.write_snapshot, self._known_clients_path, snapshot
+        )
+        logging.logger.debug("Saved snapshot of known clients")
+
+    async def aclose(self) -> None:
+        """Save the snapshot of known clients and close the measurement spool."""
+        await self._save_known_clients(force=True)
+        if self._spool is not None:
+            self._spool.close()
+
+    def start(self, task_group: anyio.abc.TaskGroup) -> None:
+        """Start the scheduler, the bundler and the spool drainer of the hook.
+
+        :param task_group: The task group the background tasks are started in.
+        """
+        self._task_group = task_group
+        task_group.start_soon(self._run_scheduler)
+        task_group.start_soon(self._run_bundler)
+        if self._spool is not None:
+            task_group.start_soon(self._run_spool_drainer)
+
+    async def flush(self) -> None:
+        """Wait until the scheduled discoveries and measurements have been sent.
+
+        Discoveries and measurements that cannot be sent are retried, so this waits
+        until Zabbix has received them or the measurements are spooled. The hook must
+        be started.
+        """
+        while self._is_busy():
+            if self._progress is None or self._progress.is_set():
+                self._progress = anyio.Event()
+            await self._progress.wait()
+
+    def _is_busy(self) -> bool:
+        return bool(
+            self._pending_deadlines
+            or self._pending
+            or self._queued_discoveries
+            or len(self._measurements) > 0
+            or self._is_sending_bundle
+            or self._sending_discoveries > 0
+        )
+
+    def _notify_progress(self) -> None:
+        """Wake the flushing processes such that they check whether all is sent."""
+        if self._progress is not None:
+            self._progress.set()
+
+    def accepts_unprocessed(self, process: str) -> bool:
+        """Zabbix Trapper items only exist for preprocessed messages."""
+        return False
 
     async def send(
         self, record: domain.LogRecord, message: typing.Optional[domain.Message]
     ) -> None:
         """Send the preprocessed message to the corresponding Zabbix Trapper item(s).
 
-        For client messages a low-level discovery will be sent first and the
-        corresponding Zabbix Trapper item(s) will be delayed until Zabbix have been
-        given time to synchronize caches.
+        For client messages a low-level discovery will be scheduled first and the
+        corresponding Zabbix Trapper item(s) will be parked until Zabbix have been
+        given time to synchronize caches. Otherwise, the measurements are added to
+        the bundle. Nothing is sent to Zabbix by this method itself.
 
         If the message is None, then this method returns immediately.
 
@@ -51,8 +331,14 @@ class ZabbixTrapper(abc.Hook):
         """
         if message is None:
             return
+        assert record.process is not None
         seconds_until_discovered = await self.discover_client(record, message)
-        if seconds_until_discovered > 0:
+        key = (record.hostname, record.process, message.mac_address)
+        if (
+            seconds_until_discovered > 0
+            or key in self._pending
+            or self._is_awaiting_discovery(key)
+        ):
             # Allow the Zabbix server(s) to discover and create prototype items
             logging.logger.debug(
                 "Pending discovery event of %s on %s. Waiting %f seconds",
@@ -60,12 +346,131 @@ class ZabbixTrapper(abc.Hook):
                 record.process,
                 seconds_until_discovered,
             )
-            await anyio.sleep(seconds_until_discovered)
+            self._park(key, record, message, seconds_until_discovered)
+            return
+
+        self._add_measurements(mapper.map_client_message(record, message))
+
+    def _park(
+        self,
+        key: _PendingKey,
+        record: domain.LogRecord,
+        message: domain.Message,
+        seconds_until_discovered: float,
+    ) -> None:
+        """Park the measurements of a message until the client has been discovered.
+
+        :param key: The host, process and mac address the measurements belong to.
+        :param record: The log record containing hostname, process name and timestamp.
+        :param message: The message containing the mac address.
+        :param seconds_until_discovered: The remaining discovery wait time.
+        """
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = []
+            if self._is_awaiting_discovery(key):
+                self._held.add(key)
+            else:
+                self._schedule(anyio.current_time() + seconds_until_discovered, key)
+        pending.extend(mapper.map_client_message(record, message))
+        _PENDING_CLIENTS.set(len(self._pending))
+
+    def _schedule(self, deadline: float, key: _ScheduledKey) -> None:
+        """Schedule the release of parked measurements or the send of a discovery.
+
+        :param deadline: The time of the release or send.
+        :param key: The parked measurements or discovery.
+        """
+        is_earliest = (
+            len(self._pending_deadlines) == 0
+            or deadline < self._pending_deadlines[0][0]
+        )
+        heapq.heappush(
+            self._pending_deadlines, (deadline, next(self._pending_sequence), key)
+        )
+        if is_earliest and self._pending_sleep_scope is not None:
+            # Wake the scheduler such that it sleeps until the new deadline
+            self._pending_sleep_scope.cancel()
+
+    async def _run_scheduler(self) -> None:
+        """Send the debounced discoveries and release the parked measurements.
+
+        Sleeps until the earliest deadline, or until something is scheduled, and then
+        handles every deadline that is reached. A single task serves every pending
+        client, and the discoveries are sent by separate tasks such that a slow
+        Zabbix server never delays the release of measurements.
+        """
+        assert self._task_group is not None
+        while True:
+            with anyio.CancelScope() as sleep_scope:
+                self._pending_sleep_scope = sleep_scope
+                if self._pending_deadlines:
+                    deadline = self._pending_deadlines[0][0]
+                    await anyio.sleep(deadline - anyio.current_time())
+                else:
+                    await anyio.sleep_forever()
+            self._pending_sleep_scope = None
+            if sleep_scope.cancelled_caught:
+                # An earlier deadline was added while sleeping
+                continue
+
+            # The earliest deadline is reached, and so might others be
+            now = anyio.current_time()
+            while self._pending_deadlines and self._pending_deadlines[0][0] <= now:
+                _, _, key = heapq.heappop(self._pending_deadlines)
+                if len(key) == 2:
+                    self._sending_discoveries += 1
+                    self._task_group.start_soon(self._send_scheduled_discovery, key)
+                else:
+                    self._release(typing.cast(_PendingKey, key))
+            self._notify_progress()
+
+    def _release(self, key: _PendingKey) -> None:
+        if self._is_awaiting_discovery(key):
+            # Hold the measurements until the queued discovery has been sent
+            self._held.add(key)
+            return
+        deferred_release = self._deferred_releases.pop(key, None)
+        if deferred_release is not None and deferred_release > anyio.current_time():
+            self._schedule(deferred_release, key)
+            return
+        self._add_measurements(self._pending.pop(key))
+        _PENDING_CLIENTS.set(len(self._pending))
 
-        for measurement in mapper.map_client_message(record, message):
+    def _is_awaiting_discovery(self, key: _PendingKey) -> bool:
+        """Whether the client is new and the discovery of it is queued.
+
+        :param key: The host, process and mac address of the client.
+        """
+        if not self._queued_discoveries:
+            return False
+        hostname, process, mac_address = key
+        return (hostname, process) in self._queued_discoveries and (
+            mac_address in self._undiscovered.get((hostname, process), ())
+        )
+
+    def _add_measurements(
+        self, measurements: typing.Iterable[asyncio_zabbix_sender.Measurement]
+    ) -> None:
+        """Add the measurements to the bundle and flush it early once it is full.
+
+        :param measurements: The measurements to be sent with the next bundle.
+        """
+        for measurement in measurements:
             self._measurements.add_measurement(measurement)
+            self._measurements_size += _measurement_size(measurement)
+        if self._bundle_idle_scope is not None:
+            # Wake the bundler such that it starts the bundle timer
+            self._bundle_idle_scope.cancel()
+        if self._is_bundle_full() and self._bundle_sleep_scope is not None:
+            # Wake the bundler such that it sends the bundle right away
+            self._bundle_sleep_scope.cancel()
 
-        await self._start_bundling()
+    def _is_bundle_full(self) -> bool:
+        return (
+            len(self._measurements) >= self._max_bundle_items
+            or self._measurements_size >= self._max_bundle_bytes
+        )
 
     async def discover_client(
         self, record: domain.LogRecord, message: domain.Message
@@ -77,7 +482,7 @@ class ZabbixTrapper(abc.Hook):
         2) The client have recently been discovered
         3) The client have been discovered for a long time
 
-        A discovery packet will only be sent to Zabbix in the first case and the callee
+        A discovery packet will only be scheduled in the first case and the callee
         will be instructed to wait for the full default_wait_time period before sending
         the actual data to Zabbix. This ensures that the Zabbix Trapper process is aware
         of the (newly created) item prototype(s).
@@ -93,6 +498,7 @@ class ZabbixTrapper(abc.Hook):
         :param message: The message containing the mac address.
         """
         assert record.process is not None
+        self._sweep_known_clients()
         if self._known_clients.is_client_known(record.process, message.mac_address):
             # MAC address is already known, so no need to rediscover it,
             # but we might need to wait in the case that the discovery were just sent
@@ -100,52 +506,337 @@ class ZabbixTrapper(abc.Hook):
                 record.process, message.mac_address
             )
         # Mark client as known
-        self._known_clients.add_client(record.process, message.mac_address)
+        if not self._known_clients.add_client(record.process, message.mac_address):
+            # Another worker process discovered the client in the meantime
+            return self._known_clients.remaining_wait_time(
+                record.process, message.mac_address
+            )
+
+        # Discover the client together with the other new clients of the window
+        discovery_key = (record.hostname, record.process)
+        undiscovered = self._undiscovered.setdefault(discovery_key, set())
+        undiscovered.add(message.mac_address)
+        remaining_debounce = self._schedule_discovery(record)
+        return remaining_debounce + self._client_discovery_wait_time
+
+    def _schedule_discovery(self, record: domain.LogRecord) -> float:
+        """Schedule the discovery of the new clients of the host and process.
+
+        :param record: The log record containing hostname and process name.
+        :return: The time in seconds until the discovery will be sent.
+        """
+        assert record.process is not None
+        key = (record.hostname, record.process)
+        now = anyio.current_time()
+        scheduled = self._scheduled_discoveries.get(key)
+        if scheduled is None:
+            discovered_at = now + self._discovery_debounce
+            self._schedule(discovered_at, key)
+        else:
+            discovered_at = scheduled[0]
+        self._scheduled_discoveries[key] = (discovered_at, record)
+        return discovered_at - now
+
+    async def _send_scheduled_discovery(self, key: _DiscoveryKey) -> None:
+        try:
+            _, record = self._scheduled_discoveries.pop(key)
+            await self._discover(record)
+        finally:
+            self._sending_discoveries -= 1
+            self._notify_progress()
+
+    async def _discover(self, record: domain.LogRecord) -> None:
+        """Send the discovery of the host and process, queueing it on errors.
+
+        :param record: The log record containing hostname and process name.
+        """
+        assert record.process is not None
+        key = (record.hostname, record.process)
+        clients = self._undiscovered.pop(key, set())
+        try:
+            is_processed = await self._send_discovery(record)
+        except ConnectionError as connection_error:
+            # Do not hold up the message, but retry the discovery with the next bundle
+            logging.logger.warning(
+                "Discovery on %s of %s queued. Connection error to Zabbix server: %r",
+                record.hostname,
+                record.process,
+                connection_error,
+            )
+            self._undiscovered.setdefault(key, set()).update(clients)
+            self._queued_discoveries[key] = record
+            _QUEUED_DISCOVERIES.set(len(self._queued_discoveries))
+            if self._bundle_idle_scope is not None:
+                # Wake the bundler such that it retries the discovery
+                self._bundle_idle_scope.cancel()
+        else:
+            if is_processed:
+                self._restart_discovery_wait(key, clients)
+            else:
+                # Zabbix will not create the items, so there is nothing to wait for
+                self._restart_discovery_wait(key, clients, 0)
+        await self._save_known_clients()
+
+    def _sweep_known_clients(self) -> None:
+        """Evict a batch of stale known clients once the sweep interval has elapsed.
+
+        A sweep that fills its batch is continued on the next call, so large numbers
+        of stale clients are evicted incrementally.
+        """
+        now = time.monotonic()
+        if now - self._last_sweep < self._sweep_interval:
+            return
+        evicted = self._known_clients.evict_stale(_SWEEP_BATCH)
+        if evicted > 0:
+            logging.logger.info("Forgot %d stale known clients", evicted)
+        if evicted < _SWEEP_BATCH:
+            self._last_sweep = now
+
+    async def _send_discovery(self, record: domain.LogRecord) -> bool:
+        """Send the discovery of every known client of the host and process.
 
+        :param record: The log record containing hostname and process name.
+        :return: True if Zabbix processed the discovery.
+        """
         measurements = mapper.map_client_discovery(record, self._known_clients)
 
         logging.logger.info("Discovering: %r", measurements)
+        started = time.perf_counter()
         response = await self._sender.send(measurements)
+        _SEND_SECONDS.labels("discovery").observe(time.perf_counter() - started)
         logging.logger.info("Response: %r", response)
-        assert response.processed == 1, response
-        return self._client_discovery_wait_time
+        if response.failed:
+            logging.logger.warning(
+                "Discovery on %s of %s failed: %r",
+                record.hostname,
+                record.process,
+                response,
+            )
+            return False
+        return True
 
-    async def _start_bundling(self):
-        """Ensure that bundling of measurements has started.
+    async def _send_queued_discoveries(self) -> None:
+        """Send the discoveries that previously failed, stopping at the first error.
+
+        Once a queued discovery is sent, Zabbix is given the discovery wait time
+        again before the measurements of its new clients are sent, as Zabbix rejects
+        the measurements of items it has not created yet.
+        """
+        for key, record in list(self._queued_discoveries.items()):
+            clients = self._undiscovered.pop(key, set())
+            try:
+                is_processed = await self._send_discovery(record)
+            except ConnectionError:
+                self._undiscovered.setdefault(key, set()).update(clients)
+                return
+            if self._queued_discoveries.get(key) is record:
+                del self._queued_discoveries[key]
+            _QUEUED_DISCOVERIES.set(len(self._queued_discoveries))
+            if is_processed:
+                self._restart_discovery_wait(key, clients)
+            else:
+                # Zabbix will not create the items, so there is nothing to wait for
+                self._restart_discovery_wait(key, clients, 0)
+
+    def _restart_discovery_wait(
+        self,
+        key: _DiscoveryKey,
+        clients: typing.Iterable[domain.MAC],
+        wait_time: typing.Optional[float] = None,
+    ) -> None:
+        """Restart the discovery wait time of clients whose discovery has been sent.
 
-        If another process already started the bundling of measurements, then nothing
-        further is done. Otherwise, this will take responsibility of both bundling the
-        measurements and sending the measurements to Zabbix after the
-        `measurement_bundle_wait_time` has elapsed.
+        The parked and held measurements of the clients are released once the wait
+        time has elapsed.
 
-        If the sending of measurements fails, then the process is retried indefinitely.
+        :param key: The host and process of the discovery.
+        :param clients: The new clients of the discovery.
+        :param wait_time: The time it takes Zabbix to discover the clients. Defaults
+                          to the client discovery wait time.
         """
-        if self._is_bundling_measurements:
-            # This process is done and have handed over the responsibility to send the
-            # measurements to another process
-            return
+        if wait_time is None:
+            wait_time = self._client_discovery_wait_time
+        hostname, process = key
+        deadline = anyio.current_time() + wait_time
+        for mac_address in clients:
+            self._known_clients.restart_wait_time(process, mac_address, wait_time)
+            pending_key = (hostname, process, mac_address)
+            if pending_key in self._held:
+                self._held.remove(pending_key)
+                self._schedule(deadline, pending_key)
+            elif pending_key in self._pending:
+                self._deferred_releases[pending_key] = deadline
 
-            # Allow other processes to add measurements while this process sleeps
-        self._is_bundling_measurements = True
-        await anyio.sleep(self._measurement_bundle_wait_time)
+    def _retry_delay(self) -> float:
+        """The time to wait before retrying a failed request."""
+        return max(
+            self._measurement_bundle_wait_time,
+            getattr(self._sender, "retry_after", 0.0),
+        )
 
-        # Get the measurements and prepare an empty measurement container
-        # Once control is handed back to this process we have control of the
-        # measurements until the next await statement
-        self._is_bundling_measurements = False
-        measurements = self._measurements
-        self._measurements = asyncio_zabbix_sender.Measurements()
+    async def _run_bundler(self) -> None:
+        """Bundle the measurements and send them to Zabbix.
+
+        Sleeps until the first measurement is added to the bundle, and then sends
+        the bundle once the `measurement_bundle_wait_time` has elapsed or the bundle
+        is full. A bundle is sent while the next is being filled. Queued discoveries
+        are retried by sending a bundle, even an empty one. After a failed bundle the
+        retry delay is waited out instead of the bundle timer, even if the bundle is
+        full.
+        """
+        is_retry = False
+        while True:
+            with anyio.CancelScope() as idle_scope:
+                self._bundle_idle_scope = idle_scope
+                if len(self._measurements) == 0 and not self._queued_discoveries:
+                    await anyio.sleep_forever()
+            self._bundle_idle_scope = None
+
+            trigger = "timer" if is_retry else "size"
+            with anyio.CancelScope() as sleep_scope:
+                self._bundle_sleep_scope = sleep_scope
+                if not is_retry and not self._is_bundle_full():
+                    await anyio.sleep(self._measurement_bundle_wait_time)
+                    trigger = "timer"
+            self._bundle_sleep_scope = None
+
+            # Get the measurements and prepare an empty measurement container
+            measurements = list(self._measurements)
+            self._measurements = asyncio_zabbix_sender.Measurements()
+            self._measurements_size = 0
+            self._is_sending_bundle = True
+            try:
+                is_retry = not await self._send_bundle(measurements, trigger)
+            finally:
+                self._is_sending_bundle = False
+                self._notify_progress()
+            if is_retry:
+                await anyio.sleep(self._retry_delay())
+
+    async def _send_bundle(
+        self, measurements: typing.List[asyncio_zabbix_sender.Measurement], trigger: str
+    ) -> bool:
+        """Send a bundle of measurements to Zabbix.
 
+        If the sending of measurements fails, then the measurements are spooled or
+        added to the next bundle to be retried indefinitely.
+
+        :param measurements: The measurements of the bundle.
+        :param trigger: The reason the bundle is sent, i.e. "timer" or "size".
+        :return: False if measurements were added to the next bundle or discoveries
+                 are still queued to be retried.
+        """
+        _FLUSHES.labels(trigger).inc()
+        if self._queued_discoveries:
+            # Discoveries must precede the measurements of the discovered clients
+            await self._send_queued_discoveries()
+
+        # The requests are sent concurrently, bounded by the sender
+        failed: typing.List[asyncio_zabbix_sender.Measurements] = []
+        async with anyio.create_task_group() as task_group:
+            for chunk in self._split(measurements):
+                task_group.start_soon(self._send_chunk, chunk, failed)
+        if failed and self._spool is not None:
+            # Persist the failed measurements and retry from the spool
+            for chunk in failed:
+                await self._spool.append(chunk)
+            if self._spool_idle_scope is not None:
+                self._spool_idle_scope.cancel()
+        elif failed:
+            # Add the failed measurements to the next bundle
+            for chunk in failed:
+                self._add_measurements(chunk)
+            return False
+        return not self._queued_discoveries
+
+    async def _run_spool_drainer(self) -> None:
+        """Drain the measurement spool whenever bundles are spooled."""
+        assert self._spool is not None
+        while True:
+            with anyio.CancelScope() as idle_scope:
+                self._spool_idle_scope = idle_scope
+                if len(self._spool) == 0:
+                    await anyio.sleep_forever()
+            self._spool_idle_scope = None
+            await self._drain_spool()
+
+    async def _drain_spool(self) -> None:
+        """Send the spooled bundles, oldest first.
+
+        The spooled bundles are sent at the drain rate until the spool is empty. A
+        bundle is only removed from the spool once Zabbix has received it, and it is
+        retried after the retry delay on connection errors.
+        """
+        assert self._spool is not None
+        while True:
+            spooled = await self._spool.peek()
+            if spooled is None:
+                return
+            identifier, measurements = spooled
+            try:
+                logging.logger.info("Sending spooled data: %r", measurements)
+                started = time.perf_counter()
+                response = await self._sender.send(measurements)
+                _SEND_SECONDS.labels("spool").observe(time.perf_counter() - started)
+                logging.logger.info("Response: %r", response)
+            except ConnectionError as connection_error:
+                _SEND_FAILURES.inc()
+                logging.logger.warning(
+                    "Connection error to Zabbix server: %r", connection_error
+                )
+                await anyio.sleep(self._retry_delay())
+                continue
+            await self._spool.remove(identifier)
+            await anyio.sleep(self._spool_drain_interval)
+
+    async def _send_chunk(
+        self,
+        chunk: asyncio_zabbix_sender.Measurements,
+        failed: typing.List[asyncio_zabbix_sender.Measurements],
+    ) -> None:
+        """Send a single request of measurements.
+
+        :param chunk: The measurements of the request.
+        :param failed: The requests that failed, which the chunk is added to on
+                       connection errors.
+        """
         try:
-            logging.logger.info("Sending data: %r", measurements)
-            response = await self._sender.send(measurements)
+            logging.logger.info("Sending data: %r", chunk)
+            _BUNDLE_SIZE.observe(len(chunk))
+            started = time.perf_counter()
+            response = await self._sender.send(chunk)
+            _SEND_SECONDS.labels("measurements").observe(time.perf_counter() - started)
             logging.logger.info("Response: %r", response)
         except ConnectionError as connection_error:
+            _SEND_FAILURES.inc()
             logging.logger.warning(
                 "Connection error to Zabbix server: %r",
                 connection_error
             )
-            # Add the failed measurements and retry
-            for measurement in measurements:
-                self._measurements.add_measurement(measurement)
-            await self._start_bundling()
+            failed.append(chunk)
+
+    def _split(
+        self, measurements: typing.List[asyncio_zabbix_sender.Measurement]
+    ) -> typing.List[asyncio_zabbix_sender.Measurements]:
+        """Split the measurements into requests within the bundle limits.
+
+        :param measurements: The measurements to be sent.
+        :return: The requests in the order of the measurements.
+        """
+        chunks = []
+        chunk: typing.List[asyncio_zabbix_sender.Measurement] = []
+        chunk_size = 0
+        for measurement in measurements:
+            size = _measurement_size(measurement)
+            if chunk and (
+                len(chunk) >= self._max_bundle_items
+                or chunk_size + size > self._max_bundle_bytes
+            ):
+                chunks.append(asyncio_zabbix_sender.Measurements(chunk))
+                chunk = []
+                chunk_size = 0
+            chunk.append(measurement)
+            chunk_size += size
+        if chunk:
+            chunks.append(asyncio_zabbix_sender.Measurements(chunk))
+        return chunks
@@ -11,42 +11,269 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import time
 import typing
 
+import anyio
+import anyio.abc
+
 import router_log_preprocessor.domain as domain
 import router_log_preprocessor.hooks.abc
+import router_log_preprocessor.log_server.tracing as tracing
 import router_log_preprocessor.preprocessors.typing as preprocessors_typing
 import router_log_preprocessor.settings
 import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
 import router_log_preprocessor.util.rfc3164_parser
 
+_Item = typing.TypeVar("_Item")
+
+# Upper bound on the number of remembered routing decisions
+_MAX_ROUTES = 1024
+
+_PARSE_FAILURES = metrics.registry.counter(
+    "rlp_parse_failures_total", "Received logs that could not be parsed."
+)
+_DISCARDED = metrics.registry.counter(
+    "rlp_datagrams_discarded_total",
+    "Received logs discarded before parsing as no preprocessor or hook wants them.",
+)
+_PREPROCESS_SECONDS = metrics.registry.histogram(
+    "rlp_preprocess_seconds",
+    "Time spent preprocessing a record by process.",
+    ("process",),
+)
+
 
 class LogHandler:
     def __init__(
         self,
         preprocessors: typing.Mapping[str, preprocessors_typing.Preprocessor],
         hooks: typing.Sequence[router_log_preprocessor.hooks.abc.Hook],
+        parser: router_log_preprocessor.settings.LogParser = (
+            router_log_preprocessor.settings.LogParser.REGEX
+        ),
+        echo: bool = True,
+        tracer: typing.Optional[tracing.StageTracer] = None,
     ):
         self._preprocessors = preprocessors
+        self._echo = echo
+        self._tracer = tracer
         self._hooks = hooks
+        self._use_bytes_parser = (
+            parser is router_log_preprocessor.settings.LogParser.BYTES
+        )
+        # Routing decision per process name peeked from the raw packets
+        self._routes: typing.Dict[bytes, bool] = {}
+        self.discarded = 0
         logging.logger.info("Log handler is ready")
 
+    def start(self, task_group: anyio.abc.TaskGroup) -> None:
+        """Start the background tasks of every hook.
+
+        :param task_group: The task group the background tasks are started in.
+        """
+        for hook in self._hooks:
+            hook.start(task_group)
+
+    async def flush(self) -> None:
+        """Wait until every hook has sent the records handled so far."""
+        for hook in self._hooks:
+            await hook.flush()
+
+    async def aclose(self) -> None:
+        """Close every hook, e.g. when the log server shuts down."""
+        for hook in self._hooks:
+            await hook.aclose()
+
+    async def handle_batch(
+        self, batch: typing.Sequence[typing.Tuple[bytes, str, int]]
+    ) -> None:
+        """Handle a batch of datagrams received in one go.
+
+        The records are preprocessed in order and handed to the hooks concurrently,
+        such that a hook waiting on one record does not hold up the rest of the
+        batch. A datagram that cannot be handled is logged and does not prevent the
+        rest of the batch from being handled.
+
+        :param batch: The received datagrams as (packet, host, port) tuples.
+        """
+        packets: typing.List[bytes] = []
+        entries: typing.List[str] = []
+        traces: typing.List[typing.Optional[tracing.Trace]] = []
+        for packet, host, port in batch:
+            trace = None if self._tracer is None else self._tracer.trace()
+            if self._echo:
+                logging.echo_logger.debug(packet, extra={"host": host, "port": port})
+                if trace is not None:
+                    trace.mark("echo")
+            if not self._is_routed(packet):
+                continue
+            if trace is not None:
+                trace.mark("route")
+            if self._use_bytes_parser:
+                packets.append(packet)
+            else:
+                try:
+                    entries.append(packet.decode("ascii"))
+                except UnicodeDecodeError as exception:
+                    _log_parse_error(packet, exception)
+                    continue
+                if trace is not None:
+                    trace.mark("decode")
+            traces.append(trace)
+
+        records: typing.Iterator[domain.LogRecord]
+        traced: _Traced[typing.Any]
+        if self._use_bytes_parser:
+            traced = _Traced(packets, traces)
+            records = router_log_preprocessor.util.rfc3164_parser.parse_bytes_batch(
+                traced, on_error=_log_parse_error, use_bytes_parser=True
+            )
+        else:
+            traced = _Traced(entries, traces)
+            records = router_log_preprocessor.util.rfc3164_parser.parse_many(
+                traced, on_error=_log_parse_error
+            )
+        async with anyio.create_task_group() as task_group:
+            for record in records:
+                # The parser yields a record right after taking its datagram
+                trace = traced.trace
+                if trace is not None:
+                    trace.mark("parse")
+                try:
+                    message = self._preprocess(record, trace)
+                except Exception:
+                    logging.logger.exception("Failed to handle record: %r", record)
+                    continue
+                task_group.start_soon(self._dispatch, record, message, trace)
+
     async def handle(self, packet: bytes, host: str, port: int) -> None:
         # The packet is a single log entry encoded in ascii according to RFC3164
-        entry = packet.decode("ascii")
-        logging.echo_logger.debug(entry.strip())
+        trace = None if self._tracer is None else self._tracer.trace()
+        if self._echo:
+            logging.echo_logger.debug(packet, extra={"host": host, "port": port})
+            if trace is not None:
+                trace.mark("echo")
+        try:
+            if self._use_bytes_parser:
+                if not self._is_routed(packet):
+                    return
+                if trace is not None:
+                    trace.mark("route")
+                record = router_log_preprocessor.util.rfc3164_parser.parse_bytes(packet)
+            else:
+                entry = packet.decode("ascii")
+                if trace is not None:
+                    trace.mark("decode")
+                if not self._is_routed(packet):
+                    return
+                if trace is not None:
+                    trace.mark("route")
+                record = router_log_preprocessor.util.rfc3164_parser.parse(entry)
+        except (RuntimeError, ValueError, KeyError):
+            _PARSE_FAILURES.inc()
+            raise
+        if trace is not None:
+            trace.mark("parse")
 
-        # Parse the log record
-        record = router_log_preprocessor.util.rfc3164_parser.parse(entry)
+        message = self._preprocess(record, trace)
+        await self._send_to_hooks(record, message, trace)
 
-        # Pre-process the record
+    def _is_routed(self, packet: bytes) -> bool:
+        """Decide from the TAG of the packet alone whether the record is wanted by a
+        preprocessor or a hook. Unwanted records are counted as discarded.
+
+        :param packet: A single ascii encoded log record.
+        :return: True if the record must be parsed and handled.
+        """
+        process = router_log_preprocessor.util.rfc3164_parser.peek_process(packet)
+        if process is None:
+            # Uncommon layout, so leave the decision to the parser
+            return True
+        is_routed = self._routes.get(process)
+        if is_routed is None:
+            name = process.decode("ascii")
+            is_routed = name in self._preprocessors or any(
+                hook.accepts_unprocessed(name) for hook in self._hooks
+            )
+            if len(self._routes) < _MAX_ROUTES:
+                self._routes[process] = is_routed
+        if not is_routed:
+            self.discarded += 1
+            _DISCARDED.inc()
+        return is_routed
+
+    def _preprocess(
+        self, record: domain.LogRecord, trace: typing.Optional[tracing.Trace] = None
+    ) -> typing.Optional[domain.Message]:
         preprocessor: typing.Optional[preprocessors_typing.Preprocessor] = None
         message: typing.Optional[domain.Message] = None
-        if record.process is not None:
-            preprocessor = self._preprocessors.get(record.process)
-        if preprocessor is not None:
-            message = preprocessor(record)
+        process = record.process
+        if process is not None:
+            preprocessor = self._preprocessors.get(process)
+            if preprocessor is not None:
+                started = time.perf_counter()
+                message = preprocessor(record)
+                _PREPROCESS_SECONDS.labels(process).observe(
+                    time.perf_counter() - started
+                )
+                if trace is not None:
+                    trace.mark("preprocess", process)
+        return message
 
-        # Act
+    async def _send_to_hooks(
+        self,
+        record: domain.LogRecord,
+        message: typing.Optional[domain.Message],
+        trace: typing.Optional[tracing.Trace] = None,
+    ) -> None:
         for hook in self._hooks:
             await hook.send(record, message)
+            if trace is not None:
+                trace.mark("hook", type(hook).__name__)
+        if trace is not None:
+            trace.finish(record)
+
+    async def _dispatch(
+        self,
+        record: domain.LogRecord,
+        message: typing.Optional[domain.Message],
+        trace: typing.Optional[tracing.Trace],
+    ) -> None:
+        if trace is not None:
+            # Leave out the time spent on the rest of the batch before this task ran
+            trace.restart()
+        try:
+            await self._send_to_hooks(record, message, trace)
+        except Exception:
+            logging.logger.exception("Failed to handle record: %r", record)
+
+
+class _Traced(typing.Generic[_Item]):
+    """Iterator of the items handed to a parser, which remembers the trace of the
+    item taken last. The trace is restarted when its item is taken, so the parse
+    stage does not include the time spent on the other items of the batch.
+    """
+
+    def __init__(
+        self,
+        items: typing.Sequence[_Item],
+        traces: typing.Sequence[typing.Optional[tracing.Trace]],
+    ) -> None:
+        self._items = zip(items, traces)
+        self.trace: typing.Optional[tracing.Trace] = None
+
+    def __iter__(self) -> "_Traced[_Item]":
+        return self
+
+    def __next__(self) -> _Item:
+        item, self.trace = next(self._items)
+        if self.trace is not None:
+            self.trace.restart()
+        return item
+
+
+def _log_parse_error(entry: typing.Union[str, bytes], exception: Exception) -> None:
+    _PARSE_FAILURES.inc()
+    logging.logger.warning("Could not parse log entry %r: %r", entry, exception)
@@ -0,0 +1,203 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import collections
+import dataclasses
+import typing
+
+import anyio
+import anyio.abc
+
+import router_log_preprocessor.settings
+import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
+
+Datagram = typing.Tuple[bytes, str, int]
+DatagramBatchHandler = typing.Callable[
+    [typing.Sequence[Datagram]], typing.Awaitable[None]
+]
+
+_RECEIVED = metrics.registry.counter(
+    "rlp_datagrams_received_total", "Datagrams received by the log server."
+)
+_DROPPED = metrics.registry.counter(
+    "rlp_datagrams_dropped_total",
+    "Datagrams dropped according to the overload policy as the ingest queue was full.",
+)
+_QUEUED = metrics.registry.gauge(
+    "rlp_ingest_queue_datagrams", "Datagrams waiting in the ingest queue."
+)
+
+
+@dataclasses.dataclass
+class IngestStatistics:
+    """Counters describing the datagrams that passed through the ingest pipeline."""
+
+    received: int = 0
+    dropped: int = 0
+
+
+class IngestPipeline:
+    """Bounded queue between the UDP receive loop and a fixed pool of workers.
+
+    Batches of datagrams are put on the queue by the receive loop and handled by
+    `worker_count` worker tasks. The queue holds at most `queue_size` datagrams
+    regardless of how they are batched. When the queue is full the overload policy
+    decides whether the newest datagrams are dropped, the oldest queued datagrams are
+    dropped or the receive loop is suspended until there is room in the queue.
+    """
+
+    def __init__(
+        self,
+        handler: DatagramBatchHandler,
+        queue_size: int,
+        worker_count: int,
+        overload_policy: router_log_preprocessor.settings.OverloadPolicy,
+    ) -> None:
+        self._handler = handler
+        self._queue_size = queue_size
+        self._worker_count = worker_count
+        self._overload_policy = overload_policy
+        self._batches: typing.Deque[typing.List[Datagram]] = collections.deque()
+        self._queued = 0
+        self._is_closed = False
+        self._batch_available: typing.Optional[anyio.Event] = None
+        self._room_available: typing.Optional[anyio.Event] = None
+        self.statistics = IngestStatistics()
+
+    @property
+    def queued(self) -> int:
+        """The number of datagrams currently waiting in the queue."""
+        return self._queued
+
+    def start_workers(self, task_group: anyio.abc.TaskGroup) -> None:
+        """Start the worker tasks handling the queued datagrams.
+
+        The workers stop once the pipeline is closed and the queue is drained.
+
+        :param task_group: The task group the workers are started in.
+        """
+        for _ in range(self._worker_count):
+            task_group.start_soon(self._work)
+
+    async def put(self, packet: bytes, host: str, port: int) -> None:
+        """Put a single received datagram on the queue.
+
+        :param packet: The raw datagram.
+        :param host: The host the datagram was received from.
+        :param port: The port the datagram was received from.
+        """
+        await self.put_batch([(packet, host, port)])
+
+    async def put_batch(self, batch: typing.List[Datagram]) -> None:
+        """Put a batch of received datagrams on the queue according to the overload
+        policy.
+
+        :param batch: The datagrams received in one go.
+        """
+        if self._is_closed:
+            raise anyio.ClosedResourceError
+        self.statistics.received += len(batch)
+        _RECEIVED.inc(len(batch))
+        policy = self._overload_policy
+        if policy is router_log_preprocessor.settings.OverloadPolicy.BACKPRESSURE:
+            # Queue as much of the batch as there is room for at a time
+            while batch:
+                while self._queued >= self._queue_size:
+                    if self._room_available is None or self._room_available.is_set():
+                        self._room_available = anyio.Event()
+                    await self._room_available.wait()
+                room = self._queue_size - self._queued
+                self._append(batch[:room])
+                batch = batch[room:]
+            return
+
+        overflow = self._queued + len(batch) - self._queue_size
+        if overflow > 0:
+            if policy is router_log_preprocessor.settings.OverloadPolicy.DROP_OLDEST:
+                overflow -= self._drop_oldest(overflow)
+                # The batch alone may exceed the queue, so drop its oldest datagrams
+                dropped, batch = batch[:overflow], batch[overflow:]
+            else:
+                kept = len(batch) - overflow
+                dropped, batch = batch[kept:], batch[:kept]
+            self._count_dropped(len(dropped))
+        if batch:
+            self._append(batch)
+
+    def _append(self, batch: typing.List[Datagram]) -> None:
+        self._batches.append(batch)
+        self._queued += len(batch)
+        _QUEUED.set(self._queued)
+        if self._batch_available is not None:
+            self._batch_available.set()
+
+    def _drop_oldest(self, count: int) -> int:
+        """Drop up to `count` of the oldest queued datagrams.
+
+        :param count: The number of datagrams to drop.
+        :return: The number of dropped datagrams.
+        """
+        dropped = 0
+        while self._batches and dropped < count:
+            oldest = self._batches[0]
+            remaining = count - dropped
+            if len(oldest) > remaining:
+                self._batches[0] = oldest[remaining:]
+                dropped += remaining
+            else:
+                self._batches.popleft()
+                dropped += len(oldest)
+        self._queued -= dropped
+        self._count_dropped(dropped)
+        return dropped
+
+    def _count_dropped(self, count: int) -> None:
+        self.statistics.dropped += count
+        _DROPPED.inc(count)
+
+    async def aclose(self) -> None:
+        """Close the pipeline. Queued datagrams are still handled by the workers."""
+        self._is_closed = True
+        if self._batch_available is not None:
+            self._batch_available.set()
+        logging.logger.info(
+            "Ingest pipeline closed. Received %d datagrams and dropped %d",
+            self.statistics.received,
+            self.statistics.dropped,
+        )
+
+    async def __aenter__(self) -> "IngestPipeline":
+        return self
+
+    async def __aexit__(self, *args: typing.Any) -> None:
+        await self.aclose()
+
+    async def _work(self) -> None:
+        while True:
+            while not self._batches:
+                if self._is_closed:
+                    return
+                if self._batch_available is None or self._batch_available.is_set():
+                    self._batch_available = anyio.Event()
+                await self._batch_available.wait()
+            batch = self._batches.popleft()
+            self._queued -= len(batch)
+            _QUEUED.set(self._queued)
+            if self._room_available is not None:
+                self._room_available.set()
+            try:
+                await self._handler(batch)
+            except Exception:
+                # A single malformed batch must not take down the log server
+                logging.logger.exception("Failed to handle %d datagrams", len(batch))
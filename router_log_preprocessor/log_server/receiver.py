@@ -0,0 +1,79 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import socket
+import sys
+import typing
+
+import anyio
+
+import router_log_preprocessor.log_server.pipeline as pipeline
+
+# The largest possible payload of a UDP datagram
+_MAX_DATAGRAM_SIZE = 65535
+
+# anyio 4.7 renamed wait_socket_readable to wait_readable
+_wait_readable = getattr(anyio, "wait_readable", None) or anyio.wait_socket_readable
+
+
+def is_batch_receive_supported() -> bool:
+    """Return True if datagrams can be drained in batches on this platform."""
+    return sys.platform.startswith("linux")
+
+
+def create_batch_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """Create a non-blocking UDP socket bound to the given local address.
+
+    :param host: IP address or host name of the local interface to bind to.
+    :param port: Local port to bind to.
+    :param reuse_port: True to allow multiple sockets to bind to the same address/port.
+    :return: The bound socket.
+    """
+    family, kind, protocol, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_DGRAM
+    )[0]
+    udp = socket.socket(family, kind, protocol)
+    try:
+        udp.setblocking(False)
+        if reuse_port:
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        udp.bind(address)
+    except BaseException:
+        udp.close()
+        raise
+    return udp
+
+
+async def receive_batches(
+    udp: socket.socket, batch_size: int
+) -> typing.AsyncGenerator[typing.List[pipeline.Datagram], None]:
+    """Receive datagrams in batches from a non-blocking UDP socket.
+
+    Every time the socket becomes readable it is drained for up to `batch_size`
+    datagrams, which amortizes the event loop wakeup over the whole batch.
+
+    :param udp: A non-blocking UDP socket.
+    :param batch_size: The maximum number of datagrams in a batch.
+    """
+    recvfrom = udp.recvfrom
+    while True:
+        await _wait_readable(udp)
+        batch: typing.List[pipeline.Datagram] = []
+        for _ in range(batch_size):
+            try:
+                packet, address = recvfrom(_MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((packet, address[0], address[1]))
+        if batch:
+            yield batch
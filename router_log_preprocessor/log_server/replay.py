@@ -0,0 +1,199 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import dataclasses
+import enum
+import pathlib
+import typing
+
+import anyio
+
+import router_log_preprocessor.hooks.zabbix
+import router_log_preprocessor.log_server.pipeline as pipeline
+import router_log_preprocessor.log_server.server as server
+import router_log_preprocessor.settings
+import router_log_preprocessor.util.archive as archive
+import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.rfc3164_parser
+
+# A datagram to replay with the time it was originally received if known
+ReplayDatagram = typing.Tuple[typing.Optional[float], pipeline.Datagram]
+
+# Number of datagrams put on the ingest queue at a time when replaying as fast as
+# possible
+_BATCH_SIZE = 256
+
+
+class ReplayTiming(str, enum.Enum):
+    """Define the pace of a replay."""
+
+    FAST = "fast"
+    ORIGINAL = "original"
+
+
+@dataclasses.dataclass
+class ReplayStatistics:
+    """Counters describing a finished replay."""
+
+    datagrams: int = 0
+    discarded: int = 0
+    elapsed: float = 0.0
+    # Only counted in dry-run mode
+    measurements: typing.Optional[int] = None
+
+    @property
+    def rate(self) -> float:
+        """The number of datagrams replayed per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.datagrams / self.elapsed
+
+
+def read_datagrams(path: pathlib.Path) -> typing.Generator[ReplayDatagram, None, None]:
+    """Read the datagrams of an echo log, an echo archive or an archive segment.
+
+    The lines of a text echo log do not carry the time they were received, so their
+    time is unknown.
+
+    :param path: The path of the echo log, archive directory or archive segment.
+    :return: Generator of the datagrams in the order they were logged.
+    """
+    if path.is_dir():
+        for datagram in archive.read_archive(path):
+            yield datagram.timestamp, (datagram.packet, datagram.host, datagram.port)
+        return
+    if path.suffix == archive.SEGMENT_SUFFIX:
+        for datagram in archive.read_segment(path):
+            yield datagram.timestamp, (datagram.packet, datagram.host, datagram.port)
+        return
+    with open(path, "rb") as echo_log:
+        for line in echo_log:
+            packet = line.rstrip(b"\r\n")
+            if packet:
+                yield None, (packet, "", 0)
+
+
+def _logged_timestamp(packet: bytes) -> typing.Optional[float]:
+    try:
+        record = router_log_preprocessor.util.rfc3164_parser.parse_bytes(packet)
+    except (RuntimeError, ValueError, KeyError):
+        return None
+    return record.timestamp.timestamp()
+
+
+async def replay(
+    path: pathlib.Path,
+    timing: ReplayTiming = ReplayTiming.FAST,
+    dry_run: bool = False,
+) -> ReplayStatistics:
+    """Replay logged datagrams through the preprocessors and hooks.
+
+    When replaying with the original timing, the datagrams of a text echo log are paced
+    by the timestamp in their header. The replay never uses the measurement spool or
+    the snapshot of known clients of the log server, so measurements that cannot be
+    sent are retried from memory and every replayed client is discovered again.
+
+    :param path: The path of the echo log, archive directory or archive segment.
+    :param timing: Replay as fast as possible or with the original pace.
+    :param dry_run: Count the measurements instead of sending them to Zabbix. The
+                    discovery and bundling wait times are skipped as well.
+    :return: The statistics of the replay.
+    """
+    settings = router_log_preprocessor.settings.settings()
+    sender = None
+    wait_times: typing.Dict[str, float] = {}
+    if dry_run:
+        sender = router_log_preprocessor.hooks.zabbix.DryRunSender()
+        wait_times = {
+            "client_discovery_wait_time": 0,
+            "measurement_bundle_wait_time": 0,
+            "discovery_debounce": 0,
+        }
+    log_handler = server.log_handler_factory(
+        sender=sender,
+        echo=False,
+        spool_path=None,
+        known_clients_path=None,
+        **wait_times,
+    )
+    ingest_pipeline = pipeline.IngestPipeline(
+        log_handler.handle_batch,
+        queue_size=settings.log_server_queue_size,
+        worker_count=settings.log_server_worker_count,
+        # Replaying must never drop datagrams
+        overload_policy=router_log_preprocessor.settings.OverloadPolicy.BACKPRESSURE,
+    )
+
+    logging.logger.info("Replaying %s with %s timing", path, timing.value)
+    started = anyio.current_time()
+    try:
+        async with anyio.create_task_group() as hook_task_group:
+            log_handler.start(hook_task_group)
+            async with anyio.create_task_group() as task_group:
+                ingest_pipeline.start_workers(task_group)
+                async with ingest_pipeline:
+                    await _put_datagrams(ingest_pipeline, path, timing, started)
+            # Let the hooks send the replayed records before stopping them
+            await log_handler.flush()
+            hook_task_group.cancel_scope.cancel()
+    finally:
+        # Persist the state of the hooks, also when the replay is interrupted
+        with anyio.CancelScope(shield=True):
+            await log_handler.aclose()
+
+    statistics = ReplayStatistics(
+        datagrams=ingest_pipeline.statistics.received,
+        discarded=log_handler.discarded,
+        elapsed=anyio.current_time() - started,
+    )
+    if sender is not None:
+        statistics.measurements = sender.measurements
+    logging.logger.info("Replay finished: %r", statistics)
+    return statistics
+
+
+async def _put_datagrams(
+    ingest_pipeline: pipeline.IngestPipeline,
+    path: pathlib.Path,
+    timing: ReplayTiming,
+    started: float,
+) -> None:
+    """Put the logged datagrams on the ingest queue at the pace of the replay.
+
+    :param ingest_pipeline: The pipeline handling the replayed datagrams.
+    :param path: The path of the echo log, archive directory or archive segment.
+    :param timing: Replay as fast as possible or with the original pace.
+    :param started: The time the replay started.
+    """
+    first_timestamp: typing.Optional[float] = None
+    batch: typing.List[pipeline.Datagram] = []
+    for timestamp, datagram in read_datagrams(path):
+        if timing is ReplayTiming.ORIGINAL:
+            if timestamp is None:
+                timestamp = _logged_timestamp(datagram[0])
+            if timestamp is not None:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = started + timestamp - first_timestamp
+                delay -= anyio.current_time()
+                if delay > 0:
+                    if batch:
+                        await ingest_pipeline.put_batch(batch)
+                        batch = []
+                    await anyio.sleep(delay)
+        batch.append(datagram)
+        if len(batch) >= _BATCH_SIZE:
+            await ingest_pipeline.put_batch(batch)
+            batch = []
+    if batch:
+        await ingest_pipeline.put_batch(batch)
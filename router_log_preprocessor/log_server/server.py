@@ -11,23 +11,58 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import pathlib
+import signal
 import ssl
+import sys
+import typing
 
 import asyncio_zabbix_sender
-from anyio import create_task_group, create_udp_socket
+from anyio import (
+    CancelScope,
+    create_task_group,
+    create_udp_socket,
+    open_signal_receiver,
+)
 
 import router_log_preprocessor.hooks.zabbix
 import router_log_preprocessor.log_server.handler
+import router_log_preprocessor.log_server.pipeline as pipeline
+import router_log_preprocessor.log_server.receiver as receiver
+import router_log_preprocessor.log_server.tracing as tracing
 import router_log_preprocessor.preprocessors.dnsmasq_dhcp as preprocessors_dnsmasq_dhcp
 import router_log_preprocessor.preprocessors.wlc as preprocessors_wlc
 import router_log_preprocessor.settings
 import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
 import router_log_preprocessor.util.rfc3164_parser
 
 
-def log_handler_factory() -> router_log_preprocessor.log_server.handler.LogHandler:
+def log_handler_factory(
+    known_clients_store: typing.Optional[typing.MutableMapping] = None,
+    sender: typing.Optional[typing.Any] = None,
+    echo: bool = True,
+    client_discovery_wait_time: float = 50,
+    measurement_bundle_wait_time: float = 10,
+    discovery_debounce: typing.Optional[float] = None,
+    spool_path: typing.Optional[pathlib.Path] = None,
+    known_clients_path: typing.Optional[pathlib.Path] = None,
+) -> router_log_preprocessor.log_server.handler.LogHandler:
     """Create the log handler used for preprocessing and sending measurements to hooks.
 
+    :param known_clients_store: Optional store of known clients shared between worker
+                                processes.
+    :param sender: Optional sender used instead of the configured Zabbix sender.
+    :param echo: Whether the handled logs are written to the echo log.
+    :param client_discovery_wait_time: The time it takes Zabbix to discover a client.
+    :param measurement_bundle_wait_time: The time measurements are bundled before
+                                         being sent to Zabbix.
+    :param discovery_debounce: Override the time new clients are collected before
+                               they are discovered.
+    :param spool_path: Optional path of the measurement spool. Without a spool the
+                       failed measurements are retried from memory.
+    :param known_clients_path: Optional path of the snapshot of known clients. Without
+                               a snapshot the known clients are forgotten on exit.
     :return: Instantiated log handler.
     """
     # Set up preprocessors
@@ -37,37 +72,201 @@ def log_handler_factory() -> router_log_preprocessor.log_server.handler.LogHandl
     }
     # Set up hooks
     settings = router_log_preprocessor.settings.settings()
-    ssl_context = None
-    if settings.is_zabbix_with_tls:
-        ssl_context = ssl.SSLContext()
-        ssl_context.load_cert_chain(settings.zabbix_tls_cert_file, settings.zabbix_tls_key_file)
+    if sender is None:
+        ssl_context = None
+        if settings.is_zabbix_with_tls:
+            ssl_context = ssl.SSLContext()
+            ssl_context.load_cert_chain(
+                settings.zabbix_tls_cert_file, settings.zabbix_tls_key_file
+            )
 
-    sender = asyncio_zabbix_sender.ZabbixSender(
-        zabbix_host=settings.zabbix_host, zabbix_port=settings.zabbix_port, ssl_context=ssl_context
+        # The circuit is checked once a request has a slot in the pool, so requests
+        # waiting for a slot fail fast once the circuit has opened
+        sender = router_log_preprocessor.hooks.zabbix.SenderPool(
+            router_log_preprocessor.hooks.zabbix.CircuitBreaker(
+                asyncio_zabbix_sender.ZabbixSender(
+                    zabbix_host=settings.zabbix_host,
+                    zabbix_port=settings.zabbix_port,
+                    ssl_context=ssl_context,
+                ),
+                failure_threshold=settings.zabbix_circuit_failure_threshold,
+                initial_backoff=settings.zabbix_backoff_initial,
+                max_backoff=settings.zabbix_backoff_max,
+            ),
+            settings.zabbix_max_in_flight,
+        )
+    if discovery_debounce is None:
+        discovery_debounce = settings.zabbix_discovery_debounce
+    measurement_spool = None
+    if spool_path is not None:
+        measurement_spool = router_log_preprocessor.hooks.zabbix.MeasurementSpool(
+            spool_path, settings.zabbix_spool_max_bytes
+        )
+    zabbix_trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        sender,
+        client_discovery_wait_time=client_discovery_wait_time,
+        measurement_bundle_wait_time=measurement_bundle_wait_time,
+        known_clients_store=known_clients_store,
+        max_bundle_items=settings.zabbix_bundle_max_items,
+        max_bundle_bytes=settings.zabbix_bundle_max_bytes,
+        measurement_spool=measurement_spool,
+        spool_drain_rate=settings.zabbix_spool_drain_rate,
+        known_clients_path=known_clients_path,
+        snapshot_interval=settings.zabbix_known_clients_snapshot_interval,
+        discovery_debounce=discovery_debounce,
+        known_clients_max_age=settings.zabbix_known_clients_max_age,
+        known_clients_max_count=settings.zabbix_known_clients_max_count,
     )
-    zabbix_trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(sender)
     hooks = [zabbix_trapper]
 
-    return router_log_preprocessor.log_server.handler.LogHandler(preprocessors, hooks)
+    tracer = None
+    if settings.tracing_enabled:
+        tracer = tracing.StageTracer(settings.tracing_sample_every)
 
+    return router_log_preprocessor.log_server.handler.LogHandler(
+        preprocessors, hooks, settings.log_server_parser, echo=echo, tracer=tracer
+    )
 
-async def start_log_server() -> None:
-    """Start the log server."""
 
-    log_handler = log_handler_factory()
+async def start_log_server(
+    reuse_port: typing.Optional[bool] = None,
+    known_clients_store: typing.Optional[typing.MutableMapping] = None,
+    metrics_port: typing.Optional[int] = None,
+    spool_path: typing.Optional[pathlib.Path] = None,
+    known_clients_path: typing.Optional[pathlib.Path] = None,
+) -> None:
+    """Start the log server.
 
+    :param reuse_port: Override the reuse port setting, e.g. when running multiple
+                       worker processes.
+    :param known_clients_store: Optional store of known clients shared between worker
+                                processes.
+    :param metrics_port: Override the metrics port setting, e.g. when running multiple
+                         worker processes.
+    :param spool_path: Override the path of the measurement spool, e.g. when running
+                       multiple worker processes.
+    :param known_clients_path: Override the path of the snapshot of known clients,
+                               e.g. when running multiple worker processes.
+    """
     settings = router_log_preprocessor.settings.settings()
+    if spool_path is None:
+        spool_path = settings.zabbix_spool_path
+    if known_clients_path is None:
+        known_clients_path = settings.zabbix_known_clients_path
+    log_handler = log_handler_factory(
+        known_clients_store,
+        spool_path=spool_path,
+        known_clients_path=known_clients_path,
+    )
+
+    if reuse_port is None:
+        reuse_port = settings.log_server_reuse_port
+    ingest_pipeline = pipeline.IngestPipeline(
+        log_handler.handle_batch,
+        queue_size=settings.log_server_queue_size,
+        worker_count=settings.log_server_worker_count,
+        overload_policy=settings.log_server_overload_policy,
+    )
+    if metrics_port is None:
+        metrics_port = settings.metrics_port
+
+    try:
+        async with create_task_group() as task_group:
+            log_handler.start(task_group)
+            if sys.platform != "win32":
+                task_group.start_soon(
+                    _stop_on_signal, task_group.cancel_scope, signal.SIGTERM
+                )
+            if metrics_port is not None:
+                await task_group.start(
+                    metrics.serve_metrics, settings.metrics_host, metrics_port
+                )
+                logging.logger.info(
+                    "Serving metrics on http://%s:%d/metrics",
+                    settings.metrics_host,
+                    metrics_port,
+                )
+            profiling_signal = tracing.profiling_signal()
+            if settings.profiling_enabled and profiling_signal is not None:
+                task_group.start_soon(
+                    tracing.toggle_profiling_on_signal,
+                    settings.logging_directory,
+                    profiling_signal,
+                )
+            if (
+                settings.log_server_batch_size > 1
+                and receiver.is_batch_receive_supported()
+            ):
+                await _serve_batches(ingest_pipeline, settings, reuse_port)
+            else:
+                await _serve_datagrams(ingest_pipeline, settings, reuse_port)
+            # Stop serving the metrics and the hooks once the log server stops
+            task_group.cancel_scope.cancel()
+    finally:
+        # Persist the state of the hooks, also when cancelled on shutdown
+        with CancelScope(shield=True):
+            await log_handler.aclose()
+
+
+async def _stop_on_signal(cancel_scope: CancelScope, signal_number: int) -> None:
+    """Stop the log server once the signal is received, e.g. SIGTERM from a service
+    manager, such that the state of the hooks is persisted before exiting.
+
+    :param cancel_scope: The cancel scope of the log server.
+    :param signal_number: The signal stopping the log server.
+    """
+    with open_signal_receiver(signal_number) as signals:
+        async for received in signals:
+            logging.logger.info("Received signal %d. Stopping the log server", received)
+            cancel_scope.cancel()
+            return
+
+
+async def _serve_datagrams(
+    ingest_pipeline: pipeline.IngestPipeline,
+    settings: router_log_preprocessor.settings.Settings,
+    reuse_port: bool,
+) -> None:
+    """Serve the log server by receiving a single datagram at a time."""
     async with await create_udp_socket(
         local_host=settings.log_server_host,
         local_port=settings.log_server_port,
-        reuse_port=settings.log_server_reuse_port,
+        reuse_port=reuse_port,
     ) as udp:
         logging.logger.info(
             "Listen for logs on UDP %s:%d - Reuse port: %r",
             settings.log_server_host,
             settings.log_server_port,
-            settings.log_server_reuse_port,
+            reuse_port,
+        )
+        async with create_task_group() as task_group:
+            ingest_pipeline.start_workers(task_group)
+            async with ingest_pipeline:
+                async for packet, (host, port) in udp:
+                    await ingest_pipeline.put(packet, host, port)
+
+
+async def _serve_batches(
+    ingest_pipeline: pipeline.IngestPipeline,
+    settings: router_log_preprocessor.settings.Settings,
+    reuse_port: bool,
+) -> None:
+    """Serve the log server by draining the socket in batches."""
+    udp = receiver.create_batch_socket(
+        str(settings.log_server_host), settings.log_server_port, reuse_port
+    )
+    with udp:
+        logging.logger.info(
+            "Listen for logs on UDP %s:%d - Reuse port: %r - Batch size: %d",
+            settings.log_server_host,
+            settings.log_server_port,
+            reuse_port,
+            settings.log_server_batch_size,
         )
         async with create_task_group() as task_group:
-            async for packet, (host, port) in udp:
-                task_group.start_soon(log_handler.handle, packet, host, port)
+            ingest_pipeline.start_workers(task_group)
+            async with ingest_pipeline:
+                async for batch in receiver.receive_batches(
+                    udp, settings.log_server_batch_size
+                ):
+                    await ingest_pipeline.put_batch(batch)
@@ -0,0 +1,150 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Opt-in instrumentation of the stages handling a received log.
+
+A trace measures the consecutive stages of handling a single log (decode, route,
+parse, preprocess and every hook) into the `rlp_stage_seconds` histogram. One in every
+N traces is sampled and logged in detail. The time of a hook is the time until its
+`send` returns, which includes any waiting done by the hook. The stages of a log
+handled as part of a batch leave out the time spent on the other logs of the batch.
+
+Independently of the traces, the whole process can be profiled with cProfile by
+sending a signal to toggle the profiler. The profile is dumped in the pstats format.
+"""
+import cProfile
+import os
+import pathlib
+import signal
+import time
+import typing
+
+import anyio
+
+import router_log_preprocessor.util.logging as logging
+import router_log_preprocessor.util.metrics as metrics
+
+_STAGE_SECONDS = metrics.registry.histogram(
+    "rlp_stage_seconds",
+    "Time spent in each stage of handling a received log by stage and name, e.g. the "
+    "process of a preprocessor or the type of a hook.",
+    ("stage", "name"),
+)
+
+
+class Trace:
+    """Lap timer of the stages handling a single log."""
+
+    __slots__ = ("_last", "_stages")
+
+    def __init__(self, is_sampled: bool) -> None:
+        self._last = time.perf_counter()
+        self._stages: typing.Optional[typing.List[typing.Tuple[str, str, float]]] = (
+            [] if is_sampled else None
+        )
+
+    def restart(self) -> None:
+        """Restart the timer, excluding the time since the last stage."""
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str, name: str = "") -> None:
+        """Record the time since the last stage as the time of the given stage.
+
+        :param stage: The stage that just finished.
+        :param name: The name of the stage, e.g. the process or hook type.
+        """
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        _STAGE_SECONDS.labels(stage, name).observe(elapsed)
+        if self._stages is not None:
+            self._stages.append((stage, name, elapsed))
+
+    def finish(self, subject: typing.Any) -> None:
+        """Log the stages if the trace is sampled.
+
+        :param subject: The log the trace belongs to.
+        """
+        if not self._stages:
+            return
+        stages = ", ".join(
+            f"{stage}{'[' + name + ']' if name else ''} {elapsed * 1e6:.1f} µs"
+            for stage, name, elapsed in self._stages
+        )
+        total = sum(elapsed for _, _, elapsed in self._stages)
+        logging.logger.info(
+            "Trace of %r: %s - total %.1f µs", subject, stages, total * 1e6
+        )
+
+
+class StageTracer:
+    def __init__(self, sample_every: int = 0) -> None:
+        """Create a tracer of the stages handling the received logs.
+
+        :param sample_every: Log the stages of every Nth trace. 0 disables sampling.
+        """
+        self._sample_every = sample_every
+        self._count = 0
+
+    def trace(self) -> Trace:
+        """Start the trace of a single log.
+
+        :return: The started trace.
+        """
+        self._count += 1
+        is_sampled = self._sample_every > 0 and self._count % self._sample_every == 0
+        return Trace(is_sampled)
+
+
+async def toggle_profiling_on_signal(
+    directory: pathlib.Path, signal_number: int
+) -> None:
+    """Toggle a cProfile profiler every time the signal is received until cancelled.
+
+    The first signal starts profiling and the next one stops it and dumps the profile
+    to `rlp-<pid>-<time>.prof` in the directory, e.g. to be inspected by pstats or
+    snakeviz.
+
+    :param directory: The directory of the profiles.
+    :param signal_number: The signal toggling the profiler, e.g. SIGUSR1.
+    """
+    profiler: typing.Optional[cProfile.Profile] = None
+    with anyio.open_signal_receiver(signal_number) as signals:
+        try:
+            async for _ in signals:
+                if profiler is None:
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                    logging.logger.info("Profiling started")
+                    continue
+                _dump_profile(profiler, directory)
+                profiler = None
+        finally:
+            if profiler is not None:
+                _dump_profile(profiler, directory)
+
+
+def _dump_profile(profiler: cProfile.Profile, directory: pathlib.Path) -> None:
+    profiler.disable()
+    name = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    path = directory / f"rlp-{os.getpid()}-{name}.prof"
+    profiler.dump_stats(path)
+    logging.logger.info("Profiling stopped. Profile dumped to %s", path)
+
+
+def profiling_signal() -> typing.Optional[int]:
+    """Get the signal toggling the profiler on this platform.
+
+    :return: SIGUSR1 or None if the platform does not support it.
+    """
+    return getattr(signal, "SIGUSR1", None)
@@ -0,0 +1,121 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import functools
+import multiprocessing
+import os
+import pathlib
+import signal
+import typing
+
+import anyio
+
+import router_log_preprocessor.log_server.server as server
+import router_log_preprocessor.settings
+import router_log_preprocessor.util.logging as logging
+
+
+def _run_worker(
+    known_clients_store: typing.MutableMapping,
+    metrics_port: typing.Optional[int],
+    spool_path: typing.Optional[pathlib.Path],
+    known_clients_path: typing.Optional[pathlib.Path],
+) -> None:
+    """Run a single log server in a worker process."""
+    try:
+        anyio.run(
+            functools.partial(
+                server.start_log_server,
+                reuse_port=True,
+                known_clients_store=known_clients_store,
+                metrics_port=metrics_port,
+                spool_path=spool_path,
+                known_clients_path=known_clients_path,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def _worker_path(path: pathlib.Path, index: int) -> pathlib.Path:
+    """Get the path of a file owned by a single worker, e.g. spool-0.db."""
+    return path.with_name(f"{path.stem}-{index}{path.suffix}")
+
+
+def _interrupt(signal_number: int, frame: typing.Any) -> None:
+    """Stop the parent process on SIGTERM like on an interrupt from the keyboard."""
+    raise KeyboardInterrupt
+
+
+def _stop_workers(
+    workers: typing.Sequence[multiprocessing.process.BaseProcess],
+) -> None:
+    """Signal the workers to stop and wait for them, such that every worker persists
+    the state of its hooks before exiting.
+
+    :param workers: The worker processes.
+    """
+    for worker in workers:
+        if worker.pid is not None and worker.is_alive():
+            os.kill(worker.pid, signal.SIGTERM)
+    logging.logger.info("Stopping %d worker processes", len(workers))
+    for worker in workers:
+        worker.join()
+
+
+def run_workers(count: int) -> None:
+    """Run the log server in multiple worker processes.
+
+    Every worker binds the same port using SO_REUSEPORT and the kernel load-balances
+    the received datagrams between them. The known clients are shared through a
+    multiprocessing manager, so a client is only discovered by a single worker.
+    Every worker serves its own metrics on consecutive ports starting from the
+    configured metrics port, and spools unsent measurements to and snapshots the known
+    clients in its own files. On an interrupt or SIGTERM the workers are signalled to
+    stop, and the parent waits for them to persist their state.
+
+    :param count: The number of worker processes.
+    """
+    settings = router_log_preprocessor.settings.settings()
+    metrics_port = settings.metrics_port
+    spool_path = settings.zabbix_spool_path
+    known_clients_path = settings.zabbix_known_clients_path
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        known_clients_store = manager.dict()
+        workers = [
+            context.Process(
+                target=_run_worker,
+                args=(
+                    known_clients_store,
+                    None if metrics_port is None else metrics_port + index,
+                    None if spool_path is None else _worker_path(spool_path, index),
+                    None
+                    if known_clients_path is None
+                    else _worker_path(known_clients_path, index),
+                ),
+                name=f"rlp-worker-{index}",
+            )
+            for index in range(count)
+        ]
+        for worker in workers:
+            worker.start()
+        logging.logger.info("Started %d worker processes", count)
+        previous_handler = signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            _stop_workers(workers)
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
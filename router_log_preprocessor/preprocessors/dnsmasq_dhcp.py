@@ -11,6 +11,7 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import ipaddress
 import re
 import typing
 
@@ -38,8 +39,8 @@ def preprocess_dnsmasq_dhcp_event(
         # Hostname is not always present in DHCPACK message
         hostname = ""
 
-    return domain.DnsmasqDhcpAcknowledge(
-        mac_address=domain.MAC(mac_address),
-        ip_address=ip_address,  # type: ignore
+    return domain.DnsmasqDhcpAcknowledge.trusted(
+        mac_address=domain.intern_mac(mac_address),
+        ip_address=ipaddress.ip_address(ip_address),
         hostname=hostname,
     )
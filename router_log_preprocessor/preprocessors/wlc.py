@@ -51,8 +51,8 @@ def preprocess_wireless_lan_controller_event(
             message_parts["status"][message_parts["status"].find("(") + 1 : -1]
         )
 
-    return domain.WlcEventModel(
-        mac_address=domain.MAC(mac_address),
+    return domain.WlcEventModel.trusted(
+        mac_address=domain.intern_mac(mac_address),
         event=domain.WlcEvent.from_event(event),
         reason=message_parts.get("reason", ""),
         location=location,
@@ -11,6 +11,7 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import enum
 import pathlib
 import typing
 from functools import lru_cache
@@ -20,6 +21,23 @@ import pydantic
 from pydantic import Field, IPvAnyAddress
 import pydantic_settings
 
+from router_log_preprocessor.util.archive import ArchiveCompression
+
+
+class OverloadPolicy(str, enum.Enum):
+    """Define what happens to a received datagram when the ingest queue is full."""
+
+    DROP_NEWEST = "drop-newest"
+    DROP_OLDEST = "drop-oldest"
+    BACKPRESSURE = "backpressure"
+
+
+class LogParser(str, enum.Enum):
+    """Define the parser used for the received RFC 3164 log records."""
+
+    REGEX = "regex"
+    BYTES = "bytes"
+
 
 class Settings(pydantic_settings.BaseSettings):
     """Define the settings of the application."""
@@ -38,6 +56,33 @@ class Settings(pydantic_settings.BaseSettings):
         description="True to allow multiple sockets to bind to the same address/port "
         "(not supported on Windows)",
     )
+    log_server_queue_size: int = Field(
+        default=1024,
+        ge=1,
+        description="Maximum number of received datagrams waiting to be handled.",
+    )
+    log_server_worker_count: int = Field(
+        default=32,
+        ge=1,
+        description="Number of worker tasks handling the received datagrams.",
+    )
+    log_server_overload_policy: OverloadPolicy = Field(
+        default=OverloadPolicy.BACKPRESSURE,
+        description="What to do with a received datagram when the queue is full: "
+        "drop-newest, drop-oldest or backpressure (stop reading from the socket).",
+    )
+    log_server_batch_size: int = Field(
+        default=1,
+        ge=1,
+        description="Maximum number of datagrams drained from the socket every time "
+        "it becomes readable. Only used on Linux and 1 disables batching.",
+    )
+    log_server_parser: LogParser = Field(
+        default=LogParser.BYTES,
+        description="The parser of the received logs: regex decodes the log and "
+        "matches a regular expression, while bytes parses the common layout directly "
+        "on the received bytes and falls back to the regular expression.",
+    )
     logging_name_base: str = Field(
         default="rlp",
         description="The base name of the logger used internally. "
@@ -50,6 +95,38 @@ class Settings(pydantic_settings.BaseSettings):
         default=pathlib.Path.cwd(),
         description="The base directory where logs from this application resides.",
     )
+    logging_echo: bool = Field(
+        default=True,
+        description="Whether the logs received are written to the echo log.",
+    )
+    logging_echo_archive: bool = Field(
+        default=False,
+        description="True to write the logs received as raw datagrams to a rotated "
+        "and indexed archive in <logging_name_base>.echo instead of the echo log.",
+    )
+    logging_echo_archive_compression: ArchiveCompression = Field(
+        default=ArchiveCompression.GZIP,
+        description="The compression of the blocks in the echo archive: none or gzip.",
+    )
+    logging_echo_archive_segment_size: int = Field(
+        default=64 * 1024 * 1024,
+        ge=1,
+        description="The size in bytes after which a new echo archive segment is "
+        "started.",
+    )
+    logging_echo_archive_segment_age: float = Field(
+        default=86400.0,
+        gt=0,
+        description="The age in seconds after which a new echo archive segment is "
+        "started.",
+    )
+    logging_queue_size: int = Field(
+        default=10000,
+        ge=1,
+        description="The maximum number of log records waiting to be written to "
+        "each of the application log and the echo log. Records below WARNING are "
+        "dropped when the queue is full.",
+    )
     zabbix_host: str = Field(
         default="",
         description="A IP address or DNS name of the Zabbix instance.",
@@ -66,6 +143,111 @@ class Settings(pydantic_settings.BaseSettings):
         default=None,
         description="The full pathname of a file containing the agent private key."
     )
+    zabbix_max_in_flight: int = Field(
+        default=4,
+        ge=1,
+        description="The maximum number of concurrent requests to Zabbix, i.e. "
+        "discoveries and bundles of measurements.",
+    )
+    zabbix_circuit_failure_threshold: int = Field(
+        default=3,
+        ge=1,
+        description="The consecutive connection errors after which requests to "
+        "Zabbix fail fast until the backoff has elapsed.",
+    )
+    zabbix_backoff_initial: float = Field(
+        default=5,
+        gt=0,
+        description="The backoff in seconds after Zabbix is first found unreachable.",
+    )
+    zabbix_backoff_max: float = Field(
+        default=300,
+        gt=0,
+        description="The maximum backoff in seconds while Zabbix is unreachable.",
+    )
+    zabbix_bundle_max_items: int = Field(
+        default=250,
+        ge=1,
+        description="The maximum number of measurements sent to Zabbix in a single "
+        "request. A full bundle is sent without waiting for the bundle timer.",
+    )
+    zabbix_bundle_max_bytes: int = Field(
+        default=1 << 20,
+        ge=1,
+        description="The approximate maximum size in bytes of a single request to "
+        "Zabbix. A full bundle is sent without waiting for the bundle timer.",
+    )
+    zabbix_spool_path: typing.Optional[pathlib.Path] = Field(
+        default=None,
+        description="The SQLite database persisting the measurements that could not "
+        "be sent to Zabbix. Failed measurements are retried from memory if unset.",
+    )
+    zabbix_spool_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        ge=1,
+        description="The approximate maximum size of the spooled measurements in "
+        "bytes. The oldest measurements are dropped when exceeded.",
+    )
+    zabbix_spool_drain_rate: float = Field(
+        default=10,
+        gt=0,
+        description="The maximum number of spooled bundles sent to Zabbix per second.",
+    )
+    zabbix_discovery_debounce: float = Field(
+        default=1,
+        ge=0,
+        description="The time in seconds new clients of a router and process are "
+        "collected before they are discovered by a single request. 0 discovers every "
+        "new client right away.",
+    )
+    zabbix_known_clients_path: typing.Optional[pathlib.Path] = Field(
+        default=None,
+        description="The snapshot of the clients discovered in Zabbix, restored on "
+        "start such that known clients are not discovered again.",
+    )
+    zabbix_known_clients_snapshot_interval: float = Field(
+        default=300,
+        gt=0,
+        description="The minimum time in seconds between snapshots of the known "
+        "clients. A snapshot is also saved on shutdown.",
+    )
+    zabbix_known_clients_max_age: typing.Optional[float] = Field(
+        default=7 * 24 * 60 * 60,
+        gt=0,
+        description="The time in seconds after which a known client that has not been "
+        "seen is forgotten and left out of the discovery.",
+    )
+    zabbix_known_clients_max_count: typing.Optional[int] = Field(
+        default=10000,
+        ge=1,
+        description="The maximum number of known clients per process. The least "
+        "recently seen client is forgotten when exceeded.",
+    )
+    tracing_enabled: bool = Field(
+        default=False,
+        description="True to record the time of every stage handling a received log "
+        "in the rlp_stage_seconds metric.",
+    )
+    tracing_sample_every: int = Field(
+        default=0,
+        ge=0,
+        description="Log the stages of every Nth traced log in detail. 0 disables the "
+        "sampling.",
+    )
+    profiling_enabled: bool = Field(
+        default=False,
+        description="True to toggle a cProfile profiler on SIGUSR1. The profiles are "
+        "dumped to the logging directory.",
+    )
+    metrics_host: str = Field(
+        default="127.0.0.1",
+        description="IP address or host name of the local interface serving metrics.",
+    )
+    metrics_port: typing.Optional[int] = Field(
+        default=None,
+        description="Local port serving the metrics on /metrics over HTTP. Metrics "
+        "are not served if unset. Worker processes use consecutive ports.",
+    )
 
     @property
     def is_zabbix_with_tls(self) -> bool:
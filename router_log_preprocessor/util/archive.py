@@ -0,0 +1,388 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Archive of the received datagrams.
+
+An archive is a directory of segments. A segment is a file of blocks, where each block
+holds a number of records, optionally compressed. Each record stores the raw datagram
+together with the time it was received and the address of the sender.
+
+Every segment has a small sidecar index in JSON listing the offset and time range of
+each block, the hostnames of the log records in the segment and the addresses of the
+sources that sent them. Reading a time window only decompresses the blocks overlapping
+the window.
+"""
+import dataclasses
+import enum
+import gzip
+import json
+import logging
+import os
+import pathlib
+import struct
+import time
+import typing
+
+import router_log_preprocessor.util.rfc3164_parser as rfc3164_parser
+
+# Magic, compression, stored length, record count, first and last timestamp
+_BLOCK_HEADER = struct.Struct("<4sBIIdd")
+_BLOCK_MAGIC = b"RLPB"
+# Timestamp, port, host length and datagram length
+_RECORD_HEADER = struct.Struct("<dHBH")
+
+SEGMENT_SUFFIX = ".rlpa"
+INDEX_SUFFIX = ".json"
+
+
+class ArchiveCompression(str, enum.Enum):
+    """Define how the blocks of an archive segment are compressed."""
+
+    NONE = "none"
+    GZIP = "gzip"
+
+
+_COMPRESSION_IDS = {ArchiveCompression.NONE: 0, ArchiveCompression.GZIP: 1}
+_COMPRESSIONS = {value: key for key, value in _COMPRESSION_IDS.items()}
+
+
+class ArchivedDatagram(typing.NamedTuple):
+    timestamp: float
+    packet: bytes
+    host: str
+    port: int
+
+
+@dataclasses.dataclass
+class SegmentIndex:
+    """Index of a single segment."""
+
+    # Offset, first and last timestamp of each block
+    blocks: typing.List[typing.Tuple[int, float, float]] = dataclasses.field(
+        default_factory=list
+    )
+    # The HOSTNAME of the log records, i.e. the routers as they name themselves
+    hostnames: typing.Set[str] = dataclasses.field(default_factory=set)
+    # The addresses the datagrams were received from
+    sources: typing.Set[str] = dataclasses.field(default_factory=set)
+    records: int = 0
+
+    @property
+    def first(self) -> typing.Optional[float]:
+        return self.blocks[0][1] if self.blocks else None
+
+    @property
+    def last(self) -> typing.Optional[float]:
+        return max(block[2] for block in self.blocks) if self.blocks else None
+
+    def overlaps(self, start: float, end: float) -> bool:
+        return any(first <= end and start <= last for _, first, last in self.blocks)
+
+    def dump(self) -> str:
+        return json.dumps(
+            {
+                "first": self.first,
+                "last": self.last,
+                "records": self.records,
+                "hostnames": sorted(self.hostnames),
+                "sources": sorted(self.sources),
+                "blocks": self.blocks,
+            },
+            indent=None,
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "SegmentIndex":
+        raw = json.loads(path.read_text(encoding="utf-8"))
+        return cls(
+            blocks=[tuple(block) for block in raw["blocks"]],  # type: ignore[misc]
+            hostnames=set(raw["hostnames"]),
+            sources=set(raw["sources"]),
+            records=raw["records"],
+        )
+
+
+class ArchiveWriter:
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        segment_size: int = 64 * 1024 * 1024,
+        segment_age: float = 86400.0,
+        compression: ArchiveCompression = ArchiveCompression.GZIP,
+        block_size: int = 64 * 1024,
+    ) -> None:
+        """Create a writer of an archive stored in the given directory.
+
+        :param directory: The directory of the segments. Created if missing.
+        :param segment_size: The size in bytes after which a new segment is started.
+        :param segment_age: The age in seconds after which a new segment is started.
+        :param compression: The compression of the blocks.
+        :param block_size: The uncompressed size in bytes of a block.
+        """
+        self._directory = directory
+        self._segment_size = segment_size
+        self._segment_age = segment_age
+        self._compression = compression
+        self._block_size = block_size
+        self._block = bytearray()
+        self._block_records = 0
+        self._block_first = 0.0
+        self._block_last = 0.0
+        self._block_hostnames: typing.Set[str] = set()
+        self._block_sources: typing.Set[str] = set()
+        self._segment: typing.Optional[typing.BinaryIO] = None
+        self._segment_path: typing.Optional[pathlib.Path] = None
+        self._segment_started = 0.0
+        self._index = SegmentIndex()
+
+    @property
+    def pending_since(self) -> typing.Optional[float]:
+        """The time of the first datagram not yet written to the segment."""
+        return self._block_first if self._block_records else None
+
+    @property
+    def segment_path(self) -> typing.Optional[pathlib.Path]:
+        """The path of the segment currently written."""
+        return self._segment_path
+
+    def write(self, timestamp: float, packet: bytes, host: str, port: int) -> None:
+        """Add a datagram to the current block, writing the block when it is full.
+
+        :param timestamp: The time the datagram was received as seconds since epoch.
+        :param packet: The raw datagram.
+        :param host: The address of the sender.
+        :param port: The port of the sender.
+        """
+        encoded_host = host.encode("ascii")
+        if self._block_records == 0:
+            self._block_first = timestamp
+        self._block_last = max(self._block_last, timestamp)
+        self._block += _RECORD_HEADER.pack(
+            timestamp, port, len(encoded_host), len(packet)
+        )
+        self._block += encoded_host
+        self._block += packet
+        self._block_records += 1
+        self._block_sources.add(host)
+        hostname = _hostname(packet)
+        if hostname is not None:
+            self._block_hostnames.add(hostname)
+        if len(self._block) >= self._block_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the current block to the segment and update the index."""
+        if self._block_records == 0:
+            return
+        if self._segment is not None and self._is_segment_full():
+            self._close_segment()
+        if self._segment is None:
+            self._open_segment()
+        assert self._segment is not None
+
+        data = bytes(self._block)
+        if self._compression is ArchiveCompression.GZIP:
+            data = gzip.compress(data, compresslevel=6)
+        offset = self._segment.tell()
+        self._segment.write(
+            _BLOCK_HEADER.pack(
+                _BLOCK_MAGIC,
+                _COMPRESSION_IDS[self._compression],
+                len(data),
+                self._block_records,
+                self._block_first,
+                self._block_last,
+            )
+        )
+        self._segment.write(data)
+        self._segment.flush()
+
+        self._index.blocks.append((offset, self._block_first, self._block_last))
+        self._index.records += self._block_records
+        self._index.hostnames.update(self._block_hostnames)
+        self._index.sources.update(self._block_sources)
+        self._write_index()
+        self._block.clear()
+        self._block_hostnames.clear()
+        self._block_sources.clear()
+        self._block_records = 0
+        self._block_last = 0.0
+
+    def close(self) -> None:
+        """Write the current block and close the segment."""
+        self.flush()
+        if self._segment is not None:
+            self._close_segment()
+
+    def _is_segment_full(self) -> bool:
+        assert self._segment is not None
+        return (
+            self._segment.tell() >= self._segment_size
+            or time.time() - self._segment_started >= self._segment_age
+        )
+
+    def _open_segment(self) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._segment_started = time.time()
+        name = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self._segment_started))
+        path = self._directory / f"{name}{SEGMENT_SUFFIX}"
+        sequence = 0
+        while True:
+            try:
+                self._segment = open(path, "xb")
+                break
+            except FileExistsError:
+                # Another worker process may have started a segment the same second
+                sequence += 1
+                path = self._directory / f"{name}-{sequence}{SEGMENT_SUFFIX}"
+        self._segment_path = path
+
+    def _close_segment(self) -> None:
+        assert self._segment is not None
+        self._segment.close()
+        self._segment = None
+        self._index = SegmentIndex()
+
+    def _write_index(self) -> None:
+        assert self._segment_path is not None
+        index_path = self._segment_path.with_suffix(INDEX_SUFFIX)
+        temporary_path = index_path.with_suffix(".tmp")
+        temporary_path.write_text(self._index.dump(), encoding="utf-8")
+        os.replace(temporary_path, index_path)
+
+
+def read_segment(
+    path: pathlib.Path,
+    start: float = float("-inf"),
+    end: float = float("inf"),
+) -> typing.Generator[ArchivedDatagram, None, None]:
+    """Read the datagrams of a segment received within the given time window.
+
+    Blocks outside the time window are skipped without being decompressed.
+
+    :param path: The path of the segment.
+    :param start: The earliest time of the datagrams as seconds since epoch.
+    :param end: The latest time of the datagrams as seconds since epoch.
+    :return: Generator of the datagrams in the order they were archived.
+    """
+    with open(path, "rb") as segment:
+        while True:
+            header = segment.read(_BLOCK_HEADER.size)
+            if len(header) < _BLOCK_HEADER.size:
+                return
+            magic, compression, length, _, first, last = _BLOCK_HEADER.unpack(header)
+            if magic != _BLOCK_MAGIC:
+                raise ValueError(f"Corrupt archive block in {path}")
+            if last < start or end < first:
+                segment.seek(length, os.SEEK_CUR)
+                continue
+            data = segment.read(length)
+            if _COMPRESSIONS[compression] is ArchiveCompression.GZIP:
+                data = gzip.decompress(data)
+            yield from _read_block(data, start, end)
+
+
+def _read_block(
+    data: bytes, start: float, end: float
+) -> typing.Generator[ArchivedDatagram, None, None]:
+    offset = 0
+    while offset < len(data):
+        timestamp, port, host_length, packet_length = _RECORD_HEADER.unpack_from(
+            data, offset
+        )
+        offset += _RECORD_HEADER.size
+        host = data[offset : offset + host_length].decode("ascii")
+        offset += host_length
+        packet = data[offset : offset + packet_length]
+        offset += packet_length
+        if start <= timestamp <= end:
+            yield ArchivedDatagram(timestamp, packet, host, port)
+
+
+def read_archive(
+    directory: pathlib.Path,
+    start: float = float("-inf"),
+    end: float = float("inf"),
+) -> typing.Generator[ArchivedDatagram, None, None]:
+    """Read the datagrams of an archive received within the given time window.
+
+    Segments are selected by their index, so only the segments overlapping the time
+    window are opened.
+
+    :param directory: The directory of the archive.
+    :param start: The earliest time of the datagrams as seconds since epoch.
+    :param end: The latest time of the datagrams as seconds since epoch.
+    :return: Generator of the datagrams in the order the segments were written.
+    """
+    for path in sorted(directory.glob(f"*{SEGMENT_SUFFIX}")):
+        index_path = path.with_suffix(INDEX_SUFFIX)
+        if index_path.exists() and not SegmentIndex.load(index_path).overlaps(
+            start, end
+        ):
+            continue
+        yield from read_segment(path, start, end)
+
+
+def _hostname(packet: bytes) -> typing.Optional[str]:
+    hostname = rfc3164_parser.peek_hostname(packet)
+    if hostname is not None:
+        return hostname
+    try:
+        return rfc3164_parser.parse_bytes(packet).hostname
+    except (RuntimeError, ValueError, KeyError):
+        # Datagrams that are not log records are archived without a hostname
+        return None
+
+
+class ArchiveHandler(logging.Handler):
+    """Logging handler archiving the raw datagrams logged to the echo logger.
+
+    The datagram is the message of the log record and the sender is given by the `host`
+    and `port` attributes of the record.
+    """
+
+    # Write a partially filled block when its first record is older than this
+    _BLOCK_MAX_AGE = 60.0
+
+    def __init__(self, writer: ArchiveWriter) -> None:
+        super().__init__()
+        self._writer = writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            packet = record.msg
+            if not isinstance(packet, bytes):
+                packet = str(packet).encode("ascii", "replace")
+            self._writer.write(
+                record.created,
+                packet,
+                getattr(record, "host", ""),
+                getattr(record, "port", 0),
+            )
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        # Called after every burst of records and periodically while no records arrive,
+        # so only write reasonably sized blocks or blocks held back for too long
+        pending_since = self._writer.pending_since
+        if (
+            pending_since is not None
+            and time.time() - pending_since >= self._BLOCK_MAX_AGE
+        ):
+            self._writer.flush()
+
+    def close(self) -> None:
+        self._writer.close()
+        super().close()
@@ -0,0 +1,229 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Local stand-in for a Zabbix server receiving sender data.
+
+The server speaks the ZBXD protocol used by the Zabbix sender, records the received
+measurements and can inject latency, connection resets and partially processed
+requests. It makes it possible to test the throughput of the log server and the
+retries of the Zabbix hook without a Zabbix installation.
+"""
+import collections
+import contextlib
+import dataclasses
+import json
+import random
+import socket
+import struct
+import time
+import typing
+import zlib
+
+import anyio
+import anyio.abc
+import asyncio_zabbix_sender
+
+# anyio 4.7 renamed wait_socket_readable and wait_socket_writable
+_wait_readable = getattr(anyio, "wait_readable", None) or anyio.wait_socket_readable
+_wait_writable = getattr(anyio, "wait_writable", None) or anyio.wait_socket_writable
+
+_HEADER = struct.Struct("<4sBII")
+_FLAG_COMPRESSED = 0x02
+
+
+@dataclasses.dataclass
+class FakeZabbixStatistics:
+    """Counters describing the requests received by the fake Zabbix server."""
+
+    connections: int = 0
+    requests: int = 0
+    measurements: int = 0
+    processed: int = 0
+    failed: int = 0
+    resets: int = 0
+    malformed: int = 0
+
+
+class FakeZabbixServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        reset_probability: float = 0.0,
+        failure_ratio: float = 0.0,
+        record_limit: int = 10000,
+        seed: typing.Optional[int] = None,
+    ) -> None:
+        """Create a fake Zabbix server.
+
+        :param latency: Seconds to wait before responding to a request.
+        :param reset_probability: The probability of resetting the connection instead
+                                  of responding to a request.
+        :param failure_ratio: The fraction of the measurements in a request reported as
+                              failed.
+        :param record_limit: The maximum number of received measurements kept. The
+                             oldest measurements are forgotten first.
+        :param seed: Seed of the random generator deciding the resets.
+        """
+        self.latency = latency
+        self.reset_probability = reset_probability
+        self.failure_ratio = failure_ratio
+        self.measurements: typing.Deque[
+            typing.Dict[str, typing.Any]
+        ] = collections.deque(maxlen=record_limit)
+        self.statistics = FakeZabbixStatistics()
+        self._random = random.Random(seed)
+
+    async def serve(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 10051,
+        *,
+        task_status: anyio.abc.TaskStatus[int] = anyio.TASK_STATUS_IGNORED,
+    ) -> None:
+        """Serve requests until cancelled.
+
+        :param host: The local interface to bind to.
+        :param port: The local port to bind to. 0 binds an ephemeral port.
+        :param task_status: Reports the bound port when started with
+                            `TaskGroup.start`.
+        """
+        family, _, _, _, address = (
+            await anyio.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        )[0]
+        # The connections are plain sockets, so a reset can close them without
+        # shutting down the sending side first
+        with socket.create_server(address, family=family) as listener:
+            listener.setblocking(False)
+            task_status.started(listener.getsockname()[1])
+            async with anyio.create_task_group() as task_group:
+                while True:
+                    await _wait_readable(listener)
+                    try:
+                        connection, _ = listener.accept()
+                    except BlockingIOError:
+                        continue
+                    connection.setblocking(False)
+                    task_group.start_soon(self.handle, connection)
+
+    async def handle(self, connection: socket.socket) -> None:
+        """Respond to a single sender request on the connection.
+
+        :param connection: The non-blocking connection of the Zabbix sender.
+        """
+        self.statistics.connections += 1
+        with connection:
+            try:
+                request = await _receive_request(connection)
+            except (anyio.IncompleteRead, ValueError):
+                self.statistics.malformed += 1
+                # End the stream before closing, as the unread data of the request
+                # would otherwise make the close a reset
+                with contextlib.suppress(OSError):
+                    connection.shutdown(socket.SHUT_WR)
+                return
+
+            data = request.get("data", [])
+            self.statistics.requests += 1
+            self.statistics.measurements += len(data)
+            self.measurements.extend(data)
+
+            started = time.perf_counter()
+            if self.latency > 0:
+                await anyio.sleep(self.latency)
+            if self._random.random() < self.reset_probability:
+                self.statistics.resets += 1
+                # Closing with a zero linger time sends a TCP reset instead of a
+                # graceful close
+                connection.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                )
+                return
+
+            failed = round(len(data) * self.failure_ratio)
+            processed = len(data) - failed
+            self.statistics.processed += processed
+            self.statistics.failed += failed
+            response = json.dumps(
+                {
+                    "response": "success",
+                    "info": f"processed: {processed}; failed: {failed}; "
+                    f"total: {len(data)}; "
+                    f"seconds spent: {time.perf_counter() - started:.6f}",
+                }
+            ).encode("utf-8")
+            await _send_all(
+                connection, asyncio_zabbix_sender.create_packet(response, False)
+            )
+
+
+async def _receive_request(connection: socket.socket) -> typing.Dict[str, typing.Any]:
+    protocol, flags, length, reserved = _HEADER.unpack(
+        await _receive_exactly(connection, _HEADER.size)
+    )
+    if protocol != b"ZBXD":
+        raise ValueError(f"Unknown protocol {protocol!r}")
+    data = await _receive_exactly(connection, length)
+    if flags & _FLAG_COMPRESSED:
+        data = zlib.decompress(data)
+    request = json.loads(data)
+    if not isinstance(request, dict):
+        raise ValueError("Request is not a JSON object")
+    return request
+
+
+async def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    received = bytearray()
+    while len(received) < size:
+        await _wait_readable(connection)
+        try:
+            chunk = connection.recv(size - len(received))
+        except BlockingIOError:
+            continue
+        if not chunk:
+            raise anyio.IncompleteRead
+        received += chunk
+    return bytes(received)
+
+
+async def _send_all(connection: socket.socket, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        await _wait_writable(connection)
+        try:
+            sent = connection.send(view)
+        except BlockingIOError:
+            continue
+        view = view[sent:]
+
+
+async def serve_and_report(
+    server: FakeZabbixServer,
+    host: str,
+    port: int,
+    report_interval: float,
+    report: typing.Callable[[str], None] = print,
+) -> None:
+    """Serve requests until cancelled while reporting the statistics periodically.
+
+    :param server: The fake Zabbix server.
+    :param host: The local interface to bind to.
+    :param port: The local port to bind to.
+    :param report_interval: Seconds between the reports.
+    :param report: Called with every report.
+    """
+    async with anyio.create_task_group() as task_group:
+        bound_port = await task_group.start(server.serve, host, port)
+        report(f"Fake Zabbix server listening on {host}:{bound_port}")
+        while True:
+            await anyio.sleep(report_interval)
+            report(repr(server.statistics))
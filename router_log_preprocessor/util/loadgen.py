@@ -0,0 +1,103 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import contextlib
+import dataclasses
+import itertools
+import typing
+
+import anyio
+
+import router_log_preprocessor.util.synthetic as synthetic
+
+# The sending is paced in ticks of this many seconds
+_TICK = 0.01
+
+
+@dataclasses.dataclass
+class LoadStatistics:
+    """Counters describing a finished load generation."""
+
+    sent: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """The number of datagrams sent per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.sent / self.elapsed
+
+
+async def generate_load(
+    fleet: synthetic.RouterFleet,
+    host: str,
+    port: int,
+    rate: float,
+    duration: typing.Optional[float] = None,
+    count: typing.Optional[int] = None,
+    statistics: typing.Optional[LoadStatistics] = None,
+    sockets: int = 1,
+) -> LoadStatistics:
+    """Send synthetic router logs to a log server at a target rate.
+
+    The datagrams due since the start are sent every tick, so the target rate is kept
+    on average even if a single tick is late. The load generation stops after the
+    duration or the count, whichever comes first, and otherwise runs until cancelled.
+
+    The datagrams are sent round-robin from several sockets, each with its own source
+    port, so that a log server with several workers sharing the port using
+    SO_REUSEPORT spreads the load between them.
+
+    :param fleet: The fleet of routers generating the logs.
+    :param host: The host of the log server.
+    :param port: The UDP port of the log server.
+    :param rate: The target number of datagrams per second.
+    :param duration: Optional number of seconds to send for.
+    :param count: Optional number of datagrams to send.
+    :param statistics: Optional counters updated while sending, e.g. to report them
+                       when the load generation is interrupted.
+    :param sockets: The number of sockets to send the datagrams from.
+    :return: The statistics of the load generation.
+    """
+    if statistics is None:
+        statistics = LoadStatistics()
+    datagrams = fleet.datagrams()
+    async with contextlib.AsyncExitStack() as stack:
+        udp_sockets = [
+            await stack.enter_async_context(
+                await anyio.create_connected_udp_socket(
+                    remote_host=host, remote_port=port
+                )
+            )
+            for _ in range(sockets)
+        ]
+        senders = itertools.cycle(udp_sockets)
+        started = anyio.current_time()
+        try:
+            while True:
+                elapsed = anyio.current_time() - started
+                if duration is not None and elapsed >= duration:
+                    break
+                due = int(elapsed * rate) + 1
+                if count is not None:
+                    due = min(due, count)
+                while statistics.sent < due:
+                    await next(senders).send(next(datagrams))
+                    statistics.sent += 1
+                if count is not None and statistics.sent >= count:
+                    break
+                await anyio.sleep(_TICK)
+        finally:
+            statistics.elapsed = anyio.current_time() - started
+    return statistics
@@ -11,28 +11,199 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import atexit
+import copy
 import logging
+import logging.handlers
+import queue
+import threading
+import typing
 
 import router_log_preprocessor.settings
+import router_log_preprocessor.util.archive as archive
+import router_log_preprocessor.util.metrics as metrics
 
 __all__ = ["echo_logger", "logger"]
 
+# A log record together with the handler that writes it
+_QueueEntry = typing.Tuple[logging.Handler, logging.LogRecord]
+
+_DROPPED = metrics.registry.counter(
+    "rlp_log_records_dropped_total",
+    "Log records dropped as the queue of the background log writer was full.",
+    ("logger",),
+)
+# Renders the exceptions of the application log records before they are queued
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class EchoFormatter(logging.Formatter):
+    """Formatter of the received log entries.
+
+    The entries are logged as the raw packets or decoded strings, so the decoding and
+    stripping happens in the background writer instead of on the event loop.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.msg
+        if isinstance(message, bytes):
+            return message.decode("ascii", "replace").strip()
+        return str(message).strip()
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """File handler which leaves flushing to the background writer."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler which drops records when the queue is full instead of blocking.
+
+    Records at WARNING or above are never dropped, instead the caller waits for room
+    in the queue. Records are formatted by the target handler in the background
+    writer. Unless the messages are formatted when enqueued, the message and its
+    arguments must not change after the logging call.
+    """
+
+    def __init__(
+        self,
+        log_queue: "queue.Queue[typing.Any]",
+        target: logging.Handler,
+        name: str = "",
+        format_messages: bool = False,
+    ) -> None:
+        super().__init__(log_queue)
+        self._target = target
+        self._format_messages = format_messages
+        self._dropped = _DROPPED.labels(name)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> typing.Any:
+        if self._format_messages:
+            # Merge the arguments into the message while they are still unchanged
+            record = copy.copy(record)
+            record.message = record.getMessage()
+            if record.exc_info and not record.exc_text:
+                record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.msg = record.message
+            record.args = None
+            record.exc_info = None
+        return self._target, record
+
+    def enqueue(self, record: typing.Any) -> None:
+        if typing.cast(_QueueEntry, record)[1].levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._dropped.inc()
+
+
+class BackgroundWriter:
+    """Writes the queued log records in a background thread.
+
+    All records available in the queue are written before the handlers are flushed,
+    so a burst of records results in a single flush per handler. While no records
+    arrive the handlers are flushed every `flush_interval` seconds, so handlers holding
+    back records, such as the archive handler, write them without waiting for the next
+    record.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        log_queue: "queue.Queue[typing.Any]",
+        name: str = "rlp-log-writer",
+        flush_interval: float = 1.0,
+    ) -> None:
+        self._queue = log_queue
+        self._name = name
+        self._flush_interval = flush_interval
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the remaining records and stop the background thread."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        handlers: typing.Set[logging.Handler] = set()
+        stopping = False
+        while not stopping:
+            try:
+                entries = [self._queue.get(timeout=self._flush_interval)]
+            except queue.Empty:
+                for handler in handlers:
+                    handler.flush()
+                continue
+            try:
+                while True:
+                    entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            pending: typing.Set[logging.Handler] = set()
+            for entry in entries:
+                if entry is self._STOP:
+                    stopping = True
+                    continue
+                handler, record = typing.cast(_QueueEntry, entry)
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    pending.add(handler)
+            for handler in pending:
+                handler.flush()
+            handlers.update(pending)
+
 
 def echo_logger_factory() -> logging.Logger:
     settings = router_log_preprocessor.settings.settings()
-    # Only log the actual message
-    formatter = logging.Formatter(fmt="%(message)s")
+    base_logger = logging.getLogger(f"{settings.logging_name_base}.echo")
+    base_logger.setLevel(logging.DEBUG)
+    if not settings.logging_echo:
+        # Received logs are not echoed, so skip the logging calls altogether
+        base_logger.disabled = True
+        return base_logger
 
-    # Setup a file handler to log in desired directory
-    handler = logging.FileHandler(
-        filename=settings.logging_directory / f"{settings.logging_name_base}.echo.log"
-    )
-    handler.setFormatter(formatter)
+    handler: logging.Handler
+    if settings.logging_echo_archive:
+        # Archive the raw datagrams in the desired directory
+        handler = archive.ArchiveHandler(
+            archive.ArchiveWriter(
+                settings.logging_directory / f"{settings.logging_name_base}.echo",
+                segment_size=settings.logging_echo_archive_segment_size,
+                segment_age=settings.logging_echo_archive_segment_age,
+                compression=settings.logging_echo_archive_compression,
+            )
+        )
+    else:
+        # Setup a file handler to log in desired directory
+        handler = BufferedFileHandler(
+            filename=(
+                settings.logging_directory / f"{settings.logging_name_base}.echo.log"
+            )
+        )
+        # Only log the actual message
+        handler.setFormatter(EchoFormatter())
 
     # Configure the logger
-    base_logger = logging.getLogger(f"{settings.logging_name_base}.echo")
-    base_logger.addHandler(handler)
-    base_logger.setLevel(logging.DEBUG)
+    base_logger.addHandler(DroppingQueueHandler(_echo_queue, handler, name="echo"))
 
     return base_logger
 
@@ -45,18 +216,35 @@ def logger_factory() -> logging.Logger:
     )
 
     # Setup a file handler to log in desired directory
-    handler = logging.FileHandler(
+    handler = BufferedFileHandler(
         filename=settings.logging_directory / f"{settings.logging_name_base}.app.log"
     )
     handler.setFormatter(formatter)
 
     # Configure the logger
     base_logger = logging.getLogger(f"{settings.logging_name_base}.app")
-    base_logger.addHandler(handler)
+    base_logger.addHandler(
+        DroppingQueueHandler(_app_queue, handler, name="app", format_messages=True)
+    )
     base_logger.setLevel(settings.logging_level)
 
     return base_logger
 
 
+# The echoed logs have their own queue and writer, so a burst of received logs cannot
+# crowd out the records of the application log
+_app_queue: "queue.Queue[typing.Any]" = queue.Queue(
+    maxsize=router_log_preprocessor.settings.settings().logging_queue_size
+)
+_echo_queue: "queue.Queue[typing.Any]" = queue.Queue(
+    maxsize=router_log_preprocessor.settings.settings().logging_queue_size
+)
+for _writer in (
+    BackgroundWriter(_app_queue),
+    BackgroundWriter(_echo_queue, name="rlp-echo-writer"),
+):
+    _writer.start()
+    atexit.register(_writer.stop)
+
 logger = logger_factory()
 echo_logger = echo_logger_factory()
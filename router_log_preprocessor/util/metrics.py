@@ -0,0 +1,278 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Metrics of the pipeline internals in the Prometheus text exposition format.
+
+The metrics are registered in the module level `registry` by the modules updating
+them, and exposed over HTTP on `/metrics` by `serve_metrics`.
+"""
+import bisect
+import math
+import typing
+
+import anyio
+import anyio.abc
+import anyio.streams.buffered
+
+# Buckets in seconds suited for the per-record latencies of the log server
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Buckets suited for the number of measurements sent in a bundle
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_Labels = typing.Tuple[str, ...]
+_MetricType = typing.TypeVar("_MetricType", bound="_Metric")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: _Labels, values: _Labels) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: _Labels) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: typing.Dict[_Labels, typing.Any] = {}
+
+    def labels(self: _MetricType, *values: str) -> _MetricType:
+        """Get the child metric of the given label values.
+
+        :param values: The value of every label name in order.
+        :return: The child metric.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Expected labels {self.labelnames} of {self.name}")
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self: _MetricType) -> _MetricType:
+        return type(self)(self.name, self.documentation, ())  # type: ignore[call-arg]
+
+    def render(self) -> typing.List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        if self.labelnames:
+            for values, child in sorted(self._children.items()):
+                lines.extend(child._samples(self.labelnames, values))
+        else:
+            lines.extend(self._samples((), ()))
+        return lines
+
+    def _samples(self, names: _Labels, values: _Labels) -> typing.List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: _Labels = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def _samples(self, names: _Labels, values: _Labels) -> typing.List[str]:
+        labels = _format_labels(names, values)
+        return [f"{self.name}{labels} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: _Labels = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def _samples(self, names: _Labels, values: _Labels) -> typing.List[str]:
+        labels = _format_labels(names, values)
+        return [f"{self.name}{labels} {_format_value(self.value)}"]
+
+
+class Histogram(_Metric):
+    """Counts of observations in fixed buckets together with their sum."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: _Labels = (),
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket plus the count of observations above every bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, (), self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, names: _Labels, values: _Labels) -> typing.List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            labels = _format_labels(names + ("le",), values + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count{labels} {self.count}")
+        return lines
+
+
+class Registry:
+    """Collection of the metrics exposed together."""
+
+    def __init__(self) -> None:
+        self._metrics: typing.Dict[str, _Metric] = {}
+
+    def counter(
+        self, name: str, documentation: str, labelnames: _Labels = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: _Labels = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: _Labels = (),
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _MetricType) -> _MetricType:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        :return: The exposition.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+async def serve_metrics(
+    host: str,
+    port: int,
+    metrics_registry: Registry = registry,
+    *,
+    task_status: anyio.abc.TaskStatus[int] = anyio.TASK_STATUS_IGNORED,
+) -> None:
+    """Serve the metrics on `/metrics` over HTTP until cancelled.
+
+    :param host: The local interface to bind to.
+    :param port: The local port to bind to. 0 binds an ephemeral port.
+    :param metrics_registry: The metrics to serve.
+    :param task_status: Reports the bound port when started with `TaskGroup.start`.
+    """
+
+    async def handle(stream: anyio.abc.SocketStream) -> None:
+        async with stream:
+            buffered = anyio.streams.buffered.BufferedByteReceiveStream(stream)
+            try:
+                request_line = await buffered.receive_until(b"\r\n", 8192)
+            except (anyio.EndOfStream, anyio.IncompleteRead, anyio.DelimiterNotFound):
+                return
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] == b"/metrics":
+                status = b"200 OK"
+                body = metrics_registry.render().encode("utf-8")
+            else:
+                status = b"404 Not Found"
+                body = b"Not Found\n"
+            await stream.send(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+
+    listener = await anyio.create_tcp_listener(local_host=host, local_port=port)
+    async with listener:
+        task_status.started(listener.extra(anyio.abc.SocketAttribute.local_port))
+        await listener.serve(handle)
@@ -13,8 +13,9 @@
 #  limitations under the License.
 import dataclasses
 import datetime
+import functools
 import re
-from typing import Optional
+from typing import Callable, Generator, Iterable, Optional, Tuple, Union
 
 _RFC3164_PATTERN = re.compile(
     # Start of log
@@ -49,6 +50,22 @@ _MONTH = {
 }
 
 
+_BYTES_MONTH = {month.encode("ascii"): number for month, number in _MONTH.items()}
+
+# The characters allowed in the hostname and the TAG of the common layout, which is a
+# strict subset of the layouts accepted by _RFC3164_PATTERN. Anything else is left for
+# that pattern to decide.
+_HOSTNAME_CHARACTERS = bytes(range(ord("!"), ord("~") + 1)).replace(b":", b"")
+_TAG_CHARACTERS = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_- "
+
+# Facility, severity and timestamp of a log record
+_Prefix = Tuple[int, int, datetime.datetime]
+# Hostname, process name, process id and the ascii encoded process name of a log record
+_Source = Tuple[str, str, Optional[int], bytes]
+
+ErrorCallback = Callable[[Union[str, bytes], Exception], None]
+
+
 @dataclasses.dataclass
 class LogRecord:
     """The parsed log record with information contained in an RFC 3164 log line"""
@@ -80,14 +97,17 @@ def timestamp_to_datetime(
     :param second: The second entry is between 00 and 59 inclusive in local time.
     :return: The date and time of the timestamp.
     """
-    now = datetime.datetime.now()
-    return now.replace(
-        month=_MONTH[month],
-        day=int(day),
-        hour=int(hour),
-        minute=int(minute),
-        second=int(second),
-        microsecond=0,
+    return _timestamp(datetime.datetime.now().year, month, day, hour, minute, second)
+
+
+@functools.lru_cache(maxsize=4096)
+def _timestamp(
+    year: int, month: str, day: str, hour: str, minute: str, second: str
+) -> datetime.datetime:
+    # Log entries arrive in order, so the same timestamps repeat heavily within a
+    # second and the conversion is cached
+    return datetime.datetime(
+        year, _MONTH[month], int(day), int(hour), int(minute), int(second)
     )
 
 
@@ -101,6 +121,109 @@ def parse(record: str) -> LogRecord:
     :param record: A single text log record.
     :return: A parsed log record.
     """
+    return _parse(record, datetime.datetime.now().year)
+
+
+def parse_bytes(packet: bytes) -> LogRecord:
+    """Parse an ascii encoded log record according to RFC 3164 without decoding it
+    first.
+
+    The common layout of a log record is parsed directly on the bytes using fixed
+    offsets for the priority and timestamp and searches for the hostname and TAG
+    delimiters. These header fields repeat heavily between records, so they are
+    validated and decoded once and cached, leaving only the message to be decoded.
+    Records with any other layout are parsed by `parse`, so the result is always the
+    same as `parse(packet.decode("ascii"))`.
+
+    :param packet: A single ascii encoded log record.
+    :return: A parsed log record.
+    """
+    return _parse_bytes(packet, datetime.datetime.now().year)
+
+
+def peek_process(packet: bytes) -> Optional[bytes]:
+    """Extract the process name (TAG) of an ascii encoded log record without parsing
+    the rest of the record.
+
+    :param packet: A single ascii encoded log record.
+    :return: The process name exactly as `parse_bytes` would parse it or None if the
+             record does not follow the common layout, in which case the record must
+             be parsed to know the process name.
+    """
+    source = _peek_source(packet)
+    return None if source is None else source[3]
+
+
+def peek_hostname(packet: bytes) -> Optional[str]:
+    """Extract the hostname of an ascii encoded log record without parsing the rest
+    of the record.
+
+    :param packet: A single ascii encoded log record.
+    :return: The hostname exactly as `parse_bytes` would parse it or None if the
+             record does not follow the common layout, in which case the record must
+             be parsed to know the hostname.
+    """
+    source = _peek_source(packet)
+    return None if source is None else source[0]
+
+
+def parse_many(
+    records: Iterable[str], on_error: Optional[ErrorCallback] = None
+) -> Generator[LogRecord, None, None]:
+    """Parse multiple raw log records lazily.
+
+    The clock is only read once for the whole batch, which is otherwise the same as
+    calling `parse` for every record.
+
+    :param records: Text log records.
+    :param on_error: Optional callback receiving the records that cannot be parsed and
+                     the corresponding exception. Such records are skipped. If no
+                     callback is given, the exception is raised.
+    :return: A generator of parsed log records.
+    """
+    year = datetime.datetime.now().year
+    for record in records:
+        try:
+            parsed_record = _parse(record, year)
+        except (RuntimeError, ValueError, KeyError) as exception:
+            if on_error is None:
+                raise
+            on_error(record, exception)
+            continue
+        yield parsed_record
+
+
+def parse_bytes_batch(
+    buffers: Iterable[bytes],
+    on_error: Optional[ErrorCallback] = None,
+    use_bytes_parser: bool = False,
+) -> Generator[LogRecord, None, None]:
+    """Parse multiple ascii encoded log records lazily, e.g. received datagrams.
+
+    :param buffers: Ascii encoded log records.
+    :param on_error: Optional callback receiving the records that cannot be decoded
+                     or parsed and the corresponding exception. Such records are
+                     skipped. If no callback is given, the exception is raised.
+    :param use_bytes_parser: True to parse the records like `parse_bytes` and False to
+                             decode and parse the records like `parse`.
+    :return: A generator of parsed log records.
+    """
+    year = datetime.datetime.now().year
+    for buffer in buffers:
+        try:
+            if use_bytes_parser:
+                record = _parse_bytes(buffer, year)
+            else:
+                record = _parse(buffer.decode("ascii"), year)
+        except (RuntimeError, ValueError, KeyError) as exception:
+            if on_error is None:
+                raise
+            on_error(buffer, exception)
+            continue
+        yield record
+
+
+def _parse(record: str, year: int) -> LogRecord:
     match = _RFC3164_PATTERN.match(record)
     if match is None:
         raise RuntimeError(f"Could not parse record according to RFC3164: {record}")
@@ -110,7 +233,7 @@ def parse(record: str) -> LogRecord:
     return LogRecord(
         facility=facility,
         severity=severity,
-        timestamp=timestamp_to_datetime(*groups[1:6]),
+        timestamp=_timestamp(year, *groups[1:6]),
         hostname=groups[6],
         # If the process name is given then there will be a leading space included
         # from the space after the hostname. That space is removed using lstrip().
@@ -118,3 +241,140 @@ def parse(record: str) -> LogRecord:
         process_id=int(groups[8]) if groups[8] is not None else None,
         message=groups[9],
     )
+
+
+def _parse_bytes(packet: bytes, year: int) -> LogRecord:
+    record = _parse_common_layout(packet, year)
+    if record is None:
+        # Leave the uncommon layouts and the error handling to the regular expression
+        return _parse(packet.decode("ascii"), year)
+    return record
+
+
+def _parse_common_layout(packet: bytes, year: int) -> Optional[LogRecord]:
+    split = _split_common_layout(packet)
+    if split is None:
+        return None
+    raw_prefix, raw_source, message_start = split
+    prefix = _parse_prefix(year, raw_prefix)
+    source = _parse_source(raw_source)
+    if prefix is None or source is None:
+        return None
+
+    # Message where only a single trailing newline is allowed
+    message = packet[message_start:]
+    if b"\n" in message:
+        if message.find(b"\n") != len(message) - 1:
+            return None
+        message = message[:-1]
+
+    facility, severity, timestamp = prefix
+    hostname, process, process_id, _ = source
+    return LogRecord(
+        facility,
+        severity,
+        timestamp,
+        hostname,
+        process,
+        process_id,
+        message.decode("ascii"),
+    )
+
+
+def _peek_source(packet: bytes) -> Optional[_Source]:
+    split = _split_common_layout(packet)
+    if split is None or not _is_prefix(split[0]):
+        return None
+    return _parse_source(split[1])
+
+
+def _split_common_layout(packet: bytes) -> Optional[Tuple[bytes, bytes, int]]:
+    """Split a log record with the common layout
+
+        <pri>Mmm dd hh:mm:ss hostname tag[pid]: message
+
+    into the prefix of the priority and timestamp, which has a fixed width after the
+    priority, and the source of the hostname and TAG ending at the first ": ". Both
+    repeat heavily between log records, so they are validated separately by
+    `_parse_prefix` and `_parse_source`.
+
+    :param packet: A single ascii encoded log record.
+    :return: The prefix, the source and the offset of the message or None if the log
+             record is too short.
+    """
+    if packet[:1] != b"<":
+        return None
+    # Priority of one to three digits followed by the timestamp and a space
+    pri_end = packet.find(b">", 1, 5)
+    if pri_end < 2:
+        return None
+    source_start = pri_end + 17
+    source_end = packet.find(b": ", source_start)
+    if source_end < 0:
+        return None
+    return packet[:source_start], packet[source_start:source_end], source_end + 2
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_prefix(prefix: bytes) -> bool:
+    # The layout is "<pri>Mmm dd hh:mm:ss " where a single digit day is padded by a
+    # space, so the timestamp is at a fixed offset from the end
+    timestamp = prefix[-16:-1]
+    digits = timestamp[5:6] + timestamp[7:9] + timestamp[10:12] + timestamp[13:15]
+    return (
+        prefix[1:-17].isdigit()
+        and prefix[-17:-16] == b">"
+        and prefix[-1:] == b" "
+        and timestamp[:3] in _BYTES_MONTH
+        # The separators at offset 3, 6, 9 and 12 of the timestamp
+        and timestamp[3::3] == b"  ::"
+        and (timestamp[4:5] == b" " or timestamp[4:5].isdigit())
+        and len(digits) == 7
+        and digits.isdigit()
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_prefix(year: int, prefix: bytes) -> Optional[_Prefix]:
+    if not _is_prefix(prefix):
+        return None
+    timestamp = prefix[-16:-1]
+    try:
+        parsed_timestamp = datetime.datetime(
+            year,
+            _BYTES_MONTH[timestamp[:3]],
+            int(timestamp[4:6]),
+            int(timestamp[7:9]),
+            int(timestamp[10:12]),
+            int(timestamp[13:15]),
+        )
+    except ValueError:
+        return None
+    # Priority is facility * 8 + severity, so divmod is the inverse of that
+    facility, severity = divmod(int(prefix[1:-17]), 8)
+    return facility, severity, parsed_timestamp
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_source(source: bytes) -> Optional[_Source]:
+    # Hostname of printable characters except colon ending at the first space
+    hostname_end = source.find(b" ")
+    if hostname_end <= 0:
+        return None
+    hostname = source[:hostname_end]
+    if hostname.translate(None, _HOSTNAME_CHARACTERS):
+        return None
+
+    # TAG including the leading space and an optional process id
+    tag = source[hostname_end:]
+    process_id = None
+    if tag.endswith(b"]"):
+        process_id_start = tag.find(b"[")
+        if process_id_start < 0 or not tag[process_id_start + 1 : -1].isdigit():
+            return None
+        process_id = int(tag[process_id_start + 1 : -1])
+        tag = tag[:process_id_start]
+    if tag.translate(None, _TAG_CHARACTERS):
+        return None
+    process = tag.lstrip()
+    return hostname.decode("ascii"), process.decode("ascii"), process_id, process
@@ -0,0 +1,213 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Synthetic RFC 3164 logs emulating a fleet of ASUS routers.
+
+The logs have the shapes handled by the wlceventd and dnsmasq-dhcp preprocessors, with
+clients joining, roaming between the routers and leaving, mixed with logs of processes
+that are not preprocessed.
+"""
+import dataclasses
+import datetime
+import random
+import typing
+
+_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+_INTERFACES = ("wl0.1", "wl1.1", "eth6", "eth7")
+_DISASSOCIATION_REASONS = (
+    "Disassociated because sending station is leaving (or has left) BSS (8)",
+    "Disassociated due to inactivity (4)",
+)
+_DEAUTHENTICATION_REASONS = (
+    "Unspecified reason (1)",
+    "Previous authentication no longer valid (2)",
+)
+DEFAULT_NOISE_PROCESSES = ("kernel", "dropbear", "crond", "avahi-daemon", "rc_service")
+_NOISE_MESSAGES = (
+    "br0: port 2(eth2) entered forwarding state",
+    "Password auth succeeded for 'admin' from 192.168.1.10:51234",
+    "USER admin pid 1234 cmd /usr/sbin/logrotate /tmp/logrotate.conf",
+    "Registering new address record for 192.168.1.1 on br0.IPv4.",
+    "httpd 1234:notify_rc restart_wireless",
+)
+
+
+@dataclasses.dataclass
+class _Client:
+    mac_address: str
+    ip_address: str
+    hostname: str
+    router: int = 0
+    interface: str = _INTERFACES[0]
+    is_associated: bool = False
+
+
+class RouterFleet:
+    def __init__(
+        self,
+        routers: int = 1,
+        clients: int = 100,
+        noise_processes: typing.Sequence[str] = DEFAULT_NOISE_PROCESSES,
+        noise_ratio: float = 0.2,
+        seed: typing.Optional[int] = None,
+    ) -> None:
+        """Create a fleet of routers with a population of wireless clients.
+
+        :param routers: The number of routers, each logging with its own hostname.
+        :param clients: The number of clients roaming between the routers.
+        :param noise_processes: The processes of the logs that are not preprocessed.
+        :param noise_ratio: The fraction of the logs coming from the noise processes.
+        :param seed: Seed of the random generator for reproducible logs.
+        """
+        self._random = random.Random(seed)
+        self._hostnames = [
+            f"RT-AX88U-{index:04X}-{self._random.randrange(16**7):07X}-E"
+            for index in range(routers)
+        ]
+        self._clients = [
+            _Client(
+                mac_address=":".join(
+                    f"{self._random.randrange(256):02x}" for _ in range(6)
+                ),
+                ip_address=f"192.168.{101 + index // 250}.{2 + index % 250}",
+                hostname=f"client-{index}",
+            )
+            for index in range(clients)
+        ]
+        self._noise_processes = noise_processes
+        self._noise_ratio = noise_ratio if noise_processes else 0.0
+
+    def datagrams(
+        self,
+        now: typing.Callable[[], datetime.datetime] = datetime.datetime.now,
+    ) -> typing.Generator[bytes, None, None]:
+        """Generate an endless stream of log datagrams.
+
+        :param now: The clock used for the timestamp of the logs.
+        :return: Generator of RFC 3164 datagrams.
+        """
+        while True:
+            timestamp = _timestamp(now())
+            if self._random.random() < self._noise_ratio:
+                yield self._noise(timestamp)
+                continue
+            for hostname, process, message in self._client_event():
+                yield f"<30>{timestamp} {hostname} {process}: {message}".encode("ascii")
+
+    def corpus(
+        self,
+        count: int,
+        now: typing.Callable[[], datetime.datetime] = datetime.datetime.now,
+    ) -> typing.List[bytes]:
+        """Generate a fixed number of log datagrams.
+
+        :param count: The number of datagrams.
+        :param now: The clock used for the timestamp of the logs.
+        :return: The datagrams.
+        """
+        datagrams = self.datagrams(now)
+        return [next(datagrams) for _ in range(count)]
+
+    def _noise(self, timestamp: str) -> bytes:
+        process = self._random.choice(self._noise_processes)
+        message = self._random.choice(_NOISE_MESSAGES)
+        hostname = self._random.choice(self._hostnames)
+        process_id = self._random.randrange(100, 5000)
+        return f"<14>{timestamp} {hostname} {process}[{process_id}]: {message}".encode(
+            "ascii"
+        )
+
+    def _client_event(
+        self,
+    ) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
+        client = self._random.choice(self._clients)
+        if not client.is_associated:
+            client.router = self._random.randrange(len(self._hostnames))
+            client.interface = self._random.choice(_INTERFACES)
+            yield from self._join(client)
+            return
+
+        event = self._random.random()
+        if event < 0.4:
+            yield self._wlc(client, "ReAssoc", "status: Successful (0)")
+        elif event < 0.6:
+            yield from self._leave(client)
+            client.router = (client.router + 1) % len(self._hostnames)
+            client.interface = self._random.choice(_INTERFACES)
+            yield from self._join(client)
+        elif event < 0.8:
+            yield self._dhcp_acknowledge(client)
+        else:
+            yield from self._leave(client)
+
+    def _join(
+        self, client: _Client
+    ) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
+        client.is_associated = True
+        yield self._wlc(client, "Auth", "status: Successful (0)")
+        yield self._wlc(client, "Assoc", "status: Successful (0)")
+        yield self._dhcp_acknowledge(client)
+
+    def _leave(
+        self, client: _Client
+    ) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
+        client.is_associated = False
+        if self._random.random() < 0.5:
+            reason = self._random.choice(_DISASSOCIATION_REASONS)
+            yield self._wlc(client, "Disassoc", f"status: 0, reason: {reason}")
+        else:
+            reason = self._random.choice(_DEAUTHENTICATION_REASONS)
+            yield self._wlc(client, "Deauth_ind", f"status: 0, reason: {reason}")
+
+    def _wlc(
+        self, client: _Client, event: str, details: str
+    ) -> typing.Tuple[str, str, str]:
+        rssi = 0
+        if event in ("Assoc", "ReAssoc"):
+            rssi = -self._random.randrange(30, 90)
+        message = (
+            f"wlceventd_proc_event({self._random.randrange(400, 600)}): "
+            f"{client.interface}: {event} {client.mac_address.upper()}, {details}, "
+            f"rssi:{rssi}"
+        )
+        return self._hostnames[client.router], "wlceventd", message
+
+    def _dhcp_acknowledge(self, client: _Client) -> typing.Tuple[str, str, str]:
+        message = (
+            f"DHCPACK(br0) {client.ip_address} {client.mac_address} {client.hostname}"
+        )
+        return (
+            self._hostnames[client.router],
+            f"dnsmasq-dhcp[{self._random.randrange(1000, 5000)}]",
+            message,
+        )
+
+
+def _timestamp(now: datetime.datetime) -> str:
+    return (
+        f"{_MONTHS[now.month - 1]} {now.day:>2} "
+        f"{now.hour:02}:{now.minute:02}:{now.second:02}"
+    )
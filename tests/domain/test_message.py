@@ -0,0 +1,97 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import ipaddress
+
+import pytest
+
+import router_log_preprocessor.domain as domain
+
+
+def test_message_validates_fields():
+    message = domain.WlcEventModel(
+        mac_address="ab:cd:ef:01:23:45",  # type: ignore[arg-type]
+        location="wl0.1",
+        event=2000000,  # type: ignore[arg-type]
+        status="0",  # type: ignore[arg-type]
+        rssi="-70",  # type: ignore[arg-type]
+        reason="",
+    )
+
+    assert message.mac_address == domain.MAC("AB:CD:EF:01:23:45")
+    assert message.event == domain.WlcEvent.AUTHENTICATE
+    assert message.status == 0
+    assert message.rssi == -70
+
+
+def test_message_validates_ip_address():
+    message = domain.DnsmasqDhcpAcknowledge(
+        mac_address=domain.MAC("AB:CD:EF:01:23:45"),
+        ip_address="192.168.101.149",  # type: ignore[arg-type]
+        hostname="fake-client",
+    )
+
+    assert message.ip_address == ipaddress.IPv4Address("192.168.101.149")
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"mac_address": "not a mac", "ip_address": "192.168.101.149"},
+        {"mac_address": "ab:cd:ef:01:23:45", "ip_address": "not an ip"},
+    ],
+)
+def test_message_invalid_field(fields):
+    with pytest.raises(ValueError):
+        domain.DnsmasqDhcpAcknowledge(hostname="fake-client", **fields)
+
+
+def test_trusted_message_is_not_validated():
+    message = domain.DnsmasqDhcpAcknowledge.trusted(
+        mac_address="ab:cd:ef:01:23:45",
+        ip_address="192.168.101.149",
+        hostname="fake-client",
+    )
+
+    assert message.mac_address == "ab:cd:ef:01:23:45"
+    assert message.ip_address == "192.168.101.149"
+    assert message == domain.DnsmasqDhcpAcknowledge.trusted(
+        mac_address="ab:cd:ef:01:23:45",
+        ip_address="192.168.101.149",
+        hostname="fake-client",
+    )
+
+
+def test_message_is_slotted():
+    message = domain.DnsmasqDhcpAcknowledge(
+        mac_address=domain.MAC("AB:CD:EF:01:23:45"),
+        ip_address=ipaddress.IPv4Address("192.168.101.149"),
+        hostname="fake-client",
+    )
+
+    assert not hasattr(message, "__dict__")
+
+
+def test_intern_mac_returns_same_instance():
+    mac_address = domain.intern_mac("ab:cd:ef:01:23:45")
+
+    assert mac_address is domain.intern_mac("ab:cd:ef:01:23:45")
+    assert mac_address == domain.MAC("AB-CD-EF-01-23-45")
+    assert hash(mac_address) == hash(domain.MAC("AB-CD-EF-01-23-45"))
+    assert str(mac_address) == "AB-CD-EF-01-23-45"
+    assert str(mac_address) is str(mac_address)
+
+
+def test_intern_mac_invalid():
+    with pytest.raises(ValueError):
+        domain.intern_mac("not a mac")
@@ -11,15 +11,20 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import dataclasses
 import datetime
+import json
 import unittest.mock
 
+import anyio
+import asyncio_zabbix_sender
 import pytest
 
 import router_log_preprocessor.domain
 import router_log_preprocessor.hooks.zabbix
+import router_log_preprocessor.hooks.zabbix._mapper as mapper
 import router_log_preprocessor.util.rfc3164_parser
-from tests.hooks.util import RECORD, MESSAGE, MockedDatetime
+from tests.hooks.util import RECORD, MESSAGE, MockedDatetime, started
 
 # All test functions in this module should be tested using anyio
 pytestmark = pytest.mark.anyio
@@ -30,7 +35,12 @@ async def test_discover_client_not_known(zabbix_sender):
         sender=zabbix_sender, client_discovery_wait_time=30
     )
 
-    wait_time = await zabbix_trapper.discover_client(RECORD, MESSAGE)
+    with anyio.fail_after(5):
+        async with started(zabbix_trapper):
+            wait_time = await zabbix_trapper.discover_client(RECORD, MESSAGE)
+            # The discovery is sent by the scheduler
+            zabbix_sender.send.assert_not_called()
+            await zabbix_trapper.flush()
 
     assert wait_time == 30
     zabbix_sender.send.assert_called_once()
@@ -46,7 +56,10 @@ async def test_discover_client_just_known(zabbix_sender):
     try:
         datetime.datetime = MockedDatetime
         MockedDatetime.faked_utcnow = first_call_time
-        await zabbix_trapper.discover_client(RECORD, MESSAGE)
+        async with started(zabbix_trapper):
+            await zabbix_trapper.discover_client(RECORD, MESSAGE)
+            await zabbix_trapper.flush()
+        zabbix_sender.send.assert_called_once()
         zabbix_sender.send.reset_mock()
 
         MockedDatetime.faked_utcnow = next_call_time
@@ -68,7 +81,10 @@ async def test_discover_client_known_and_discovered(zabbix_sender):
     try:
         datetime.datetime = MockedDatetime
         MockedDatetime.faked_utcnow = first_call_time
-        await zabbix_trapper.discover_client(RECORD, MESSAGE)
+        async with started(zabbix_trapper):
+            await zabbix_trapper.discover_client(RECORD, MESSAGE)
+            await zabbix_trapper.flush()
+        zabbix_sender.send.assert_called_once()
         zabbix_sender.send.reset_mock()
 
         MockedDatetime.faked_utcnow = next_call_time
@@ -81,38 +97,77 @@ async def test_discover_client_known_and_discovered(zabbix_sender):
 
 
 async def test_send_new_client(zabbix_sender):
-    total_wait_time = 42
+    total_wait_time = 0.05
     with unittest.mock.patch.object(
         router_log_preprocessor.hooks.zabbix.ZabbixTrapper,
         "discover_client",
         return_value=total_wait_time,
     ) as mocked_discover_client:
         trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
-            zabbix_sender, total_wait_time
+            zabbix_sender, total_wait_time, measurement_bundle_wait_time=0.01
         )
 
-        with unittest.mock.patch("anyio.sleep") as mocked_sleep:
-            await trapper.send(RECORD, MESSAGE)
+        with anyio.fail_after(5):
+            async with started(trapper):
+                sent_at = anyio.current_time()
+                await trapper.send(RECORD, MESSAGE)
+                await trapper.flush()
 
     mocked_discover_client.assert_called()
-    # Ensure that the send method adheres to the wait time
-    mocked_sleep.assert_has_calls([unittest.mock.call(total_wait_time), unittest.mock.call(10)])
+    # Ensure that the measurements adhere to the wait time and the bundle timer
+    assert anyio.current_time() - sent_at >= total_wait_time + 0.01
     zabbix_sender.send.assert_called_once()
 
 
+async def test_send_new_client_parks_measurements(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(zabbix_sender, 42)
+
+    for _ in range(3):
+        await trapper.send(RECORD, MESSAGE)
+
+    # Nothing is sent while the discovery is scheduled and the measurements parked
+    zabbix_sender.send.assert_not_called()
+    assert trapper.pending_clients == 1
+    assert len(trapper._scheduled_discoveries) == 1
+    assert len(trapper._pending_deadlines) == 2
+    assert len(trapper._measurements) == 0
+
+
+async def test_release_pending_measurements_at_once(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 0.02, measurement_bundle_wait_time=0.01
+    )
+    for _ in range(3):
+        await trapper.send(RECORD, MESSAGE)
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.flush()
+
+    # One discovery and one bundle with the measurements of every message
+    assert zabbix_sender.send.call_count == 2
+    sent_measurements = zabbix_sender.send.call_args.args[0]
+    assert len(sent_measurements) == 3 * 5
+    assert trapper.pending_clients == 0
+
+
 async def test_send_known_client(zabbix_sender):
     with unittest.mock.patch.object(
         router_log_preprocessor.hooks.zabbix.ZabbixTrapper,
         "discover_client",
         return_value=0,
     ) as mocked_discover_client:
-        trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(zabbix_sender, 42)
+        trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+            zabbix_sender, 42, measurement_bundle_wait_time=0.01
+        )
 
-        with unittest.mock.patch("anyio.sleep") as mocked_sleep:
-            await trapper.send(RECORD, MESSAGE)
+        with anyio.fail_after(5):
+            async with started(trapper):
+                await trapper.send(RECORD, MESSAGE)
+                assert len(trapper._measurements) == 5
+                await trapper.flush()
 
     mocked_discover_client.assert_called()
-    mocked_sleep.assert_called_once_with(10)
     zabbix_sender.send.assert_called_once()
 
 
@@ -139,11 +194,223 @@ async def test_bundle_measurements(zabbix_sender):
             return_value=0,
     ) as mocked_discover_client:
         trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(zabbix_sender, 42)
-        trapper._is_bundling_measurements = True
 
-        with unittest.mock.patch("anyio.sleep") as mocked_sleep:
-            await trapper.send(RECORD, MESSAGE)
+        await trapper.send(RECORD, MESSAGE)
+        await trapper.send(RECORD, MESSAGE)
 
     mocked_discover_client.assert_called()
-    mocked_sleep.assert_not_called()
+    # The measurements are bundled until the bundler sends them
+    assert len(trapper._measurements) == 2 * 5
     zabbix_sender.send.assert_not_called()
+
+
+async def test_scheduler_wakes_for_earlier_deadline(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, measurement_bundle_wait_time=0
+    )
+    late_key = (RECORD.hostname, RECORD.process, MESSAGE.mac_address)
+    early_mac = router_log_preprocessor.domain.MAC("01:23:45:67:89:AB")
+    early_key = (RECORD.hostname, RECORD.process, early_mac)
+    trapper._park(late_key, RECORD, MESSAGE, 60)
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await anyio.sleep(0.01)
+            trapper._park(early_key, RECORD, MESSAGE, 0.01)
+            while early_key in trapper._pending:
+                await anyio.sleep(0.01)
+
+    assert late_key in trapper._pending
+
+
+async def test_discover_client_with_shared_store(zabbix_sender):
+    shared_store = {}
+    workers = [
+        router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+            zabbix_sender, 30, known_clients_store=shared_store
+        )
+        for _ in range(2)
+    ]
+
+    with anyio.fail_after(5):
+        async with started(workers[0]), started(workers[1]):
+            wait_times = [
+                await worker.discover_client(RECORD, MESSAGE) for worker in workers
+            ]
+            for worker in workers:
+                await worker.flush()
+
+    assert wait_times[0] == 30
+    assert wait_times[1] == pytest.approx(30, abs=0.1)
+    zabbix_sender.send.assert_called_once()
+
+
+async def test_full_bundle_is_sent_without_waiting(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, measurement_bundle_wait_time=60, max_bundle_items=2
+    )
+    measurement = asyncio_zabbix_sender.Measurement("host", "key", 1)
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            trapper._add_measurements([measurement])
+            await anyio.sleep(0.01)
+            zabbix_sender.send.assert_not_called()
+            trapper._add_measurements([measurement])
+            await trapper.flush()
+
+    zabbix_sender.send.assert_called_once()
+    assert len(zabbix_sender.send.call_args.args[0]) == 2
+
+
+async def test_oversized_bundle_is_split(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, measurement_bundle_wait_time=60, max_bundle_items=2
+    )
+    trapper._add_measurements(
+        asyncio_zabbix_sender.Measurement("host", f"key{index}", index)
+        for index in range(5)
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.flush()
+
+    sizes = [len(call.args[0]) for call in zabbix_sender.send.call_args_list]
+    assert sizes == [2, 2, 1]
+
+
+async def test_bundle_is_split_by_bytes(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, measurement_bundle_wait_time=0, max_bundle_bytes=200
+    )
+    trapper._add_measurements(
+        asyncio_zabbix_sender.Measurement("host", "key", "x" * 100) for _ in range(3)
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.flush()
+
+    assert zabbix_sender.send.call_count == 3
+
+
+async def test_empty_bundle_is_not_sent(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, measurement_bundle_wait_time=0
+    )
+
+    async with started(trapper):
+        await anyio.sleep(0.01)
+        await trapper.flush()
+
+    zabbix_sender.send.assert_not_called()
+
+
+async def test_known_clients_survive_restart(zabbix_sender, tmp_path):
+    path = tmp_path / "known-clients.bin"
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 30, known_clients_path=path
+    )
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.discover_client(RECORD, MESSAGE)
+            await trapper.flush()
+    await trapper.aclose()
+
+    restarted = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 30, known_clients_path=path
+    )
+    wait_time = await restarted.discover_client(RECORD, MESSAGE)
+
+    assert path.exists()
+    assert wait_time == pytest.approx(30, abs=0.1)
+    zabbix_sender.send.assert_called_once()
+
+
+async def test_known_clients_snapshot_leaves_out_queued_discovery(tmp_path):
+    path = tmp_path / "known-clients.bin"
+    zabbix_sender = unittest.mock.Mock(spec_set=asyncio_zabbix_sender.ZabbixSender)
+    zabbix_sender.send = unittest.mock.AsyncMock(
+        side_effect=ConnectionRefusedError("[Errno 111] Connect call failed")
+    )
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 30, measurement_bundle_wait_time=30, known_clients_path=path
+    )
+    trapper._known_clients.add_client("dnsmasq-dhcp", MESSAGE.mac_address)
+    async with started(trapper):
+        await trapper.discover_client(RECORD, MESSAGE)
+        await anyio.sleep(0.01)
+        assert trapper._queued_discoveries
+    await trapper.aclose()
+
+    restarted = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 30, known_clients_path=path
+    )
+
+    assert path.exists()
+    assert restarted._known_clients.is_client_known("dnsmasq-dhcp", MESSAGE.mac_address)
+    assert not restarted._known_clients.is_client_known(
+        RECORD.process, MESSAGE.mac_address
+    )
+
+
+async def test_discovery_of_new_clients_is_coalesced(zabbix_sender):
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender,
+        client_discovery_wait_time=0.02,
+        measurement_bundle_wait_time=0,
+        discovery_debounce=0.02,
+    )
+    messages = [
+        dataclasses.replace(
+            MESSAGE,
+            mac_address=router_log_preprocessor.domain.MAC(
+                f"AB:CD:EF:01:23:{index:02}"
+            ),
+        )
+        for index in range(10)
+    ]
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            for message in messages:
+                await trapper.send(RECORD, message)
+            await trapper.flush()
+
+    requests = [call.args[0].as_dict() for call in zabbix_sender.send.call_args_list]
+    assert len(requests) == 2
+    discovery = requests[0]["data"]
+    assert len(discovery) == 1
+    assert len(json.loads(discovery[0]["value"])) == 10
+    # The measurements of every discovered client are released together
+    assert len(requests[1]["data"]) == 10 * len(
+        list(mapper.map_client_message(RECORD, MESSAGE))
+    )
+    assert trapper.pending_clients == 0
+
+
+async def test_discovery_only_contains_live_clients(zabbix_sender, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(
+        router_log_preprocessor.hooks.zabbix._known_clients.KnownClients,
+        "_time",
+        lambda: now,
+    )
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        zabbix_sender, 30, known_clients_max_age=60, sweep_interval=0
+    )
+    new_message = dataclasses.replace(
+        MESSAGE, mac_address=router_log_preprocessor.domain.MAC("01:23:45:67:89:AB")
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.discover_client(RECORD, MESSAGE)
+            await trapper.flush()
+            now = 1100.0
+            await trapper.discover_client(RECORD, new_message)
+            await trapper.flush()
+
+    discovery = zabbix_sender.send.call_args.args[0].as_dict()["data"][0]
+    assert json.loads(discovery["value"]) == [{"mac": "01-23-45-67-89-AB"}]
@@ -0,0 +1,195 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest.mock
+
+import anyio
+import asyncio_zabbix_sender
+import pytest
+
+import router_log_preprocessor.hooks.zabbix
+from router_log_preprocessor.hooks.zabbix import CircuitOpenError, CircuitState
+from tests.hooks.util import MESSAGE, RECORD, started
+
+# All test functions in this module should be tested using anyio
+pytestmark = pytest.mark.anyio
+
+MEASUREMENTS = asyncio_zabbix_sender.Measurements(
+    [asyncio_zabbix_sender.Measurement("host", "key", 1)]
+)
+
+
+class FlakySender:
+    def __init__(self, failures, delay=0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = []
+        self.times = []
+
+    async def send(self, measurements):
+        self.calls.append(measurements)
+        self.times.append(anyio.current_time())
+        if self.delay:
+            await anyio.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionRefusedError("Connect call failed")
+        return unittest.mock.Mock(processed=1, failed=0)
+
+
+async def test_circuit_opens_after_threshold_and_fails_fast():
+    sender = FlakySender(failures=10)
+    breaker = router_log_preprocessor.hooks.zabbix.CircuitBreaker(
+        sender, failure_threshold=2, initial_backoff=60, seed=1
+    )
+
+    for _ in range(2):
+        with pytest.raises(ConnectionRefusedError):
+            await breaker.send(MEASUREMENTS)
+    assert breaker.state is CircuitState.OPEN
+    assert 30 <= breaker.retry_after <= 60
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.send(MEASUREMENTS)
+    assert len(sender.calls) == 2
+
+
+async def test_half_open_probe_closes_or_reopens_circuit():
+    sender = FlakySender(failures=2)
+    breaker = router_log_preprocessor.hooks.zabbix.CircuitBreaker(
+        sender, failure_threshold=1, initial_backoff=0.01, seed=1
+    )
+
+    with pytest.raises(ConnectionRefusedError):
+        await breaker.send(MEASUREMENTS)
+    await anyio.sleep(0.01)
+    # The failed probe opens the circuit with twice the backoff
+    with pytest.raises(ConnectionRefusedError):
+        await breaker.send(MEASUREMENTS)
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.retry_after > 0.005
+
+    await anyio.sleep(0.02)
+    await breaker.send(MEASUREMENTS)
+
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.retry_after == 0
+    assert len(sender.calls) == 3
+
+
+async def _send_concurrently(sender, count):
+    failures = []
+
+    async def send():
+        try:
+            await sender.send(MEASUREMENTS)
+        except ConnectionError as exception:
+            failures.append(exception)
+
+    async with anyio.create_task_group() as task_group:
+        for _ in range(count):
+            task_group.start_soon(send)
+    return failures
+
+
+async def test_concurrent_failures_open_circuit_once():
+    sender = FlakySender(failures=100, delay=0.01)
+    breaker = router_log_preprocessor.hooks.zabbix.CircuitBreaker(
+        sender, failure_threshold=2, initial_backoff=60, seed=1
+    )
+
+    failures = await _send_concurrently(breaker, 12)
+
+    # Every request was sent while the circuit was closed, but only the failure
+    # reaching the threshold opens the circuit
+    assert len(failures) == 12
+    assert len(sender.calls) == 12
+    assert breaker.state is CircuitState.OPEN
+    assert 30 <= breaker.retry_after <= 60
+
+
+async def test_pool_requests_fail_fast_once_circuit_opens():
+    sender = FlakySender(failures=100, delay=0.01)
+    pool = router_log_preprocessor.hooks.zabbix.SenderPool(
+        router_log_preprocessor.hooks.zabbix.CircuitBreaker(
+            sender, failure_threshold=2, initial_backoff=60, seed=1
+        ),
+        max_in_flight=2,
+    )
+
+    failures = await _send_concurrently(pool, 12)
+
+    # Only the requests holding a slot before the circuit opened reach the network
+    assert len(sender.calls) == 2
+    assert sum(isinstance(failure, CircuitOpenError) for failure in failures) == 10
+    assert 30 <= pool.retry_after <= 60
+
+
+async def test_failed_discovery_is_queued_and_sent_before_bundle():
+    sender = FlakySender(failures=1)
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        sender, client_discovery_wait_time=0.01, measurement_bundle_wait_time=0
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.send(RECORD, MESSAGE)
+            await trapper.flush()
+
+    assert trapper._queued_discoveries == {}
+    assert [request.as_dict()["data"][0]["key"] for request in sender.calls] == [
+        "rlp.client_discovery[wlceventd]",
+        "rlp.client_discovery[wlceventd]",
+        "rlp.wlceventd[location,AB-CD-EF-01-23-45]",
+    ]
+
+
+async def test_queued_discovery_restarts_discovery_wait():
+    sender = FlakySender(failures=1)
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        sender, client_discovery_wait_time=0.05, measurement_bundle_wait_time=0.01
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.send(RECORD, MESSAGE)
+            await trapper.flush()
+
+    assert [request.as_dict()["data"][0]["key"] for request in sender.calls] == [
+        "rlp.client_discovery[wlceventd]",
+        "rlp.client_discovery[wlceventd]",
+        "rlp.wlceventd[location,AB-CD-EF-01-23-45]",
+    ]
+    # Zabbix is given the full wait time after the queued discovery has been sent
+    assert sender.times[2] - sender.times[1] >= 0.05
+
+
+async def test_measurements_are_held_while_discovery_is_queued():
+    sender = FlakySender(failures=3)
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        sender, client_discovery_wait_time=0.01, measurement_bundle_wait_time=0.02
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.send(RECORD, MESSAGE)
+            await anyio.sleep(0.03)
+            # The wait time has elapsed, but the discovery is still queued
+            assert trapper._held
+            await trapper.send(RECORD, MESSAGE)
+            await trapper.flush()
+
+    keys = [request.as_dict()["data"][0]["key"] for request in sender.calls]
+    assert keys[:4] == ["rlp.client_discovery[wlceventd]"] * 4
+    assert keys[4:] == ["rlp.wlceventd[location,AB-CD-EF-01-23-45]"]
+    assert sender.times[4] - sender.times[3] >= 0.01
@@ -1,10 +1,12 @@
 import unittest.mock
 
+import anyio
+import asyncio_zabbix_sender
 import pytest
 
 import router_log_preprocessor.hooks.zabbix
 import router_log_preprocessor.util.rfc3164_parser
-from tests.hooks.util import RECORD, MESSAGE, RaiseOnce
+from tests.hooks.util import RECORD, MESSAGE, RaiseOnce, started
 
 # All test functions in this module should be tested using anyio
 pytestmark = pytest.mark.anyio
@@ -28,17 +30,20 @@ async def test_zabbix_hook_with_exception(
         router_log_preprocessor.hooks.zabbix.ZabbixTrapper,
         "discover_client",
         return_value=0,
-    ), unittest.mock.patch(
-        "anyio.sleep"
     ):
         zabbix_trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
-            sender=zabbix_sender_exception, client_discovery_wait_time=30
+            sender=zabbix_sender_exception,
+            client_discovery_wait_time=30,
+            measurement_bundle_wait_time=0,
         )
 
-        await zabbix_trapper.send(RECORD, MESSAGE)
+        with anyio.fail_after(5):
+            async with started(zabbix_trapper):
+                await zabbix_trapper.send(RECORD, MESSAGE)
+                await zabbix_trapper.flush()
 
     assert expected_raised.has_raised, "Should raise the exception once"
-    assert expected_raised.call_count == 2, "Should only recurse once"
+    assert expected_raised.call_count == 2, "Should only retry once"
 
     logged_exception = next(
         record
@@ -46,3 +51,29 @@ async def test_zabbix_hook_with_exception(
         if record.message.startswith("Connection error to Zabbix server: ")
     )
     assert logged_exception.message.endswith(repr(expected_raised.exception))
+
+
+async def test_failed_full_bundle_waits_before_retry():
+    zabbix_sender = unittest.mock.Mock(spec_set=asyncio_zabbix_sender.ZabbixSender)
+    zabbix_sender.send = unittest.mock.AsyncMock(
+        side_effect=ConnectionRefusedError("[Errno 111] Connect call failed")
+    )
+
+    with unittest.mock.patch.object(
+        router_log_preprocessor.hooks.zabbix.ZabbixTrapper,
+        "discover_client",
+        return_value=0,
+    ):
+        zabbix_trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+            sender=zabbix_sender,
+            measurement_bundle_wait_time=0.05,
+            max_bundle_items=5,
+        )
+
+        async with started(zabbix_trapper):
+            # The five measurements of the message fill the bundle
+            await zabbix_trapper.send(RECORD, MESSAGE)
+            await anyio.sleep(0.2)
+
+    # The full bundle is sent right away and then retried every retry delay
+    assert 2 <= zabbix_sender.send.await_count <= 6
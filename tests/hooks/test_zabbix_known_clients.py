@@ -81,3 +81,173 @@ def test_clients():
     clients = {client for client in repository.clients(process)}
 
     assert expected_clients == clients
+
+
+def test_shared_store():
+    process = "wlceventd"
+    mac_address = domain.MAC("AB:CD:EF:01:23:45")
+    shared_store = {}
+    first_worker = known_clients.KnownClients(42, shared_store)
+    second_worker = known_clients.KnownClients(42, shared_store)
+
+    is_added_by_first = first_worker.add_client(process, mac_address)
+    is_known_by_second = second_worker.is_client_known(process, mac_address)
+    is_added_by_second = second_worker.add_client(process, mac_address)
+
+    assert is_added_by_first
+    assert is_known_by_second
+    assert not is_added_by_second
+    assert {client for client in second_worker.clients(process)} == {mac_address}
+
+
+def test_snapshot_and_restore():
+    known = known_clients.KnownClients(42)
+    mac_address = domain.MAC("AB:CD:EF:01:23:45")
+    known.add_client("wlceventd", mac_address)
+    known.add_client("dnsmasq-dhcp", domain.MAC("01:23:45:67:89:AB"))
+    assert known.is_changed
+
+    snapshot = known.snapshot()
+    restored = known_clients.KnownClients(42)
+
+    assert not known.is_changed
+    assert len(snapshot) == 5 + 2 * (6 + 22) + len("wlceventd") + len("dnsmasq-dhcp")
+    assert restored.restore(snapshot) == 2
+    assert restored.is_client_known("wlceventd", mac_address)
+    assert list(restored.clients("wlceventd")) == [mac_address]
+    assert restored.remaining_wait_time("wlceventd", mac_address) == pytest.approx(
+        known.remaining_wait_time("wlceventd", mac_address), abs=0.1
+    )
+
+
+def test_snapshot_leaves_out_excluded_clients():
+    known = known_clients.KnownClients(42)
+    excluded = domain.MAC("AB:CD:EF:01:23:45")
+    included = domain.MAC("01:23:45:67:89:AB")
+    known.add_client("wlceventd", excluded)
+    known.add_client("wlceventd", included)
+
+    snapshot = known.snapshot({"wlceventd": {excluded}})
+    restored = known_clients.KnownClients(42)
+
+    # The excluded client must still be saved with a later snapshot
+    assert known.is_changed
+    assert restored.restore(snapshot) == 1
+    assert list(restored.clients("wlceventd")) == [included]
+
+
+def test_restart_wait_time(monkeypatch):
+    added_at = datetime.datetime(2023, 2, 2, 13, 2, 51)
+    mac_address = domain.MAC("AB:CD:EF:01:23:45")
+    known = known_clients.KnownClients(42)
+    monkeypatch.setattr(known_clients.KnownClients, "_now", lambda: added_at)
+    known.add_client("wlceventd", mac_address)
+    known.snapshot()
+    monkeypatch.setattr(
+        known_clients.KnownClients,
+        "_now",
+        lambda: added_at + datetime.timedelta(seconds=100),
+    )
+
+    known.restart_wait_time("wlceventd", mac_address, 30)
+    known.restart_wait_time("wlceventd", domain.MAC("01:23:45:67:89:AB"), 30)
+
+    assert known.remaining_wait_time("wlceventd", mac_address) == pytest.approx(30)
+    assert list(known.clients("wlceventd")) == [mac_address]
+    assert known.is_changed
+
+
+def test_restore_invalid_snapshot():
+    known = known_clients.KnownClients(42)
+    known.add_client("wlceventd", domain.MAC("AB:CD:EF:01:23:45"))
+    snapshot = known.snapshot()
+
+    with pytest.raises(ValueError):
+        known_clients.KnownClients(42).restore(b"invalid")
+    with pytest.raises(ValueError):
+        known_clients.KnownClients(42).restore(snapshot[:-1])
+
+
+def test_restore_into_shared_store():
+    known = known_clients.KnownClients(42)
+    known.add_client("wlceventd", domain.MAC("AB:CD:EF:01:23:45"))
+    shared_store = {}
+
+    known_clients.KnownClients(42, shared_store).restore(known.snapshot())
+
+    assert ("wlceventd", "AB-CD-EF-01-23-45") in shared_store
+
+
+def test_evict_stale_clients_incrementally(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(known_clients.KnownClients, "_time", lambda: now)
+    repository = known_clients.KnownClients(42, max_age=60)
+    stale = [domain.MAC(f"AB:CD:EF:01:23:{index:02}") for index in range(3)]
+    for mac_address in stale:
+        repository.add_client("wlceventd", mac_address)
+    now = 1030.0
+    live = domain.MAC("01:23:45:67:89:AB")
+    repository.add_client("wlceventd", live)
+    # Seeing a client keeps it alive
+    assert repository.is_client_known("wlceventd", stale[0])
+    now = 1070.0
+
+    assert repository.evict_stale(limit=1) == 1
+    assert repository.evict_stale(limit=10) == 1
+    assert repository.evict_stale(limit=10) == 0
+
+    assert set(repository.clients("wlceventd")) == {stale[0], live}
+    assert not repository.is_client_known("wlceventd", stale[1])
+
+
+def test_evict_least_recently_seen_on_overflow():
+    shared_store = {}
+    repository = known_clients.KnownClients(42, shared_store, max_clients=2)
+    first, second, third = (
+        domain.MAC(f"AB:CD:EF:01:23:{index:02}") for index in range(3)
+    )
+    repository.add_client("wlceventd", first)
+    repository.add_client("wlceventd", second)
+    repository.is_client_known("wlceventd", first)
+
+    repository.add_client("wlceventd", third)
+
+    assert list(repository.clients("wlceventd")) == [first, third]
+    assert ("wlceventd", str(second)) not in shared_store
+
+
+def test_snapshot_keeps_last_seen(monkeypatch):
+    monkeypatch.setattr(known_clients.KnownClients, "_time", lambda: 1000.0)
+    repository = known_clients.KnownClients(42, max_age=60)
+    repository.add_client("wlceventd", domain.MAC("AB:CD:EF:01:23:45"))
+    snapshot = repository.snapshot()
+
+    monkeypatch.setattr(known_clients.KnownClients, "_time", lambda: 1100.0)
+    restored = known_clients.KnownClients(42, max_age=60)
+    restored.restore(snapshot)
+
+    assert restored.evict_stale(limit=10) == 1
+
+
+def test_clients_of_other_workers_keep_their_age(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(known_clients.KnownClients, "_time", lambda: now)
+    shared_store = {}
+    first_worker = known_clients.KnownClients(42, shared_store, max_age=60)
+    second_worker = known_clients.KnownClients(
+        42, shared_store, max_age=60, max_clients=1
+    )
+    shared = domain.MAC("AB:CD:EF:01:23:45")
+    own = domain.MAC("01:23:45:67:89:AB")
+    first_worker.add_client("wlceventd", shared)
+    now = 1030.0
+    second_worker.add_client("wlceventd", own)
+
+    # Listing the clients of every worker neither evicts the own client nor makes the
+    # client of the first worker recently seen
+    assert list(second_worker.clients("wlceventd")) == [own, shared]
+    assert list(second_worker.clients("wlceventd")) == [own, shared]
+    now = 1070.0
+    assert first_worker.evict_stale(limit=10) == 1
+    assert second_worker.evict_stale(limit=10) == 0
+    assert list(second_worker.clients("wlceventd")) == [own]
@@ -11,6 +11,7 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import dataclasses
 import ipaddress
 
 import asyncio_zabbix_sender
@@ -34,8 +35,7 @@ def _get_value(
 
 def test_map_client_message():
     measurements = [
-        measurement
-        for measurement in mapper.map_client_message(RECORD, MESSAGE)
+        measurement for measurement in mapper.map_client_message(RECORD, MESSAGE)
     ]
 
     assert len(measurements) == 5
@@ -55,12 +55,11 @@ def test_map_client_message_dhcp():
     message = router_log_preprocessor.domain.DnsmasqDhcpAcknowledge(
         mac_address=router_log_preprocessor.domain.MAC("AB:CD:EF:01:23:45"),
         ip_address=ipaddress.IPv4Address("192.168.101.149"),
-        hostname="fake-client"
+        hostname="fake-client",
     )
 
     measurements = [
-        measurement
-        for measurement in mapper.map_client_message(RECORD, message)
+        measurement for measurement in mapper.map_client_message(RECORD, message)
     ]
 
     assert len(measurements) == 2
@@ -72,6 +71,25 @@ def test_map_client_message_dhcp():
     assert _get_value(measurements, "hostname") == message.hostname
 
 
+def test_map_client_message_item_keys():
+    record = dataclasses.replace(RECORD, process="dnsmasq-dhcp")
+    message = router_log_preprocessor.domain.DnsmasqDhcpAcknowledge(
+        mac_address=router_log_preprocessor.domain.MAC("AB:CD:EF:01:23:45"),
+        ip_address=ipaddress.IPv6Address("fe80::1"),
+        hostname="fake-client",
+    )
+
+    first = list(mapper.map_client_message(record, message))
+    second = list(mapper.map_client_message(record, message))
+
+    assert [measurement.key for measurement in first] == [
+        "rlp.dnsmasq_dhcp[ip_address,AB-CD-EF-01-23-45]",
+        "rlp.dnsmasq_dhcp[hostname,AB-CD-EF-01-23-45]",
+    ]
+    assert first[0].value == "fe80::1"
+    assert all(a.key is b.key for a, b in zip(first, second))
+
+
 def test_map_client_discovery():
     known_clients = _known_clients.KnownClients(42)
     known_clients.add_client(RECORD.process, MESSAGE.mac_address)
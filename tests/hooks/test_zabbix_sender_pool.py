@@ -0,0 +1,72 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import anyio
+import asyncio_zabbix_sender
+import pytest
+
+import router_log_preprocessor.hooks.zabbix
+from tests.hooks.util import started
+
+# All test functions in this module should be tested using anyio
+pytestmark = pytest.mark.anyio
+
+
+class SlowSender:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send(self, measurements):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await anyio.sleep(0.01)
+        self.in_flight -= 1
+        return len(measurements)
+
+
+async def test_sender_pool_bounds_concurrent_requests():
+    sender = SlowSender()
+    pool = router_log_preprocessor.hooks.zabbix.SenderPool(sender, max_in_flight=2)
+    measurements = asyncio_zabbix_sender.Measurements(
+        [asyncio_zabbix_sender.Measurement("host", "key", 1)]
+    )
+
+    with anyio.fail_after(5):
+        async with anyio.create_task_group() as task_group:
+            for _ in range(5):
+                task_group.start_soon(pool.send, measurements)
+            await anyio.sleep(0)
+            assert pool.in_flight == 2
+
+    assert sender.max_in_flight == 2
+    assert pool.in_flight == 0
+
+
+async def test_trapper_sends_chunks_concurrently():
+    sender = SlowSender()
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        router_log_preprocessor.hooks.zabbix.SenderPool(sender, max_in_flight=4),
+        measurement_bundle_wait_time=0,
+        max_bundle_items=1,
+    )
+    trapper._add_measurements(
+        asyncio_zabbix_sender.Measurement("host", f"key{index}", index)
+        for index in range(3)
+    )
+
+    with anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.flush()
+
+    assert sender.max_in_flight == 3
@@ -0,0 +1,112 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest.mock
+
+import anyio
+import asyncio_zabbix_sender
+import pytest
+
+import router_log_preprocessor.hooks.zabbix
+from tests.hooks.util import MESSAGE, RECORD, started
+
+# All test functions in this module should be tested using anyio
+pytestmark = pytest.mark.anyio
+
+
+def _bundle(*values):
+    return asyncio_zabbix_sender.Measurements(
+        [
+            asyncio_zabbix_sender.Measurement("host", "key", value, clock=1675342971)
+            for value in values
+        ]
+    )
+
+
+async def test_spool_is_first_in_first_out_and_durable(tmp_path):
+    path = tmp_path / "spool.db"
+    measurement_spool = router_log_preprocessor.hooks.zabbix.MeasurementSpool(
+        path, 1 << 20
+    )
+    await measurement_spool.append(_bundle(1, 2))
+    await measurement_spool.append(_bundle(3))
+    measurement_spool.close()
+
+    measurement_spool = router_log_preprocessor.hooks.zabbix.MeasurementSpool(
+        path, 1 << 20
+    )
+    assert len(measurement_spool) == 2
+    identifier, measurements = await measurement_spool.peek()
+    assert [measurement.value for measurement in measurements] == [1, 2]
+    assert list(measurements)[0].clock == 1675342971
+
+    await measurement_spool.remove(identifier)
+    _, measurements = await measurement_spool.peek()
+    assert [measurement.value for measurement in measurements] == [3]
+    assert len(measurement_spool) == 1
+    measurement_spool.close()
+
+
+async def test_spool_drops_oldest_when_full(tmp_path):
+    measurement_spool = router_log_preprocessor.hooks.zabbix.MeasurementSpool(
+        tmp_path / "spool.db", 150
+    )
+    for value in range(3):
+        await measurement_spool.append(_bundle(value))
+
+    assert len(measurement_spool) == 2
+    assert measurement_spool.size <= 150
+    _, measurements = await measurement_spool.peek()
+    assert [measurement.value for measurement in measurements] == [1]
+    measurement_spool.close()
+
+
+class UnreachableSender:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send(self, measurements):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionRefusedError("Connect call failed")
+        self.sent.append(measurements)
+
+
+async def test_trapper_spools_and_drains_failed_bundles(tmp_path):
+    measurement_spool = router_log_preprocessor.hooks.zabbix.MeasurementSpool(
+        tmp_path / "spool.db", 1 << 20
+    )
+    sender = UnreachableSender(failures=3)
+    trapper = router_log_preprocessor.hooks.zabbix.ZabbixTrapper(
+        sender,
+        measurement_bundle_wait_time=0,
+        measurement_spool=measurement_spool,
+        spool_drain_rate=1000,
+    )
+
+    with unittest.mock.patch.object(
+        trapper, "discover_client", return_value=0
+    ), anyio.fail_after(5):
+        async with started(trapper):
+            await trapper.send(RECORD, MESSAGE)
+            await trapper.flush()
+            # The failed bundle is spooled and drained in the background
+            while len(measurement_spool) > 0:
+                await anyio.sleep(0.01)
+
+    assert sender.failures == 0
+    assert len(sender.sent) == 1
+    assert len(measurement_spool) == 0
+    assert len(trapper._measurements) == 0
+    measurement_spool.close()
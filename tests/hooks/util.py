@@ -1,7 +1,9 @@
+import contextlib
 import datetime
 import decimal
 import unittest.mock
 
+import anyio
 import asyncio_zabbix_sender
 import asyncio_zabbix_sender._response
 import pytest
@@ -45,6 +47,15 @@ class RaiseOnce:
         raise self.exception
 
 
+@contextlib.asynccontextmanager
+async def started(hook):
+    """Run the background tasks of the hook until the block is left."""
+    async with anyio.create_task_group() as task_group:
+        hook.start(task_group)
+        yield hook
+        task_group.cancel_scope.cancel()
+
+
 class MockedDatetime(datetime.datetime):
     faked_utcnow = None
 
@@ -55,7 +66,6 @@ class MockedDatetime(datetime.datetime):
         return cls.faked_utcnow
 
 
-
 @pytest.fixture
 def zabbix_sender():
     response = asyncio_zabbix_sender._response.ZabbixResponse(
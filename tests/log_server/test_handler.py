@@ -13,11 +13,15 @@
 #  limitations under the License.
 import unittest.mock
 
+import anyio
 import pytest
 
+import router_log_preprocessor.hooks.abc
+import router_log_preprocessor.log_server.handler
 import router_log_preprocessor.preprocessors.dnsmasq_dhcp as dnsmasq_dhcp
 import router_log_preprocessor.preprocessors.wlc as wlc
 from router_log_preprocessor.log_server.handler import LogHandler
+from router_log_preprocessor.settings import LogParser
 
 
 @pytest.fixture
@@ -35,8 +39,8 @@ def mock_zabbix_trapper():
     return zabbix_trapper
 
 
-@pytest.fixture
-def log_handler(mock_zabbix_trapper):
+@pytest.fixture(params=list(LogParser))
+def log_handler(mock_zabbix_trapper, request):
 
     return LogHandler(
         {
@@ -44,6 +48,7 @@ def log_handler(mock_zabbix_trapper):
             "dnsmasq-dhcp": dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event,
         },
         [mock_zabbix_trapper],
+        request.param,
     )
 
 
@@ -96,3 +101,102 @@ async def test_log_handler_handle_unknown(mock_zabbix_trapper, log_handler):
             "This test must check that the ZabbixTrapper.send have been "
             "called at with a None message."
         )
+
+
+async def test_log_handler_handle_batch(mock_zabbix_trapper, log_handler):
+    batch = [
+        (b"Not a valid log entry", "127.0.0.1", 514),
+        (
+            b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp[2971]: "
+            b"DHCPACK(br1) 192.168.101.149 ab:cd:ef:01:23:45 fake-client",
+            "127.0.0.1",
+            514,
+        ),
+    ]
+
+    await log_handler.handle_batch(batch)
+
+    # The invalid entry must not prevent the valid entry from being handled
+    mock_zabbix_trapper.send.assert_called_once()
+
+
+class _PreprocessedOnlyHook(router_log_preprocessor.hooks.abc.Hook):
+    def __init__(self):
+        self.records = []
+
+    def accepts_unprocessed(self, process: str) -> bool:
+        return False
+
+    async def send(self, record, message) -> None:
+        self.records.append(record)
+
+
+@pytest.mark.parametrize("parser", list(LogParser))
+async def test_log_handler_discards_unwanted_process(parser):
+    hook = _PreprocessedOnlyHook()
+    log_handler = LogHandler(
+        {"dnsmasq-dhcp": dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event}, [hook], parser
+    )
+    unwanted = b"<6>Oct 18 14:02:56 GT-AX11000-ABCD-1234567-E kernel: Some message"
+    wanted = (
+        b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp[2971]: "
+        b"DHCPACK(br1) 192.168.101.149 ab:cd:ef:01:23:45 fake-client"
+    )
+
+    await log_handler.handle(unwanted, "127.0.0.1", 514)
+    await log_handler.handle_batch(
+        [(unwanted, "127.0.0.1", 514), (wanted, "127.0.0.1", 514)]
+    )
+
+    assert [record.process for record in hook.records] == ["dnsmasq-dhcp"]
+    assert log_handler.discarded == 2
+
+
+@pytest.mark.parametrize(
+    "packet",
+    [
+        b"<6>Feb  2 13:02:51  dnsmasq-dhcp: Missing hostname",
+        b"<6>Foo  2 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp: Unknown month",
+        b"<6>Feb 30 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp: Invalid day",
+        b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp: \xff",
+    ],
+)
+async def test_log_handler_handle_counts_parse_failures(
+    mock_zabbix_trapper, log_handler, packet
+):
+    failures = router_log_preprocessor.log_server.handler._PARSE_FAILURES.value
+
+    with pytest.raises((RuntimeError, ValueError, KeyError)):
+        await log_handler.handle(packet, "127.0.0.1", 514)
+
+    assert (
+        router_log_preprocessor.log_server.handler._PARSE_FAILURES.value == failures + 1
+    )
+    mock_zabbix_trapper.send.assert_not_called()
+
+
+class _SlowHook(router_log_preprocessor.hooks.abc.Hook):
+    def __init__(self):
+        self.records = []
+
+    async def send(self, record, message) -> None:
+        await anyio.sleep(0.05)
+        self.records.append(record)
+
+
+async def test_log_handler_batch_is_not_held_up_by_hook():
+    hook = _SlowHook()
+    log_handler = LogHandler(
+        {"dnsmasq-dhcp": dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event}, [hook]
+    )
+    packet = (
+        b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp[2971]: "
+        b"DHCPACK(br1) 192.168.101.149 ab:cd:ef:01:23:45 fake-client"
+    )
+
+    started = anyio.current_time()
+    await log_handler.handle_batch([(packet, "127.0.0.1", 514)] * 10)
+
+    assert len(hook.records) == 10
+    # The records wait for the hook concurrently instead of one after another
+    assert anyio.current_time() - started < 10 * 0.05
@@ -0,0 +1,168 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest.mock
+
+import anyio
+import pytest
+
+from router_log_preprocessor.log_server.pipeline import IngestPipeline
+from router_log_preprocessor.settings import OverloadPolicy
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _pipeline(handler, overload_policy, queue_size=2, worker_count=1):
+    return IngestPipeline(
+        handler,
+        queue_size=queue_size,
+        worker_count=worker_count,
+        overload_policy=overload_policy,
+    )
+
+
+async def _handled_packets(overload_policy):
+    handler = unittest.mock.AsyncMock()
+    pipeline = _pipeline(handler, overload_policy)
+
+    # Fill the queue before any worker is started to simulate a burst
+    for packet in (b"first", b"second", b"third", b"fourth"):
+        await pipeline.put(packet, "127.0.0.1", 514)
+    async with anyio.create_task_group() as task_group:
+        pipeline.start_workers(task_group)
+        await pipeline.aclose()
+
+    return pipeline, [call.args[0][0][0] for call in handler.await_args_list]
+
+
+async def test_drop_newest():
+    pipeline, packets = await _handled_packets(OverloadPolicy.DROP_NEWEST)
+
+    assert packets == [b"first", b"second"]
+    assert pipeline.statistics.received == 4
+    assert pipeline.statistics.dropped == 2
+
+
+async def test_drop_oldest():
+    pipeline, packets = await _handled_packets(OverloadPolicy.DROP_OLDEST)
+
+    assert packets == [b"third", b"fourth"]
+    assert pipeline.statistics.received == 4
+    assert pipeline.statistics.dropped == 2
+
+
+async def test_backpressure():
+    handler = unittest.mock.AsyncMock()
+    pipeline = _pipeline(handler, OverloadPolicy.BACKPRESSURE)
+    await pipeline.put(b"first", "127.0.0.1", 514)
+    await pipeline.put(b"second", "127.0.0.1", 514)
+
+    with anyio.move_on_after(0.1) as scope:
+        await pipeline.put(b"third", "127.0.0.1", 514)
+
+    assert scope.cancelled_caught, "A full queue must suspend the receive loop"
+    assert pipeline.queued == 2
+    assert pipeline.statistics.dropped == 0
+
+
+async def test_worker_survives_handler_exception():
+    handler = unittest.mock.AsyncMock(side_effect=[RuntimeError("Bad"), None])
+    pipeline = _pipeline(handler, OverloadPolicy.BACKPRESSURE)
+
+    async with anyio.create_task_group() as task_group:
+        pipeline.start_workers(task_group)
+        async with pipeline:
+            await pipeline.put(b"bad", "127.0.0.1", 514)
+            await pipeline.put(b"good", "127.0.0.1", 514)
+
+    assert handler.await_count == 2
+
+
+async def test_put_batch_counts_datagrams():
+    handler = unittest.mock.AsyncMock()
+    pipeline = _pipeline(handler, OverloadPolicy.DROP_NEWEST, queue_size=1)
+    batch = [(b"first", "127.0.0.1", 514), (b"second", "127.0.0.1", 514)]
+
+    await pipeline.put_batch(batch)
+    await pipeline.put_batch(batch)
+    async with anyio.create_task_group() as task_group:
+        pipeline.start_workers(task_group)
+        await pipeline.aclose()
+
+    handler.assert_awaited_once_with(batch[:1])
+    assert pipeline.statistics.received == 4
+    assert pipeline.statistics.dropped == 3
+
+
+async def test_drop_oldest_trims_queued_batch():
+    handler = unittest.mock.AsyncMock()
+    pipeline = _pipeline(handler, OverloadPolicy.DROP_OLDEST, queue_size=3)
+    first = [(b"first", "127.0.0.1", 514), (b"second", "127.0.0.1", 514)]
+    second = [(b"third", "127.0.0.1", 514), (b"fourth", "127.0.0.1", 514)]
+
+    await pipeline.put_batch(first)
+    await pipeline.put_batch(second)
+    assert pipeline.queued == 3
+    async with anyio.create_task_group() as task_group:
+        pipeline.start_workers(task_group)
+        await pipeline.aclose()
+
+    assert handler.await_args_list == [
+        unittest.mock.call(first[1:]),
+        unittest.mock.call(second),
+    ]
+    assert pipeline.statistics.dropped == 1
+
+
+async def test_drop_oldest_keeps_newest_of_oversized_batch():
+    handler = unittest.mock.AsyncMock()
+    pipeline = _pipeline(handler, OverloadPolicy.DROP_OLDEST, queue_size=2)
+    batch = [(packet, "127.0.0.1", 514) for packet in (b"first", b"second", b"third")]
+
+    await pipeline.put_batch(batch)
+    async with anyio.create_task_group() as task_group:
+        pipeline.start_workers(task_group)
+        await pipeline.aclose()
+
+    handler.assert_awaited_once_with(batch[1:])
+    assert pipeline.statistics.dropped == 1
+
+
+async def test_backpressure_splits_batch_to_bound_queue():
+    handled = []
+
+    async def handler(batch):
+        handled.append(batch)
+
+    pipeline = _pipeline(handler, OverloadPolicy.BACKPRESSURE, queue_size=2)
+    batch = [(packet, "127.0.0.1", 514) for packet in (b"first", b"second", b"third")]
+
+    async with anyio.create_task_group() as task_group:
+        with anyio.move_on_after(0.1) as scope:
+            await pipeline.put_batch(batch)
+        assert scope.cancelled_caught
+        assert pipeline.queued == 2
+
+        pipeline.start_workers(task_group)
+        await pipeline.put_batch(batch)
+        await pipeline.aclose()
+
+    # The cancelled put queued the first two datagrams before suspending
+    assert sum(map(len, handled)) == 5
+    assert max(map(len, handled)) <= 2
+    assert pipeline.statistics.dropped == 0
@@ -0,0 +1,57 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import socket
+
+import anyio
+import pytest
+
+from router_log_preprocessor.log_server import receiver
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(
+        not receiver.is_batch_receive_supported(),
+        reason="Batch receive is only supported on Linux",
+    ),
+]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def test_receive_batches():
+    with receiver.create_batch_socket("127.0.0.1", 0, False) as udp, socket.socket(
+        socket.AF_INET, socket.SOCK_DGRAM
+    ) as client:
+        client.bind(("127.0.0.1", 0))
+        client_address = client.getsockname()
+        for index in range(5):
+            client.sendto(b"packet %d" % index, udp.getsockname())
+
+        batches = []
+        with anyio.fail_after(5):
+            async for batch in receiver.receive_batches(udp, batch_size=3):
+                batches.append(batch)
+                if sum(len(batch) for batch in batches) == 5:
+                    break
+
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert [packet for batch in batches for packet, _, _ in batch] == [
+        b"packet %d" % index for index in range(5)
+    ]
+    assert all(
+        (host, port) == client_address for batch in batches for _, host, port in batch
+    )
@@ -0,0 +1,106 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest.mock
+
+import pytest
+
+import router_log_preprocessor.log_server.handler
+import router_log_preprocessor.log_server.replay as replay
+import router_log_preprocessor.settings
+import router_log_preprocessor.util.archive as archive
+
+pytestmark = pytest.mark.anyio
+
+ECHO_LOG = (
+    b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E kernel: Some message\n"
+    b"<30>Feb  2 13:02:52 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp[2971]: "
+    b"DHCPACK(br1) 192.168.101.149 ab:cd:ef:01:23:45 fake-client\n"
+    b"\n"
+    b"<30>Feb  2 13:02:54 GT-AX11000-ABCD-1234567-E dnsmasq-dhcp[2971]: "
+    b"DHCPACK(br1) 192.168.101.149 ab:cd:ef:01:23:45 fake-client\r\n"
+)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def echo_log(tmp_path):
+    path = tmp_path / "rlp.echo.log"
+    path.write_bytes(ECHO_LOG)
+    return path
+
+
+def test_read_datagrams_echo_log(echo_log):
+    datagrams = list(replay.read_datagrams(echo_log))
+
+    assert len(datagrams) == 3
+    assert datagrams[0] == (
+        None,
+        (b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E kernel: Some message", "", 0),
+    )
+    assert datagrams[2][1][0].endswith(b"fake-client")
+
+
+def test_read_datagrams_archive(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path)
+    writer.write(1000.0, b"first", "192.168.1.1", 514)
+    writer.write(1001.0, b"second", "192.168.1.2", 514)
+    writer.close()
+
+    expected = [
+        (1000.0, (b"first", "192.168.1.1", 514)),
+        (1001.0, (b"second", "192.168.1.2", 514)),
+    ]
+    assert list(replay.read_datagrams(tmp_path)) == expected
+    assert list(replay.read_datagrams(writer.segment_path)) == expected
+
+
+async def test_replay_dry_run(echo_log):
+    statistics = await replay.replay(echo_log, dry_run=True)
+
+    assert statistics.datagrams == 3
+    assert statistics.discarded == 1
+    # One discovery and two measurements for each of the two DHCP acknowledgements
+    assert statistics.measurements == 5
+
+
+async def test_replay_dry_run_leaves_spool_alone(echo_log, tmp_path, monkeypatch):
+    spool_path = tmp_path / "spool.db"
+    monkeypatch.setattr(
+        router_log_preprocessor.settings.settings(), "zabbix_spool_path", spool_path
+    )
+
+    with unittest.mock.patch.object(
+        router_log_preprocessor.log_server.handler.LogHandler, "aclose", autospec=True
+    ) as mock_aclose:
+        await replay.replay(echo_log, dry_run=True)
+
+    assert not spool_path.exists()
+    mock_aclose.assert_awaited_once()
+
+
+async def test_replay_original_timing(echo_log):
+    with unittest.mock.patch("anyio.sleep") as mock_sleep:
+        statistics = await replay.replay(
+            echo_log, timing=replay.ReplayTiming.ORIGINAL, dry_run=True
+        )
+
+    assert statistics.datagrams == 3
+    # The datagrams were logged 1 and 3 seconds after the first one and the mocked
+    # sleep does not advance the clock
+    delays = [call.args[0] for call in mock_sleep.call_args_list if call.args[0] > 0]
+    assert delays == [pytest.approx(1, abs=0.1), pytest.approx(3, abs=0.1)]
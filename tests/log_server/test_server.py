@@ -11,8 +11,12 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import os
+import signal
+import sys
 import unittest.mock
 
+import anyio
 import pytest
 
 import router_log_preprocessor.settings
@@ -37,38 +41,70 @@ async def test_server():
             (b"second", ("127.0.0.1", 8514)),
         ]
     )
-    (
-        mock_task_group,
-        mock_task_group_context,
-    ) = tests.mocks.anyio.mock_create_task_group_factory()
+    mock_log_handler = unittest.mock.MagicMock()
+    mock_log_handler.handle_batch = unittest.mock.AsyncMock()
+    mock_log_handler.aclose = unittest.mock.AsyncMock()
 
     with unittest.mock.patch(
         "router_log_preprocessor.log_server.server.create_udp_socket",
         mock_create_udp_socket,
+    ), unittest.mock.patch(
+        "router_log_preprocessor.log_server.server.log_handler_factory",
+        return_value=mock_log_handler,
     ):
-        with unittest.mock.patch(
-            "router_log_preprocessor.log_server.server.create_task_group",
-            mock_task_group_context,
-        ):
-
-            await start_log_server()
-
-        # The most important part of the server is that the log handler is called for
-        # every packet received by the bound UDP socket.
-
-        # First check the UDP socket is bound according to the settings
-        assert mock_udp_socket.local_host == settings.log_server_host
-        assert mock_udp_socket.local_port == settings.log_server_port
-        assert mock_udp_socket.reuse_port == settings.log_server_reuse_port
-
-        # Then check that it sends the packets to the log handler
-        assert isinstance(mock_task_group.start_soon, unittest.mock.MagicMock)
-        assert mock_task_group.start_soon.call_count == 2
-        assert callable(mock_task_group.start_soon.call_args_list[0].args[0])
-        assert mock_task_group.start_soon.call_args_list[0].args[1] == b"first"
-        assert mock_task_group.start_soon.call_args_list[0].args[2] == "localhost"
-        assert mock_task_group.start_soon.call_args_list[0].args[3] == 514
-        assert callable(mock_task_group.start_soon.call_args_list[1].args[0])
-        assert mock_task_group.start_soon.call_args_list[1].args[1] == b"second"
-        assert mock_task_group.start_soon.call_args_list[1].args[2] == "127.0.0.1"
-        assert mock_task_group.start_soon.call_args_list[1].args[3] == 8514
+        await start_log_server()
+
+    # The most important part of the server is that the log handler is called for
+    # every packet received by the bound UDP socket.
+
+    # First check the UDP socket is bound according to the settings
+    assert mock_udp_socket.local_host == settings.log_server_host
+    assert mock_udp_socket.local_port == settings.log_server_port
+    assert mock_udp_socket.reuse_port == settings.log_server_reuse_port
+
+    # Then check that the workers hand the packets to the log handler
+    assert mock_log_handler.handle_batch.await_count == 2
+    mock_log_handler.handle_batch.assert_has_awaits(
+        [
+            unittest.mock.call([(b"first", "localhost", 514)]),
+            unittest.mock.call([(b"second", "127.0.0.1", 8514)]),
+        ],
+        any_order=True,
+    )
+    # Finally check that the hooks are started and closed with the server
+    mock_log_handler.start.assert_called_once()
+    mock_log_handler.aclose.assert_awaited_once()
+
+
+class _IdleUdpSocket(tests.mocks.anyio.MockUdpSocket):
+    async def receive(self):
+        await anyio.sleep_forever()
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(sys.platform == "win32", reason="Signals are POSIX only")
+async def test_server_stops_on_sigterm():
+    mock_log_handler = unittest.mock.MagicMock()
+    mock_log_handler.aclose = unittest.mock.AsyncMock()
+
+    async def create_udp_socket(*args, **kwargs):
+        return _IdleUdpSocket([])
+
+    with unittest.mock.patch(
+        "router_log_preprocessor.log_server.server.create_udp_socket",
+        create_udp_socket,
+    ), unittest.mock.patch(
+        "router_log_preprocessor.log_server.server.log_handler_factory",
+        return_value=mock_log_handler,
+    ), unittest.mock.patch(
+        "router_log_preprocessor.log_server.receiver.is_batch_receive_supported",
+        return_value=False,
+    ):
+        with anyio.fail_after(5):
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(start_log_server, False, None, None)
+                # Let the server install the signal receiver
+                await anyio.sleep(0.1)
+                os.kill(os.getpid(), signal.SIGTERM)
+
+    mock_log_handler.aclose.assert_awaited_once()
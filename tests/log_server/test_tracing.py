@@ -0,0 +1,145 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import os
+import signal
+import unittest.mock
+
+import anyio
+import pytest
+
+import router_log_preprocessor.log_server.tracing as tracing
+import router_log_preprocessor.preprocessors.wlc as wlc
+import router_log_preprocessor.util.metrics as metrics
+from router_log_preprocessor.log_server.handler import LogHandler
+from router_log_preprocessor.settings import LogParser
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+pytestmark = pytest.mark.anyio
+
+
+def test_stage_tracer_samples_every_nth_trace():
+    tracer = tracing.StageTracer(sample_every=2)
+
+    with unittest.mock.patch.object(tracing.logging, "logger") as logger:
+        for _ in range(4):
+            trace = tracer.trace()
+            trace.mark("decode")
+            trace.mark("preprocess", "wlceventd")
+            trace.finish("subject")
+
+    assert logger.info.call_count == 2
+    message = logger.info.call_args.args[0] % logger.info.call_args.args[1:]
+    assert message.startswith("Trace of 'subject': decode ")
+    assert "preprocess[wlceventd] " in message
+
+
+def test_stage_tracer_without_sampling_does_not_log():
+    tracer = tracing.StageTracer()
+
+    with unittest.mock.patch.object(tracing.logging, "logger") as logger:
+        trace = tracer.trace()
+        trace.mark("decode")
+        trace.finish("subject")
+
+    logger.info.assert_not_called()
+
+
+async def test_log_handler_records_stages():
+    hook = unittest.mock.MagicMock()
+    hook.send = unittest.mock.AsyncMock()
+    log_handler = LogHandler(
+        {"wlceventd": wlc.preprocess_wireless_lan_controller_event},
+        [hook],
+        LogParser.BYTES,
+        tracer=tracing.StageTracer(),
+    )
+    packet = (
+        b"<6>Oct 18 14:02:56 GT-AX11000-ABCD-1234567-E wlceventd: "
+        b"wlceventd_proc_event(431): eth1: Auth ab:cd:ef:01:23:45, "
+        b"status: successful (0), rssi:-70"
+    )
+
+    await log_handler.handle(packet, "127.0.0.1", 514)
+
+    hook.send.assert_called_once()
+    exposition = metrics.registry.render()
+    assert 'rlp_stage_seconds_count{stage="decode",name=""}' in exposition
+    assert 'rlp_stage_seconds_count{stage="parse",name=""}' in exposition
+    assert 'rlp_stage_seconds_count{stage="preprocess",name="wlceventd"}' in exposition
+    assert 'rlp_stage_seconds_count{stage="hook",name="MagicMock"}' in exposition
+
+
+@pytest.mark.parametrize(
+    ("parser", "stages"),
+    [
+        (LogParser.BYTES, ["echo", "route", "parse"]),
+        (LogParser.REGEX, ["echo", "route", "decode", "parse"]),
+    ],
+)
+async def test_log_handler_records_stages_of_batch(parser, stages):
+    hook = unittest.mock.MagicMock()
+    hook.send = unittest.mock.AsyncMock()
+    hook.accepts_unprocessed.return_value = False
+    log_handler = LogHandler(
+        {"wlceventd": wlc.preprocess_wireless_lan_controller_event},
+        [hook],
+        parser,
+        tracer=tracing.StageTracer(sample_every=1),
+    )
+    packet = (
+        b"<6>Oct 18 14:02:56 GT-AX11000-ABCD-1234567-E wlceventd: "
+        b"wlceventd_proc_event(431): eth1: Auth ab:cd:ef:01:23:45, "
+        b"status: successful (0), rssi:-70"
+    )
+    invalid = b"<6>Foo 18 14:02:56 GT-AX11000-ABCD-1234567-E wlceventd: Invalid"
+    discarded = b"<6>Oct 18 14:02:56 GT-AX11000-ABCD-1234567-E kernel: Discarded"
+
+    with unittest.mock.patch.object(tracing.logging, "logger") as logger:
+        await log_handler.handle_batch(
+            [
+                (invalid, "127.0.0.1", 514),
+                (discarded, "127.0.0.1", 514),
+                (packet, "127.0.0.1", 514),
+            ]
+        )
+
+    assert hook.send.call_count == 1
+    # Only the handled record is traced to the end
+    assert logger.info.call_count == 1
+    _, _, logged, _ = logger.info.call_args.args
+    logged_stages = [stage.split(" ")[0] for stage in logged.split(", ")]
+    assert logged_stages == stages + ["preprocess[wlceventd]", "hook[MagicMock]"]
+
+
+@pytest.mark.skipif(
+    tracing.profiling_signal() is None, reason="Profiling signal is not supported"
+)
+async def test_toggle_profiling_on_signal(tmp_path):
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(
+            tracing.toggle_profiling_on_signal, tmp_path, signal.SIGUSR1
+        )
+        await anyio.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        await anyio.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        await anyio.sleep(0.05)
+        task_group.cancel_scope.cancel()
+
+    assert len(list(tmp_path.glob("rlp-*.prof"))) == 1
@@ -14,14 +14,102 @@
 import unittest.mock
 
 import router_log_preprocessor.__main__
+import router_log_preprocessor.log_server.replay
 import router_log_preprocessor.log_server.server
+import router_log_preprocessor.util.fake_zabbix
+import router_log_preprocessor.util.loadgen
 
 
 def test_main():
     with unittest.mock.patch("anyio.run", unittest.mock.MagicMock()) as runner:
-        router_log_preprocessor.__main__.main()
+        router_log_preprocessor.__main__.main([])
 
     # Test that the main method starts the log server
     runner.assert_called_with(
         router_log_preprocessor.log_server.server.start_log_server
     )
+
+
+def test_main_with_workers():
+    with unittest.mock.patch(
+        "router_log_preprocessor.log_server.workers.run_workers"
+    ) as run_workers, unittest.mock.patch("anyio.run") as runner:
+        router_log_preprocessor.__main__.main(["--workers", "4"])
+
+    run_workers.assert_called_once_with(4)
+    runner.assert_not_called()
+
+
+def test_main_replay(tmp_path, capsys):
+    statistics = router_log_preprocessor.log_server.replay.ReplayStatistics(
+        datagrams=10, discarded=2, elapsed=0.5, measurements=20
+    )
+    echo_log = tmp_path / "rlp.echo.log"
+    with unittest.mock.patch("anyio.run", return_value=statistics) as runner:
+        router_log_preprocessor.__main__.main(
+            ["replay", str(echo_log), "--timing", "original", "--dry-run"]
+        )
+
+    replay = runner.call_args.args[0]
+    assert replay.func is router_log_preprocessor.log_server.replay.replay
+    assert replay.args == (echo_log,)
+    assert replay.keywords == {
+        "timing": router_log_preprocessor.log_server.replay.ReplayTiming.ORIGINAL,
+        "dry_run": True,
+    }
+    output = capsys.readouterr().out
+    assert "Replayed 10 datagrams" in output
+    assert "(20 datagrams/s)" in output
+    assert "Dry-run counted 20 measurements" in output
+
+
+def test_main_loadgen(capsys):
+    with unittest.mock.patch("anyio.run") as runner:
+        router_log_preprocessor.__main__.main(
+            [
+                "loadgen",
+                "--port",
+                "9514",
+                "--rate",
+                "500",
+                "--count",
+                "10",
+                "--routers",
+                "2",
+                "--sockets",
+                "4",
+                "--noise-process",
+                "kernel",
+            ]
+        )
+
+    generate_load = runner.call_args.args[0]
+    assert generate_load.func is router_log_preprocessor.util.loadgen.generate_load
+    _, host, port, rate = generate_load.args
+    assert (host, port, rate) == ("127.0.0.1", 9514, 500.0)
+    assert generate_load.keywords["count"] == 10
+    assert generate_load.keywords["duration"] is None
+    assert generate_load.keywords["sockets"] == 4
+    assert "Sent 0 datagrams" in capsys.readouterr().out
+
+
+def test_main_fake_zabbix(capsys):
+    with unittest.mock.patch("anyio.run", side_effect=KeyboardInterrupt) as runner:
+        router_log_preprocessor.__main__.main(
+            [
+                "fake-zabbix",
+                "--port",
+                "10052",
+                "--latency",
+                "0.5",
+                "--failure-ratio",
+                "0.1",
+            ]
+        )
+
+    serve, server, host, port, report_interval = runner.call_args.args
+    assert serve is router_log_preprocessor.util.fake_zabbix.serve_and_report
+    assert (host, port, report_interval) == ("127.0.0.1", 10052, 10.0)
+    assert server.latency == 0.5
+    assert server.failure_ratio == 0.1
+    assert "FakeZabbixStatistics" in capsys.readouterr().out
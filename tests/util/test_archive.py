@@ -0,0 +1,154 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+import logging
+import unittest.mock
+
+import pytest
+
+import router_log_preprocessor.util.archive as archive
+
+PACKET = b"<6>Feb  2 13:02:51 GT-AX11000-ABCD-1234567-E kernel: Some message"
+
+
+@pytest.mark.parametrize("compression", list(archive.ArchiveCompression))
+def test_archive_roundtrip(tmp_path, compression):
+    writer = archive.ArchiveWriter(tmp_path, compression=compression, block_size=200)
+
+    for second in range(10):
+        writer.write(1000.0 + second, PACKET + b"%d" % second, "192.168.1.1", 514)
+    writer.close()
+
+    datagrams = list(archive.read_archive(tmp_path))
+    assert [datagram.timestamp for datagram in datagrams] == [
+        1000.0 + second for second in range(10)
+    ]
+    assert datagrams[3] == archive.ArchivedDatagram(
+        1003.0, PACKET + b"3", "192.168.1.1", 514
+    )
+
+
+def test_archive_index(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path, block_size=200)
+
+    for second in range(10):
+        writer.write(1000.0 + second, PACKET, f"192.168.1.{second % 2}", 514)
+    writer.write(1010.0, b"Not a log record", "192.168.1.2", 514)
+    writer.close()
+
+    index = json.loads(next(tmp_path.glob("*.json")).read_text())
+    assert index["first"] == 1000.0
+    assert index["last"] == 1010.0
+    assert index["records"] == 11
+    assert index["hostnames"] == ["GT-AX11000-ABCD-1234567-E"]
+    assert index["sources"] == ["192.168.1.0", "192.168.1.1", "192.168.1.2"]
+    assert len(index["blocks"]) == 4
+
+
+def test_archive_time_window_skips_blocks(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path, block_size=200)
+    for second in range(10):
+        writer.write(1000.0 + second, PACKET, "192.168.1.1", 514)
+    writer.close()
+
+    with unittest.mock.patch("gzip.decompress", wraps=archive.gzip.decompress) as mock:
+        datagrams = list(archive.read_archive(tmp_path, start=1005.0, end=1006.0))
+
+    assert [datagram.timestamp for datagram in datagrams] == [1005.0, 1006.0]
+    assert mock.call_count == 2
+
+
+def test_archive_time_window_skips_segments(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path, segment_size=1, block_size=1)
+    for second in range(3):
+        writer.write(1000.0 + second, PACKET, "192.168.1.1", 514)
+    writer.close()
+
+    assert len(list(tmp_path.glob("*.rlpa"))) == 3
+    with unittest.mock.patch.object(
+        archive, "read_segment", wraps=archive.read_segment
+    ) as mock:
+        datagrams = list(archive.read_archive(tmp_path, start=1002.0))
+
+    assert [datagram.timestamp for datagram in datagrams] == [1002.0]
+    mock.assert_called_once()
+
+
+def test_archive_rotates_on_age(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path, segment_age=10, block_size=1)
+
+    with unittest.mock.patch("time.time", return_value=1000.0):
+        writer.write(1000.0, PACKET, "192.168.1.1", 514)
+        first_segment = writer.segment_path
+    with unittest.mock.patch("time.time", return_value=1010.0):
+        writer.write(1010.0, PACKET, "192.168.1.1", 514)
+    writer.close()
+
+    assert writer.segment_path != first_segment
+    assert len(list(archive.read_segment(first_segment))) == 1
+    assert len(list(archive.read_archive(tmp_path))) == 2
+
+
+def test_archive_handler(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path)
+    handler = archive.ArchiveHandler(writer)
+    record = logging.LogRecord("echo", logging.DEBUG, __file__, 1, PACKET, None, None)
+    record.host = "192.168.1.1"
+    record.port = 514
+
+    handler.handle(record)
+    handler.flush()
+    assert writer.pending_since == record.created
+    handler.close()
+
+    assert list(archive.read_archive(tmp_path)) == [
+        archive.ArchivedDatagram(record.created, PACKET, "192.168.1.1", 514)
+    ]
+
+
+def test_archive_segment_name_taken_by_other_worker(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path, block_size=1)
+    original_open = open
+    taken = tmp_path / f"19700101T001640{archive.SEGMENT_SUFFIX}"
+
+    def racing_open(path, mode="r", *args, **kwargs):
+        if path == taken:
+            # Another worker process creates the segment between check and open
+            path.touch()
+        return original_open(path, mode, *args, **kwargs)
+
+    with unittest.mock.patch("time.time", return_value=1000.0):
+        with unittest.mock.patch("builtins.open", racing_open):
+            writer.write(1000.0, PACKET, "192.168.1.1", 514)
+    writer.close()
+
+    assert writer.segment_path is not None
+    assert writer.segment_path.name == f"19700101T001640-1{archive.SEGMENT_SUFFIX}"
+    assert len(list(archive.read_segment(writer.segment_path))) == 1
+
+
+def test_archive_handler_writes_old_partial_block(tmp_path):
+    writer = archive.ArchiveWriter(tmp_path)
+    handler = archive.ArchiveHandler(writer)
+    record = logging.LogRecord("echo", logging.DEBUG, __file__, 1, PACKET, None, None)
+
+    handler.handle(record)
+    with unittest.mock.patch(
+        "time.time", return_value=record.created + handler._BLOCK_MAX_AGE
+    ):
+        handler.flush()
+
+    assert writer.pending_since is None
+    assert len(list(archive.read_archive(tmp_path))) == 1
+    handler.close()
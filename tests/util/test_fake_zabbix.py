@@ -0,0 +1,120 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import anyio
+import asyncio_zabbix_sender
+import pytest
+
+import router_log_preprocessor.util.fake_zabbix as fake_zabbix
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _measurements(count):
+    return asyncio_zabbix_sender.Measurements(
+        [
+            asyncio_zabbix_sender.Measurement(
+                host="GT-AX11000", key=f"rlp.test[{index}]", value=index, clock=1
+            )
+            for index in range(count)
+        ]
+    )
+
+
+async def _send(server, measurements, use_compression=True):
+    async with anyio.create_task_group() as task_group:
+        port = await task_group.start(server.serve, "127.0.0.1", 0)
+        sender = asyncio_zabbix_sender.ZabbixSender(
+            "127.0.0.1", port, use_compression=use_compression
+        )
+        try:
+            return await sender.send(measurements)
+        finally:
+            task_group.cancel_scope.cancel()
+
+
+@pytest.mark.parametrize("use_compression", [True, False])
+async def test_fake_zabbix_records_measurements(use_compression):
+    server = fake_zabbix.FakeZabbixServer()
+
+    response = await _send(server, _measurements(3), use_compression)
+
+    assert (response.processed, response.failed, response.total) == (3, 0, 3)
+    assert [measurement["key"] for measurement in server.measurements] == [
+        "rlp.test[0]",
+        "rlp.test[1]",
+        "rlp.test[2]",
+    ]
+    assert server.statistics == fake_zabbix.FakeZabbixStatistics(
+        connections=1, requests=1, measurements=3, processed=3
+    )
+
+
+async def test_fake_zabbix_partially_processed():
+    server = fake_zabbix.FakeZabbixServer(failure_ratio=0.5)
+
+    response = await _send(server, _measurements(4))
+
+    assert (response.processed, response.failed, response.total) == (2, 2, 4)
+    assert server.statistics.failed == 2
+
+
+async def test_fake_zabbix_latency():
+    server = fake_zabbix.FakeZabbixServer(latency=0.05)
+
+    started = anyio.current_time()
+    await _send(server, _measurements(1))
+
+    assert anyio.current_time() - started >= 0.05
+    assert server.statistics.processed == 1
+
+
+async def test_fake_zabbix_connection_reset():
+    server = fake_zabbix.FakeZabbixServer(reset_probability=1)
+
+    async with anyio.create_task_group() as task_group:
+        port = await task_group.start(server.serve, "127.0.0.1", 0)
+        sender = asyncio_zabbix_sender.ZabbixSender("127.0.0.1", port)
+        with pytest.raises(ConnectionResetError):
+            await sender.send(_measurements(1))
+        task_group.cancel_scope.cancel()
+
+    assert server.statistics.resets == 1
+    assert server.statistics.processed == 0
+
+
+async def test_fake_zabbix_malformed_request():
+    server = fake_zabbix.FakeZabbixServer()
+
+    async with anyio.create_task_group() as task_group:
+        port = await task_group.start(server.serve, "127.0.0.1", 0)
+        async with await anyio.connect_tcp("127.0.0.1", port) as stream:
+            await stream.send(b"HTTP/1.1 GET /\r\n\r\n")
+            with pytest.raises((anyio.EndOfStream, ConnectionError)):
+                await stream.receive()
+        task_group.cancel_scope.cancel()
+
+    assert server.statistics.malformed == 1
+
+
+def test_fake_zabbix_record_limit():
+    server = fake_zabbix.FakeZabbixServer(record_limit=2)
+
+    server.measurements.extend([{"key": "a"}, {"key": "b"}, {"key": "c"}])
+
+    assert list(server.measurements) == [{"key": "b"}, {"key": "c"}]
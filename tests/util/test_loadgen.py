@@ -0,0 +1,79 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import anyio
+import anyio.abc
+import pytest
+
+import router_log_preprocessor.util.loadgen as loadgen
+import router_log_preprocessor.util.rfc3164_parser as rfc3164_parser
+import router_log_preprocessor.util.synthetic as synthetic
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def test_generate_load_count():
+    fleet = synthetic.RouterFleet(seed=1)
+    async with await anyio.create_udp_socket(local_host="127.0.0.1") as server:
+        port = server.extra(anyio.abc.SocketAttribute.local_port)
+        statistics = await loadgen.generate_load(
+            fleet, "127.0.0.1", port, rate=10000, count=50
+        )
+
+        received = []
+        with anyio.fail_after(1):
+            while len(received) < 50:
+                packet, _ = await server.receive()
+                received.append(packet)
+
+    assert statistics.sent == 50
+    assert statistics.rate > 0
+    assert all(rfc3164_parser.peek_process(packet) for packet in received)
+
+
+async def test_generate_load_duration_paces_rate():
+    fleet = synthetic.RouterFleet(seed=1)
+    statistics = loadgen.LoadStatistics()
+    async with await anyio.create_udp_socket(local_host="127.0.0.1") as server:
+        port = server.extra(anyio.abc.SocketAttribute.local_port)
+        result = await loadgen.generate_load(
+            fleet, "127.0.0.1", port, rate=1000, duration=0.1, statistics=statistics
+        )
+
+    assert result is statistics
+    assert statistics.elapsed >= 0.1
+    # Roughly 100 datagrams are due within the duration
+    assert 50 <= statistics.sent <= 130
+
+
+async def test_generate_load_spreads_over_sockets():
+    fleet = synthetic.RouterFleet(seed=1)
+    async with await anyio.create_udp_socket(local_host="127.0.0.1") as server:
+        port = server.extra(anyio.abc.SocketAttribute.local_port)
+        await loadgen.generate_load(
+            fleet, "127.0.0.1", port, rate=10000, count=12, sockets=3
+        )
+
+        source_ports = []
+        with anyio.fail_after(1):
+            while len(source_ports) < 12:
+                _, (_, source_port) = await server.receive()
+                source_ports.append(source_port)
+
+    assert len(set(source_ports)) == 3
+    assert all(source_ports.count(source_port) == 4 for source_port in source_ports)
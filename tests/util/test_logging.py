@@ -0,0 +1,153 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import io
+import logging
+import queue
+import sys
+import threading
+
+import router_log_preprocessor.util.logging as rlp_logging
+import router_log_preprocessor.util.metrics as metrics
+
+
+def _record(message, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+
+def test_echo_formatter():
+    formatter = rlp_logging.EchoFormatter()
+
+    assert formatter.format(_record(b"<6>Feb  2 entry\n")) == "<6>Feb  2 entry"
+    assert formatter.format(_record(b"\xffentry")) == "�entry"
+    assert formatter.format(_record(" 100% entry\r\n")) == "100% entry"
+
+
+def test_dropping_queue_handler():
+    log_queue = queue.Queue(maxsize=1)
+    target = logging.StreamHandler(io.StringIO())
+    handler = rlp_logging.DroppingQueueHandler(log_queue, target)
+
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+
+    assert handler.dropped == 1
+    queued_target, record = log_queue.get_nowait()
+    assert queued_target is target
+    assert record.msg == "first"
+
+
+def test_background_writer():
+    log_queue = queue.Queue()
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setLevel(logging.INFO)
+    handler = rlp_logging.DroppingQueueHandler(log_queue, target)
+    writer = rlp_logging.BackgroundWriter(log_queue)
+
+    writer.start()
+    handler.handle(_record("first"))
+    handler.handle(_record("ignored", level=logging.DEBUG))
+    handler.handle(_record("second"))
+    writer.stop()
+
+    assert stream.getvalue() == "first\nsecond\n"
+    # Stopping an already stopped writer is a no-op
+    writer.stop()
+
+
+def test_buffered_file_handler(tmp_path):
+    handler = rlp_logging.BufferedFileHandler(tmp_path / "test.log")
+
+    handler.emit(_record("entry"))
+    handler.flush()
+    handler.close()
+
+    assert (tmp_path / "test.log").read_text() == "entry\n"
+
+
+def test_dropping_queue_handler_keeps_warnings():
+    log_queue = queue.Queue(maxsize=1)
+    handler = rlp_logging.DroppingQueueHandler(
+        log_queue, logging.StreamHandler(io.StringIO())
+    )
+    handler.handle(_record("first"))
+
+    # A warning waits for room in the queue instead of being dropped
+    thread = threading.Thread(
+        target=handler.handle, args=(_record("warning", level=logging.WARNING),)
+    )
+    thread.start()
+    assert log_queue.get(timeout=1)[1].msg == "first"
+    thread.join(timeout=1)
+
+    assert handler.dropped == 0
+    assert log_queue.get_nowait()[1].msg == "warning"
+
+
+def test_dropping_queue_handler_formats_messages():
+    log_queue = queue.Queue()
+    handler = rlp_logging.DroppingQueueHandler(
+        log_queue,
+        logging.StreamHandler(io.StringIO()),
+        name="test",
+        format_messages=True,
+    )
+    arguments = ["before"]
+    record = logging.LogRecord(
+        "test", logging.INFO, __file__, 1, "Value %s", (arguments,), None
+    )
+    try:
+        raise RuntimeError("Failure")
+    except RuntimeError:
+        record.exc_info = sys.exc_info()
+
+    handler.handle(record)
+    arguments[0] = "after"
+
+    _, queued = log_queue.get_nowait()
+    assert queued.getMessage() == "Value ['before']"
+    assert queued.exc_info is None
+    assert "RuntimeError: Failure" in queued.exc_text
+
+
+def test_dropped_records_metric():
+    handler = rlp_logging.DroppingQueueHandler(
+        queue.Queue(maxsize=1), logging.StreamHandler(io.StringIO()), name="metric"
+    )
+
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+    handler.handle(_record("third"))
+
+    assert 'rlp_log_records_dropped_total{logger="metric"} 2' in (
+        metrics.registry.render()
+    )
+
+
+def test_background_writer_flushes_while_idle():
+    log_queue = queue.Queue()
+    target = logging.StreamHandler(io.StringIO())
+    flushed = threading.Event()
+    target.flush = flushed.set
+    handler = rlp_logging.DroppingQueueHandler(log_queue, target)
+    writer = rlp_logging.BackgroundWriter(log_queue, flush_interval=0.01)
+
+    writer.start()
+    handler.handle(_record("first"))
+    assert flushed.wait(timeout=1)
+    flushed.clear()
+
+    # The handler is flushed again although no more records arrive
+    assert flushed.wait(timeout=1)
+    writer.stop()
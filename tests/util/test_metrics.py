@@ -0,0 +1,118 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import anyio
+import pytest
+
+import router_log_preprocessor.log_server.server  # noqa: F401 registers the metrics
+import router_log_preprocessor.util.metrics as metrics
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def test_counter_and_gauge():
+    registry = metrics.Registry()
+    counter = registry.counter("rlp_test_total", "Test counter.", ("process",))
+    gauge = registry.gauge("rlp_test", "Test gauge.")
+
+    counter.labels("wlceventd").inc()
+    counter.labels("dnsmasq-dhcp").inc(2)
+    counter.labels("wlceventd").inc()
+    gauge.set(5)
+    gauge.dec()
+
+    assert registry.render() == (
+        "# HELP rlp_test_total Test counter.\n"
+        "# TYPE rlp_test_total counter\n"
+        'rlp_test_total{process="dnsmasq-dhcp"} 2\n'
+        'rlp_test_total{process="wlceventd"} 2\n'
+        "# HELP rlp_test Test gauge.\n"
+        "# TYPE rlp_test gauge\n"
+        "rlp_test 4\n"
+    )
+
+
+def test_histogram():
+    registry = metrics.Registry()
+    histogram = registry.histogram("rlp_test_seconds", "Test.", buckets=(0.1, 1))
+
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2)
+
+    assert registry.render().splitlines()[2:] == [
+        'rlp_test_seconds_bucket{le="0.1"} 1',
+        'rlp_test_seconds_bucket{le="1"} 2',
+        'rlp_test_seconds_bucket{le="+Inf"} 3',
+        "rlp_test_seconds_sum 2.6",
+        "rlp_test_seconds_count 3",
+    ]
+
+
+def test_labels_are_validated_and_escaped():
+    registry = metrics.Registry()
+    counter = registry.counter("rlp_test_total", "Test.", ("process",))
+
+    counter.labels('a"b').inc()
+
+    assert 'rlp_test_total{process="a\\"b"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+    with pytest.raises(ValueError):
+        registry.counter("rlp_test_total", "Test.")
+
+
+def test_pipeline_metrics_are_registered():
+    exposition = metrics.registry.render()
+
+    for name in (
+        "rlp_datagrams_received_total",
+        "rlp_datagrams_dropped_total",
+        "rlp_datagrams_discarded_total",
+        "rlp_parse_failures_total",
+        "rlp_preprocess_seconds",
+        "rlp_zabbix_bundle_size",
+        "rlp_zabbix_send_seconds",
+        "rlp_zabbix_pending_clients",
+        "rlp_known_clients",
+    ):
+        assert f"# TYPE {name} " in exposition
+
+
+@pytest.mark.anyio
+async def test_serve_metrics():
+    registry = metrics.Registry()
+    registry.counter("rlp_test_total", "Test.").inc()
+
+    async def get(port, path):
+        async with await anyio.connect_tcp("127.0.0.1", port) as stream:
+            await stream.send(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+            response = b""
+            try:
+                while True:
+                    response += await stream.receive()
+            except anyio.EndOfStream:
+                return response
+
+    async with anyio.create_task_group() as task_group:
+        port = await task_group.start(metrics.serve_metrics, "127.0.0.1", 0, registry)
+        found = await get(port, "/metrics")
+        not_found = await get(port, "/")
+        task_group.cancel_scope.cancel()
+
+    assert found.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert found.endswith(b"\r\n\r\n" + registry.render().encode())
+    assert not_found.startswith(b"HTTP/1.1 404 Not Found\r\n")
@@ -198,3 +198,144 @@ def test_parse_without_process_name():
     record = router_log_preprocessor.util.rfc3164_parser.parse(message)
 
     assert record == expected_record
+
+
+def test_parse_many():
+    records = router_log_preprocessor.util.rfc3164_parser.parse_many([_MSG1, _MSG2])
+
+    assert list(records) == [_RECORD1, _RECORD2]
+
+
+def test_parse_many_is_lazy():
+    records = router_log_preprocessor.util.rfc3164_parser.parse_many(
+        [_MSG1, "Hello world"]
+    )
+
+    assert next(records) == _RECORD1
+    with pytest.raises(RuntimeError):
+        next(records)
+
+
+def test_parse_bytes_batch():
+    errors = []
+    records = router_log_preprocessor.util.rfc3164_parser.parse_bytes_batch(
+        [_MSG1.encode("ascii"), b"Hello world", b"\xff", _MSG2.encode("ascii")],
+        on_error=lambda entry, exception: errors.append((entry, type(exception))),
+    )
+
+    assert list(records) == [_RECORD1, _RECORD2]
+    assert errors == [(b"Hello world", RuntimeError), (b"\xff", UnicodeDecodeError)]
+
+
+@pytest.mark.parametrize(
+    "packet",
+    [
+        _MSG1.encode("ascii"),
+        _MSG2.encode("ascii"),
+        _MSG2.encode("ascii") + b"\n",
+        b"<6>Oct 18 14:02:56 GT-AX11000-ABCD-1234567-E wlceventd: "
+        b"wlceventd_proc_event(431): eth1: Auth ab:cd:ef:01:23:45, "
+        b"status: successful (0), rssi:-70",
+        b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E Samba Server: smb daemon",
+        b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E Samba Server[23993]: smb",
+        b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E: smb daemon is stopped",
+        b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E : no process name",
+        b"<8>Apr 7 16:50:10 host kernel: single space before a single digit day",
+        b"<8>Apr  7 16:50:10 host kernel: two spaces before a single digit day",
+        b"<8>Apr 07 16:50:10 host kernel: zero padded day",
+        b"<8>Apr 17 16:50:10\thost kernel: tab after the timestamp",
+        b"<8>Apr 17 16:50:10 host kernel:\tTab after the TAG",
+        b"<8>Apr 17 16:50:10 host kernel:  Two spaces after the TAG",
+        b"<8>Apr 17 16:50:10 host kernel[]: empty process id",
+        b"<8>Apr 17 16:50:10 host kernel[12a]: invalid process id",
+        b"<8>Apr 17 16:50:10 host kernel[12][34]: two process ids",
+        b"<8>Apr 17 16:50:10 host kernel]: unbalanced bracket",
+        b"<8>Apr 17 16:50:10 host kernel[12]x]: text after the process id",
+        b"<8>Apr 17 16:50:10 host kernel[12]:no space after the TAG",
+        b"<8>Apr 17 16:50:10 host kernel:no space: until later",
+        b"<08>Apr 17 16:50:10 host kernel: zero padded pri",
+        b"<8>Apr +7 16:50:10 host kernel: plus sign in the day",
+        b"<8>Apr 17 16:50:1  host kernel: short second",
+        b"<8>Apr 17 16:50:10  host kernel: two spaces after the timestamp",
+        b"<8>Apr 17 16:50:10 host ker.nel: dot in the TAG",
+        b"<8>Apr 17 16:50:10 host a b c: spaces in the TAG",
+        b"<8>Apr 17 16:50:10 host: kernel: colon after the hostname",
+        b"<8>Apr 17 16:50:10 host kernel: message: with: colons",
+        b"<8>Apr 17 16:50:10 host kernel: multi\nline",
+        b"<8>Apr 17 16:50:10 host kernel: trailing newlines\n\n",
+        b"<8>Apr 17 16:50:10 host kernel: carriage return\r",
+        b"<8>Apr 17 16:50:10 host kernel:",
+        b"<8>Apr 17 16:50:10 host kernel: ",
+        b"<8>Apr 17 16:50:10 host",
+        b"<8>Apr 17 16:50:10 ",
+        b"<8>Apr 31 16:50:10 host kernel: invalid day",
+        b"<8>Foo 17 16:50:10 host kernel: invalid month",
+        b"<8>apr 17 16:50:10 host kernel: lowercase month",
+        b"<8>Apr 17 6:50:10 host kernel: single digit hour",
+        b"<8>Apr 17 16.50.10 host kernel: dots in the time",
+        b"<a>Apr 17 16:50:10 host kernel: invalid pri",
+        b"<>Apr 17 16:50:10 host kernel: empty pri",
+        b"<8Apr 17 16:50:10 host kernel: unterminated pri",
+        b"<1234>Apr 17 16:50:10 host kernel: large pri",
+        b"<8>Apr 17 16:50:10 h\xf8st kernel: non-ascii hostname",
+        b"<8>Apr 17 16:50:10 host kernel: non-ascii message \xf8",
+        b"<8>Apr 17 16:50:10 host\x1fname kernel: unit separator",
+        b"Hello world",
+        b"",
+    ],
+)
+def test_parse_bytes_is_equivalent_to_parse(packet):
+    try:
+        expected = router_log_preprocessor.util.rfc3164_parser.parse(
+            packet.decode("ascii")
+        )
+    except Exception as exception:
+        with pytest.raises(type(exception)):
+            router_log_preprocessor.util.rfc3164_parser.parse_bytes(packet)
+        return
+
+    record = router_log_preprocessor.util.rfc3164_parser.parse_bytes(packet)
+
+    assert record == expected
+
+
+def test_parse_bytes_batch_with_bytes_parser():
+    records = router_log_preprocessor.util.rfc3164_parser.parse_bytes_batch(
+        [_MSG1.encode("ascii"), _MSG2.encode("ascii")], use_bytes_parser=True
+    )
+
+    assert list(records) == [_RECORD1, _RECORD2]
+
+
+@pytest.mark.parametrize(
+    "packet,expected_process",
+    [
+        (_MSG1.encode("ascii"), b"wlceventd"),
+        (_MSG2.encode("ascii"), b"dnsmasq-dhcp"),
+        (
+            b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E Samba Server[1]: smb",
+            b"Samba Server",
+        ),
+        (b"<8>Apr 17 16:50:10 GT-AX11000-ABCD-1234567-E: smb daemon is stopped", None),
+        (b"Hello world", None),
+    ],
+)
+def test_peek_process(packet, expected_process):
+    process = router_log_preprocessor.util.rfc3164_parser.peek_process(packet)
+
+    assert process == expected_process
+
+
+@pytest.mark.parametrize(
+    "packet,expected_hostname",
+    [
+        (_MSG1.encode("ascii"), "GT-AX11000-ABCD-1234567-E"),
+        (b"<8>Apr 17 16:50:10 host Samba Server[1]: smb", "host"),
+        (b"<8>Apr 17 16:50:10 host: smb daemon is stopped", None),
+        (b"Hello world", None),
+    ],
+)
+def test_peek_hostname(packet, expected_hostname):
+    hostname = router_log_preprocessor.util.rfc3164_parser.peek_hostname(packet)
+
+    assert hostname == expected_hostname
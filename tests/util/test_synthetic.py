@@ -0,0 +1,60 @@
+#  Copyright (c) 2023. Martin Storgaard Dieu <martin@storgaarddieu.com>
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import collections
+import datetime
+
+import router_log_preprocessor.preprocessors.dnsmasq_dhcp as dnsmasq_dhcp
+import router_log_preprocessor.preprocessors.wlc as wlc
+import router_log_preprocessor.util.rfc3164_parser as rfc3164_parser
+import router_log_preprocessor.util.synthetic as synthetic
+
+
+def test_corpus_is_preprocessed():
+    corpus = synthetic.RouterFleet(routers=3, clients=20, seed=1).corpus(1000)
+
+    processes = collections.Counter()
+    hostnames = set()
+    for packet in corpus:
+        record = rfc3164_parser.parse_bytes(packet)
+        assert record == rfc3164_parser.parse(packet.decode("ascii"))
+        processes[record.process] += 1
+        hostnames.add(record.hostname)
+        if record.process == "wlceventd":
+            wlc.preprocess_wireless_lan_controller_event(record)
+        elif record.process == "dnsmasq-dhcp":
+            assert dnsmasq_dhcp.preprocess_dnsmasq_dhcp_event(record) is not None
+
+    assert len(hostnames) == 3
+    assert processes["wlceventd"] > 0
+    assert processes["dnsmasq-dhcp"] > 0
+    assert set(processes) - {"wlceventd", "dnsmasq-dhcp"}
+
+
+def test_corpus_is_reproducible():
+    def now():
+        return datetime.datetime(2023, 2, 2, 13, 2, 51)
+
+    assert synthetic.RouterFleet(seed=7).corpus(100, now) == synthetic.RouterFleet(
+        seed=7
+    ).corpus(100, now)
+
+
+def test_datagrams_without_noise():
+    fleet = synthetic.RouterFleet(noise_processes=(), seed=1)
+    datagrams = fleet.datagrams(now=lambda: datetime.datetime(2023, 2, 2, 13, 2, 51))
+
+    for _ in range(100):
+        packet = next(datagrams)
+        assert packet.startswith(b"<30>Feb  2 13:02:51 RT-AX88U-0000-")
+        assert rfc3164_parser.peek_process(packet) in (b"wlceventd", b"dnsmasq-dhcp")